@@ -11,12 +11,13 @@ from langgraph.prebuilt import ToolNode, tools_condition
 from langgraph.checkpoint.memory import MemorySaver
 import sqlite3
 from langgraph.checkpoint.sqlite import SqliteSaver
+from utils.checkpointing import CachedCheckpointSaver, IndexedCheckpointSaver
 # In memory checkpointing for simplicity
 memory = MemorySaver()
 
 db_path = "memory.db"
 conn = sqlite3.connect(db_path, check_same_thread=False)
-sql_memory = SqliteSaver(conn)
+sql_memory = CachedCheckpointSaver(IndexedCheckpointSaver(SqliteSaver(conn)))
 
 class LangGraphAgent:
     def __init__(self):
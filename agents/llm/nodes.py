@@ -1,8 +1,6 @@
 import random
 
-import requests
 from agents.llm.state import State
-from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
 from langchain_community.utilities import GoogleSerperAPIWrapper
 from langchain_core.tools import Tool
@@ -10,15 +8,22 @@ import os
 from langchain_community.agent_toolkits import FileManagementToolkit
 from fpdf import FPDF
 from langchain_core.messages import AIMessage
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.platypus import SimpleDocTemplate, Paragraph
+from utils.deadline import DeadlineExceeded, check_deadline
+from utils.document_index import indexing_file_tool
+from utils.model_router import ModelRouter
+from utils.notifications import enqueue_notification
+from utils.pdf_renderer import save_file_pdf_tool
+from utils.artifacts import QuotaExceeded, publish_sandbox_file
+from utils.sandbox_files import grep_files_tool, read_file_tool
 
 
 load_dotenv()
 
-llm = ChatOpenAI(model="gpt-4o-mini")
+model_router = ModelRouter.from_env()
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+FILE_TOOLKIT_TOOLS = ["copy_file", "file_delete", "file_search", "move_file", "write_file", "list_directory"]
 
 # ===============================
 # Tool definitions
@@ -27,9 +32,12 @@ llm = ChatOpenAI(model="gpt-4o-mini")
 def safe_tool(func):
     """Wrapper to ensure tool functions always return a string, even on errors."""
     def wrapper(*args, **kwargs):
+        check_deadline()
         try:
             result = func(*args, **kwargs)
             return str(result) if result is not None else "Tool executed successfully."
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             return f"Tool error: {str(e)}"
     return wrapper
@@ -43,21 +51,12 @@ tool_search = Tool(
 )
 
 # tool: push notification
-pushover_token = os.getenv("PUSHOVER_TOKEN")
 pushover_user = os.getenv("PUSHOVER_USER")
-pushover_url = "https://api.pushover.net/1/messages.json"
 def push(text: str):
-    """Send a push notification to the user"""
-    try:
-        response = requests.post(
-            pushover_url,
-            data={"token": pushover_token, "user": pushover_user, "message": text},
-            timeout=10
-        )
-        response.raise_for_status()
-        return "Push notification sent successfully."
-    except requests.RequestException as e:
-        return f"Failed to send push notification: {str(e)}"
+    """Queue a push notification to the user; the outbox dispatcher delivers it"""
+    if not os.getenv("PUSHOVER_TOKEN") or not pushover_user:
+        return "Error: PUSHOVER_TOKEN or PUSHOVER_USER not set."
+    return enqueue_notification("pushover", pushover_user, text)
     
 tool_push = Tool(
     name="send_push_notification",
@@ -66,75 +65,34 @@ tool_push = Tool(
 )
 
 def get_file_tools():
-    toolkit = FileManagementToolkit(root_dir="sandbox")
-    tools = toolkit.get_tools()
+    # read_file is replaced by a ranged, memory-mapped reader that doesn't load whole files
+    toolkit = FileManagementToolkit(root_dir="sandbox", selected_tools=FILE_TOOLKIT_TOOLS)
+    tools = [indexing_file_tool(tool) for tool in toolkit.get_tools()]
     # Wrap each tool function to be safe
     for tool in tools:
         tool = safe_tool(tool)
-    return tools
+    return tools + [read_file_tool(), grep_files_tool()]
 
 # Custom tool : Get the file link
 def get_file_link(file_name: str) -> str:
-    """Generate a public link for a file in the sandbox directory"""
-    # Get root address from environment or default
-    base_url = os.getenv("BASE_URL", "http://localhost:8000/public/")
-    file_path = os.path.join("sandbox", file_name)
-    if os.path.exists(file_path):
-        return base_url + file_name
-    else:
+    """Publish a file from the sandbox directory and return its public link"""
+    try:
+        return publish_sandbox_file(file_name)
+    except QuotaExceeded as e:
+        return f"Could not publish the file: {e}"
+    except ValueError:
         return "File not found."
     
 file_link_tool = Tool(name="get_file_link", func=safe_tool(get_file_link), description="Use this tool to get a public link for a file")
 
-# Custom tool : save file in pdf
-def save_file_pdf(file_name: str, content: str) -> str:
-    """
-    Save the provided content as a PDF file in the sandbox directory using ReportLab.
-
-    Args:
-        file_name (str): The name of the PDF file to be created (e.g., 'output.pdf').
-        content (str): The text content to be written into the PDF file.
-
-    Returns:
-        str: A message indicating the result, including the file path if successful.
-    """
-    if not file_name or not isinstance(file_name, str):
-        return "Error: file_name (str) is required to save as PDF. Please provide a valid file name (e.g., 'output.pdf')."
-    if not content or not isinstance(content, str):
-        return "Error: content (str) is required to save as PDF. Please provide the content to save."
-
-    try:
-        file_path = os.path.join("sandbox", file_name)
-        c = canvas.Canvas(file_path, pagesize=letter)
-        width, height = letter
-        
-        # Split content into lines and draw each line
-        lines = content.split('\n')
-        y_position = height - 100
-        line_height = 15
-        max_lines = 50  # Limit to prevent overflow
-        max_line_length = 80  # Limit line length
-        
-        for line in lines[:max_lines]:
-            if y_position < 50:  # Prevent drawing off the page
-                break
-            truncated_line = line[:max_line_length]
-            c.drawString(100, y_position, truncated_line)
-            y_position -= line_height
-        
-        c.save()
-        return f"File saved as {file_path}"
-    except Exception as e:
-        return f"Error saving PDF: {str(e)}"
-    
-save_pdf_tool = Tool(name="save_file_pdf", func=safe_tool(save_file_pdf), description="Use this tool to save content as a PDF file")
+# Custom tool : save file in pdf (multi-page, rendered in a worker process)
+save_pdf_tool = save_file_pdf_tool()
 
 # =============================
-# Bind tools to LLM
+# Tools bound to every model tier
 # =============================
 
 tools = get_file_tools() + [tool_search, tool_push, file_link_tool, save_pdf_tool]
-llm_with_tools = llm.bind_tools(tools)
 
 # ==============================
 # Node definitions
@@ -150,15 +108,24 @@ def chatbot_node(state: State) -> State:
     Returns:
         Updated state with AI response message
     """
+    check_deadline()
     try:
-        # Invoke the LLM with the current messages
-        response = llm_with_tools.invoke(state["messages"])
+        # Invoke the LLM with the current messages, bounded by the request deadline
+        response = model_router.invoke(
+            "llm.chatbot",
+            state["messages"],
+            prepare=lambda model: model.bind_tools(tools),
+            cache_key="tools",
+            timeout=LLM_TIMEOUT,
+        )
         
         # Create new state with the AI response
         new_state = State(messages=state["messages"] + [response])
         
         return new_state
         
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         # Create an error message as an AIMessage object
         error_message = AIMessage(content=f"I encountered an error processing your request: {str(e)}")
@@ -3,21 +3,27 @@ from typing_extensions import TypedDict
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
 from dotenv import load_dotenv
-from langgraph.prebuilt import ToolNode
-from langchain_openai import ChatOpenAI
 from langgraph.checkpoint.memory import MemorySaver
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from typing import List, Any, Optional, Dict
 from pydantic import BaseModel, Field
-from agents.sidekick.tools import other_tools
-from agents.sidekick.nodes import worker, worker_router, evaluator, route_based_on_evaluation
+from agents.sidekick.tools import build_tool_registry
+from agents.sidekick.nodes import worker, worker_router, evaluator, route_based_on_evaluation, route_documents, process_document
+import asyncio
+import os
 import aiosqlite
 import functools
 from datetime import datetime
 from agents.sidekick.state import State
 from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from utils.checkpointing import CachedCheckpointSaver, IndexedCheckpointSaver
+from utils.model_router import ModelRouter
 load_dotenv(override=True)
 
+DEFAULT_SUCCESS_CRITERIA = "The answer should be clear and accurate"
+# Uploaded documents extracted and summarised at the same time, per process
+SIDEKICK_DOCUMENT_CONCURRENCY = int(os.getenv("SIDEKICK_DOCUMENT_CONCURRENCY", "4"))
+
 class EvaluatorOutput(BaseModel):
     feedback: str = Field(description="Feedback on the assistant's response")
     success_criteria_met: bool = Field(description="Whether the success criteria have been met")
@@ -27,12 +33,12 @@ class EvaluatorOutput(BaseModel):
     
 class Sidekick:
     def __init__(self):
-        self.worker_llm_with_tools = None
-        self.evaluator_llm_with_output = None
-        self.tools = None
+        self.model_router = None
+        self.tool_registry = None
         self.llm_with_tools = None
         self.graph = None
         self.memory = None
+        self.document_semaphore = asyncio.Semaphore(SIDEKICK_DOCUMENT_CONCURRENCY)
 
     # --- Wrapper methods for tracing ---
     def worker_node(self, state):
@@ -41,6 +47,18 @@ class Sidekick:
     def evaluator_node(self, state):
         return evaluator(self, state)
 
+    async def tools_node(self, state, config):
+        # Only the tools the worker actually called get constructed
+        calls = state["messages"][-1].tool_calls
+        tool_node = self.tool_registry.tool_node(call["name"] for call in calls)
+        return await tool_node.ainvoke(state, config)
+
+    async def process_document_node(self, task):
+        return await process_document(self, task)
+
+    def route_documents_node(self, state):
+        return route_documents(self, state)
+
     def worker_router_node(self, state):
         return worker_router(self, state)
 
@@ -49,22 +67,24 @@ class Sidekick:
 
     async def setup(self):
         conn = await aiosqlite.connect("memory.db")
-        self.memory = AsyncSqliteSaver(conn)
-        self.tools = other_tools()
-        worker_llm = ChatOpenAI(model="gpt-4o-mini")
-        self.worker_llm_with_tools = worker_llm.bind_tools(self.tools)
-        evaluator_llm = ChatOpenAI(model="gpt-4o-mini")
-        self.evaluator_llm_with_output = evaluator_llm.with_structured_output(EvaluatorOutput)
+        self.memory = CachedCheckpointSaver(IndexedCheckpointSaver(AsyncSqliteSaver(conn)))
+        self.tool_registry = build_tool_registry()
+        self.model_router = ModelRouter.from_env()
         await self.build_graph()
 
+    @staticmethod
+    def structured_evaluator(model):
+        return model.with_structured_output(EvaluatorOutput, include_raw=True)
+
     async def build_graph(self):
         # Set up Graph Builder with State
         graph_builder = StateGraph(State)
 
         # Add nodes
         graph_builder.add_node("worker", self.worker_node)
-        graph_builder.add_node("tools", ToolNode(tools=self.tools or []))
+        graph_builder.add_node("tools", self.tools_node)
         graph_builder.add_node("evaluator", self.evaluator_node)
+        graph_builder.add_node("process_document", self.process_document_node)
 
         # Add edges
         graph_builder.add_conditional_edges(
@@ -74,11 +94,35 @@ class Sidekick:
         graph_builder.add_conditional_edges(
             "evaluator", self.route_based_on_evaluation_node, {"worker": "worker", "END": END}
         )
-        graph_builder.add_edge(START, "worker")
+        # Uploaded documents are processed in parallel branches, then the worker starts
+        graph_builder.add_conditional_edges(START, self.route_documents_node, ["process_document", "worker"])
+        graph_builder.add_edge("process_document", "worker")
 
         # Compile the graph
         self.graph = graph_builder.compile(checkpointer=self.memory)
 
+    @staticmethod
+    def initial_state(
+        message: str, success_criteria: Optional[str] = None, documents: Optional[List[str]] = None
+    ) -> State:
+        """
+        Build the input state for one user turn.
+
+        Summaries of earlier uploads stay in context until the next upload replaces them.
+        """
+        state = State(
+            messages=[HumanMessage(content=message)],
+            success_criteria=success_criteria or DEFAULT_SUCCESS_CRITERIA,
+            feedback_on_work=None,
+            success_criteria_met=False,
+            user_input_needed=False,
+            worker_tier=0,
+            documents=documents or [],
+        )
+        if documents:
+            state["document_summaries"] = None  # reset
+        return state
+
     async def run_superstep(self, message, success_criteria, history, thread_id: str):
         config = {"configurable": {"thread_id": thread_id}}
 
@@ -87,10 +131,12 @@ class Sidekick:
 
         state = State(
             messages=message,
-            success_criteria=success_criteria or "The answer should be clear and accurate",
+            success_criteria=success_criteria or DEFAULT_SUCCESS_CRITERIA,
             feedback_on_work=None,
             success_criteria_met=False,
             user_input_needed=False,
+            worker_tier=0,
+            documents=[],
         )
         result = await self.graph.ainvoke(state, config=config) # type: ignore
         user = {"role": "user", "content": message}
@@ -0,0 +1,122 @@
+"""
+Prompt assembly for the Sidekick worker and evaluator.
+
+Providers cache prompts by prefix, so messages are laid out from most to
+least stable: the static instructions first (tool schemas are sent ahead of
+them by the API), then the conversation, then the fields that change from
+call to call - date, success criteria and evaluator feedback - last. Nothing
+volatile is interpolated into the instructions. Summaries of documents
+uploaded with the current message sit between the conversation and the
+volatile fields.
+"""
+from datetime import datetime
+from typing import Any, Dict, List
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+WORKER_INSTRUCTIONS = """You are a helpful assistant that can use tools to complete tasks.
+You keep working on a task until either you have a question or clarification for the user, or the success criteria is met.
+You have many tools to help you, including tools to browse the internet, navigating and retrieving web pages.
+You have a tool to run python code, but note that you would need to include a print() statement if you wanted to receive output.
+
+You should reply either with a question for the user about this assignment, or with your final response.
+If you have a question for the user, you need to reply by clearly stating your question. An example might be:
+
+Question: please clarify whether you want a summary or a detailed answer
+
+If you've finished, reply with the final answer, and don't ask a question; simply reply with the answer.
+The current date, the success criteria and any feedback on a previous attempt are given after the conversation.
+"""
+
+EVALUATOR_INSTRUCTIONS = """You are an evaluator that determines if a task has been completed successfully by an Assistant.
+Assess the Assistant's last response based on the given criteria. Respond with your feedback, and with your decision on whether the success criteria has been met,
+and whether more input is needed from the user.
+
+You are evaluating a conversation between the User and Assistant. You decide what action to take based on the last response from the Assistant.
+You will be given the entire conversation with the assistant, with the user's original request and all replies, followed by the success criteria
+for this assignment and the final response from the Assistant that you are evaluating.
+
+Respond with your feedback, and decide if the success criteria is met by this response.
+Also, decide if more user input is required, either because the assistant has a question, needs clarification, or seems to be stuck and unable to answer without help.
+
+The Assistant has access to a tool to write files. If the Assistant says they have written a file, then you can assume they have done so.
+Overall you should give the Assistant the benefit of the doubt if they say they've done something. But you should reject if you feel that more work should go into this.
+If you're seeing the Assistant repeating the same mistakes as in your prior feedback, then consider responding that user input is required.
+"""
+
+
+DOCUMENT_SUMMARY_INSTRUCTIONS = """You summarise a document for an assistant that will use it to complete a user's task.
+Write a faithful summary of the document: its purpose, the key facts, figures, names and dates, and any conclusions.
+Keep the document's own terminology. Do not add information that is not in the document.
+"""
+
+
+def current_date() -> str:
+    # Day resolution, so the context stays identical across a run's calls
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def worker_messages(state: Any) -> List[BaseMessage]:
+    """Static instructions, the conversation, then this call's volatile context."""
+    history = [message for message in state["messages"] if not isinstance(message, SystemMessage)]
+    context = f"""The current date is {current_date()}.
+
+This is the success criteria:
+{state["success_criteria"]}"""
+    if state.get("feedback_on_work"):
+        context += f"""
+
+Previously you thought you completed the assignment, but your reply was rejected because the success criteria was not met.
+Here is the feedback on why this was rejected:
+{state["feedback_on_work"]}
+With this feedback, please continue the assignment, ensuring that you meet the success criteria or have a question for the user."""
+    messages = [SystemMessage(content=WORKER_INSTRUCTIONS), *history]
+    if state.get("document_summaries"):
+        messages.append(SystemMessage(content=format_document_summaries(state["document_summaries"])))
+    messages.append(SystemMessage(content=context))
+    return messages
+
+
+def format_document_summaries(summaries: List[Dict[str, Any]]) -> str:
+    text = "Summaries of the documents uploaded with the request (search_documents finds passages in the full text):\n"
+    for item in summaries:
+        if item.get("error"):
+            text += f"\n## {item['path']}\nCould not be processed: {item['error']}\n"
+        else:
+            text += f"\n## {item['path']}\n{item['summary']}\n"
+    return text
+
+
+def document_summary_messages(path: str, text: str) -> List[BaseMessage]:
+    return [
+        SystemMessage(content=DOCUMENT_SUMMARY_INSTRUCTIONS),
+        HumanMessage(content=f"Document: {path}\n\n{text}"),
+    ]
+
+
+def format_conversation(messages: List[Any]) -> str:
+    conversation = "Conversation history:\n\n"
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            conversation += f"User: {message.content}\n"
+        elif isinstance(message, AIMessage):
+            text = message.content or "[Tools use]"
+            conversation += f"Assistant: {text}\n"
+    return conversation
+
+
+def evaluator_messages(state: Any) -> List[BaseMessage]:
+    """Static instructions, the transcript (which only grows), then criteria, response and prior feedback."""
+    context = f"""The success criteria for this assignment is:
+{state["success_criteria"]}
+
+And the final response from the Assistant that you are evaluating is:
+{state["messages"][-1].content}
+"""
+    if state.get("feedback_on_work"):
+        context += f"\nAlso, note that in a prior attempt from the Assistant, you provided this feedback: {state['feedback_on_work']}\n"
+    return [
+        SystemMessage(content=EVALUATOR_INSTRUCTIONS),
+        HumanMessage(content=format_conversation(state["messages"])),
+        HumanMessage(content=context),
+    ]
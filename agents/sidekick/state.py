@@ -1,10 +1,24 @@
-from typing import Annotated, List, Any, Optional
+from typing import Annotated, Dict, List, Any, Optional
 from typing_extensions import TypedDict
 from langgraph.graph.message import add_messages
 
+
+def merge_document_summaries(
+    current: Optional[List[Dict[str, Any]]], update: Optional[List[Dict[str, Any]]]
+) -> List[Dict[str, Any]]:
+    """Collect per-file results from the parallel document branches; None resets the list."""
+    if update is None:
+        return []
+    return (current or []) + update
+
+
 class State(TypedDict):
     messages: Annotated[List[Any], add_messages]
     success_criteria: str
     feedback_on_work: Optional[str]
     success_criteria_met: bool
-    user_input_needed: bool
\ No newline at end of file
+    user_input_needed: bool
+    worker_tier: int
+    # Files uploaded with the current message, summarised before the worker runs
+    documents: List[str]
+    document_summaries: Annotated[List[Dict[str, Any]], merge_document_summaries]
@@ -0,0 +1,154 @@
+"""
+Tool registry for the Sidekick worker.
+
+Tools are registered with a factory and the categories they serve, and are
+only constructed the first time a turn needs them. For each worker call a
+keyword selector picks the categories that match the current turn, and only
+those tools are bound to the LLM, so the request carries a handful of tool
+schemas instead of all of them.
+"""
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.tools import BaseTool
+from langgraph.prebuilt import ToolNode
+
+logger = logging.getLogger(__name__)
+
+# Set to false to bind every registered tool on every call
+SIDEKICK_TOOL_SELECTION = os.getenv("SIDEKICK_TOOL_SELECTION", "true").lower() in ("1", "true", "yes")
+
+# Tools bound on every turn, whatever the selector finds
+CORE_TOOLS = ("search", "read_file", "write_file", "list_directory")
+
+CATEGORY_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "files": ("file", "files", "folder", "directory", "save", "write", "read", "copy", "move", "delete",
+              "rename", "txt", "csv", "md", "json", "sandbox", "document", "documents", "link", "log", "logs",
+              "grep"),
+    "pdf": ("pdf", "pdfs", "report"),
+    "ocr": ("ocr", "scan", "scanned", "image", "photo", "picture", "png", "jpg", "jpeg", "extract",
+            "uploaded", "receipt", "invoice"),
+    "web": ("search", "google", "web", "online", "internet", "news", "latest", "current", "today",
+            "price", "weather", "website", "url"),
+    "knowledge": ("wikipedia", "wiki", "history", "historical", "biography", "born", "founded", "capital"),
+    "math": ("calculate", "calculation", "compute", "math", "solve", "equation", "integral", "derivative",
+             "convert", "conversion", "formula", "wolfram", "percent", "percentage", "sqrt"),
+    "messaging": ("notify", "notification", "push", "alert", "remind", "reminder", "telegram", "whatsapp",
+                  "sms", "phone"),
+}
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_ARITHMETIC_RE = re.compile(r"\d\s*[-+*/^%]\s*\d")
+
+
+@dataclass
+class ToolSpec:
+    name: str
+    categories: Tuple[str, ...]
+    factory: Callable[[], BaseTool]
+
+
+def categories_for_text(text: str) -> Set[str]:
+    """Categories whose keywords appear in the text."""
+    words = set(_WORD_RE.findall(text.lower()))
+    categories = {category for category, keywords in CATEGORY_KEYWORDS.items() if words.intersection(keywords)}
+    if _ARITHMETIC_RE.search(text):
+        categories.add("math")
+    return categories
+
+
+def _text_of(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return " ".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+
+
+class ToolRegistry:
+    def __init__(self, selection_enabled: bool = SIDEKICK_TOOL_SELECTION):
+        self.selection_enabled = selection_enabled
+        self._specs: Dict[str, ToolSpec] = {}
+        self._tools: Dict[str, BaseTool] = {}
+        self._bound: Dict[Tuple[int, Tuple[str, ...]], Any] = {}
+        self._tool_nodes: Dict[Tuple[str, ...], ToolNode] = {}
+        self._lock = threading.RLock()
+
+    def register(self, name: str, categories: Sequence[str], factory: Callable[[], BaseTool]) -> None:
+        self._specs[name] = ToolSpec(name=name, categories=tuple(categories), factory=factory)
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._specs)
+
+    def get(self, name: str) -> BaseTool:
+        """Return the named tool, constructing it on first use."""
+        with self._lock:
+            tool = self._tools.get(name)
+            if tool is None:
+                tool = self._specs[name].factory()
+                if tool.name != name:
+                    raise ValueError(f"Tool registered as '{name}' is named '{tool.name}'.")
+                self._tools[name] = tool
+            return tool
+
+    def tools(self, names: Optional[Iterable[str]] = None) -> List[BaseTool]:
+        """Construct and return the given tools (all when None), in registration order."""
+        return [self.get(name) for name in self._ordered(names)]
+
+    def _ordered(self, names: Optional[Iterable[str]]) -> Tuple[str, ...]:
+        if names is None:
+            return tuple(self._specs)
+        wanted = set(names)
+        return tuple(name for name in self._specs if name in wanted)
+
+    def select(self, messages: Sequence[BaseMessage], extra_text: str = "") -> List[str]:
+        """
+        Pick the tools to bind for the current turn.
+
+        The latest user message (plus any evaluator feedback) is matched against
+        the category keywords; tools the worker already called in this turn stay
+        bound so it can keep using them.
+        """
+        if not self.selection_enabled:
+            return self.names
+        turn: List[BaseMessage] = []
+        for message in reversed(messages):
+            turn.append(message)
+            if isinstance(message, HumanMessage):
+                break
+        text = " ".join(_text_of(m) for m in turn if isinstance(m, HumanMessage)) + " " + extra_text
+        categories = categories_for_text(text)
+        selected = set(CORE_TOOLS)
+        selected.update(name for name, spec in self._specs.items() if categories.intersection(spec.categories))
+        for message in turn:
+            if isinstance(message, AIMessage):
+                selected.update(call["name"] for call in message.tool_calls if call["name"] in self._specs)
+        names = list(self._ordered(selected))
+        logger.debug("Selected tools %s for categories %s", names, sorted(categories))
+        return names
+
+    def bind(self, llm: Any, names: Iterable[str]) -> Any:
+        """Bind the given tools to the LLM; bindings are cached per tool set."""
+        ordered = self._ordered(names)
+        key = (id(llm), ordered)
+        with self._lock:
+            bound = self._bound.get(key)
+            if bound is None:
+                bound = llm.bind_tools(self.tools(ordered))
+                self._bound[key] = bound
+            return bound
+
+    def tool_node(self, names: Iterable[str]) -> ToolNode:
+        """A ToolNode over the given tools; unknown names are left to ToolNode's error message."""
+        ordered = self._ordered(names)
+        with self._lock:
+            node = self._tool_nodes.get(ordered)
+            if node is None:
+                node = ToolNode(tools=self.tools(ordered))
+                self._tool_nodes[ordered] = node
+            return node
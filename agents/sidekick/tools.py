@@ -1,3 +1,4 @@
+import functools
 import json
 from typing import List, Optional
 # from playwright.async_api import async_playwright
@@ -10,12 +11,17 @@ from langchain_community.agent_toolkits import FileManagementToolkit
 from langchain_community.tools.wikipedia.tool import WikipediaQueryRun
 from langchain_community.utilities import GoogleSerperAPIWrapper
 from langchain_community.utilities.wikipedia import WikipediaAPIWrapper
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
 from pypdf import PdfReader
 import logging
 
-from twilio.rest import Client
+from utils.deadline import DeadlineExceeded, check_deadline, request_timeout
+from agents.sidekick.tool_registry import ToolRegistry
+from utils.document_index import TEXT_EXTENSIONS, document_index, indexing_file_tool
+from utils.notifications import enqueue_notification
+from utils.pdf_renderer import save_file_pdf_tool
+from utils.artifacts import QuotaExceeded, publish_sandbox_file
+from utils.sandbox_files import grep_files_tool, read_file_tool
+from utils.scheduler import current_user
 
 
 from langchain_core.tools import StructuredTool
@@ -24,99 +30,65 @@ from langchain_community.utilities.wolfram_alpha import WolframAlphaAPIWrapper
 
 load_dotenv(override=True)
 
-pushover_token = os.getenv("PUSHOVER_TOKEN")
 pushover_user = os.getenv("PUSHOVER_USER")
-pushover_url = "https://api.pushover.net/1/messages.json"
-serper = GoogleSerperAPIWrapper()
+TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID", "1206152577")
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", "120"))
+FILE_TOOLKIT_TOOLS = ["copy_file", "file_delete", "file_search", "move_file", "write_file", "list_directory"]
+# Longer OCR results are indexed and only their beginning is returned to the model
+OCR_TOOL_MAX_CHARS = int(os.getenv("OCR_TOOL_MAX_CHARS", "4000"))
 
 def safe_tool(func):
     """Wrapper to ensure tool functions always return a string, even on errors."""
     def wrapper(*args, **kwargs):
+        check_deadline()
         try:
             result = func(*args, **kwargs)
             return str(result) if result is not None else "Tool executed successfully."
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             return f"Tool error: {str(e)}"
     return wrapper
 
+def with_deadline_check(func):
+    """Check the request deadline before running a structured tool, keeping its signature for the schema."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        check_deadline()
+        return func(*args, **kwargs)
+    return wrapper
+
 # async def playwright_tools():
 #     playwright = await async_playwright().start()
 #     browser = await playwright.chromium.launch(headless=False)
 #     toolkit = PlayWrightBrowserToolkit.from_browser(async_browser=browser)
 #     return toolkit.get_tools(), browser, playwright
 
-def push(text: str):
-    """Send a push notification to the user"""
-    try:
-        response = requests.post(
-            pushover_url,
-            data={"token": pushover_token, "user": pushover_user, "message": text},
-            timeout=10
-        )
-        response.raise_for_status()
-        return "Push notification sent successfully."
-    except requests.RequestException as e:
-        return f"Failed to send push notification: {str(e)}"
+@functools.lru_cache(maxsize=None)
+def get_serper() -> GoogleSerperAPIWrapper:
+    """Serper client, created on the first search."""
+    return GoogleSerperAPIWrapper()
+
+def web_search(query: str) -> str:
+    """Run an online web search through Serper"""
+    return get_serper().run(query)
 
-def get_file_tools():
-    toolkit = FileManagementToolkit(root_dir="sandbox")
-    tools = toolkit.get_tools()
-    # Wrap each tool function to be safe
-    for tool in tools:
-        tool = safe_tool(tool)
-    return tools
+def push(text: str):
+    """Queue a push notification to the user; the outbox dispatcher delivers it"""
+    if not os.getenv("PUSHOVER_TOKEN") or not pushover_user:
+        return "Error: PUSHOVER_TOKEN or PUSHOVER_USER not set."
+    return enqueue_notification("pushover", pushover_user, text)
 
 # Custom tool : Get the file link
 def get_file_link(file_name: str) -> str:
-    """Generate a public link for a file in the sandbox directory"""
-    # Get root address from environment or default
-    base_url = os.getenv("BASE_URL", "http://localhost:8000/public/")
-    file_path = os.path.join("sandbox", file_name)
-    if os.path.exists(file_path):
-        return base_url + file_name
-    else:
+    """Publish a file from the sandbox directory and return its public link"""
+    try:
+        return publish_sandbox_file(file_name)
+    except QuotaExceeded as e:
+        return f"Could not publish the file: {e}"
+    except ValueError:
         return "File not found."
     
-# Custom tool : save file in pdf
-def save_file_pdf(file_name: str, content: str) -> str:
-    """
-    Save the provided content as a PDF file in the sandbox directory using ReportLab.
-
-    Args:
-        file_name (str): The name of the PDF file to be created (e.g., 'output.pdf').
-        content (str): The text content to be written into the PDF file.
-
-    Returns:
-        str: A message indicating the result, including the file path if successful.
-    """
-    if not file_name or not isinstance(file_name, str):
-        return "Error: file_name (str) is required to save as PDF. Please provide a valid file name (e.g., 'output.pdf')."
-    if not content or not isinstance(content, str):
-        return "Error: content (str) is required to save as PDF. Please provide the content to save."
-
-    try:
-        file_path = os.path.join("sandbox", file_name)
-        c = canvas.Canvas(file_path, pagesize=letter)
-        width, height = letter
-        
-        # Split content into lines and draw each line
-        lines = content.split('\n')
-        y_position = height - 100
-        line_height = 15
-        max_lines = 50  # Limit to prevent overflow
-        max_line_length = 80  # Limit line length
-        
-        for line in lines[:max_lines]:
-            if y_position < 50:  # Prevent drawing off the page
-                break
-            truncated_line = line[:max_line_length]
-            c.drawString(100, y_position, truncated_line)
-            y_position -= line_height
-        
-        c.save()
-        return f"File saved as {file_path}"
-    except Exception as e:
-        return f"Error saving PDF: {str(e)}"
 
 
 def extract_text_from_file(
@@ -165,7 +137,7 @@ def extract_text_from_file(
                 return "Error: OPENTYPHOON_API_KEY is not set in environment variables."
 
             headers = {'Authorization': f'Bearer {api_key}'}
-            response = requests.post(url, files=files, data=data, headers=headers)
+            response = requests.post(url, files=files, data=data, headers=headers, timeout=request_timeout(OCR_TIMEOUT))
 
             if response.status_code == 200:
                 try:
@@ -197,44 +169,87 @@ def extract_text_from_file(
                     return f"Error: {response.status_code} - {error_text}"
                 except Exception:
                     return f"Error: {response.status_code} - Non-text error response."
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         return f"Error during OCR extraction: {str(e)}"
         
+def extract_document_text(file_path: str) -> str:
+    """
+    Text of an uploaded document: read directly for text files, from the PDF's
+    text layer when it has one, and through OCR for scans and images.
+    Raises ValueError when nothing can be extracted.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in TEXT_EXTENSIONS:
+        with open(file_path, encoding="utf-8", errors="replace") as f:
+            return f.read()
+    if extension == ".pdf":
+        reader = PdfReader(file_path)
+        text = "\n".join(page.extract_text() or "" for page in reader.pages)
+        # Scanned PDFs have little or no text layer
+        if len(text.strip()) >= 20 * max(1, len(reader.pages)):
+            return text
+    text = extract_text_from_file(file_path)
+    if text.startswith("Error") or not text.strip():
+        raise ValueError(text or "No text could be extracted.")
+    document_index.index_text(file_path, text)
+    return text
+
+def extract_text_tool(file_path: str) -> str:
+    """OCR a file for the model: the text is indexed, and long results are cut to an excerpt."""
+    text = extract_text_from_file(file_path)
+    if text.startswith("Error") or not text.strip():
+        return text
+    document_index.index_text(file_path, text)
+    if len(text) <= OCR_TOOL_MAX_CHARS:
+        return text
+    return (
+        text[:OCR_TOOL_MAX_CHARS]
+        + f"\n\n[... {len(text) - OCR_TOOL_MAX_CHARS} more characters. The full text is indexed; "
+        "use search_documents to find the passages you need.]"
+    )
+
+def search_documents(query: str, file_name: Optional[str] = None, k: int = 5) -> str:
+    """
+    Search the documents in the sandbox and return the most relevant passages.
+
+    Args:
+        query (str): What to look for, in keywords or a short question.
+        file_name (str, optional): Only search this file (e.g. 'report.pdf').
+        k (int): Number of passages to return (default 5, at most 20).
+
+    Returns:
+        str: The best-matching passages with their file names.
+    """
+    results = document_index.search(query, k=max(1, min(k, 20)), path=file_name, username=current_user())
+    if not results:
+        return "No matching passages found."
+    return "\n\n".join(
+        f"[{chunk.path} #{chunk.ordinal + 1}, score {score:.2f}]\n{chunk.text}" for score, chunk in results
+    )
+
 def send_telegram_message( text: str) -> str:
     """
     Send a message to a Telegram user or group.
+    The message is queued and delivered in the background.
     Args:
         text (str): The message to send.
     Returns:
-        str: Result message.
+        str: Result message with the id of the queued message.
     """
-
-    
-    TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-    TELEGRAM_API_URL = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    
-    if not TELEGRAM_BOT_TOKEN:
+    if not os.getenv("TELEGRAM_BOT_TOKEN"):
         return "Error: TELEGRAM_BOT_TOKEN not set."
-    payload = {"chat_id": 1206152577, "text": text}
-    try:
-        resp = requests.post(TELEGRAM_API_URL, data=payload, timeout=10)
-        if resp.status_code == 200:
-            return "Message sent to Telegram."
-        else:
-            return f"Failed to send: {resp.text}"
-    except Exception as e:
-        return f"Telegram send error: {str(e)}"
+    return enqueue_notification("telegram", TELEGRAM_CHAT_ID, text)
     
 def send_whatapp_message(to_number: str, message: str, message_type: str = "sms") -> str:
     """
     Send SMS or WhatsApp message using Twilio API.
+    The message is queued and delivered in the background.
     to_number: Recipient's number in format +91xxxxxxxxxx
     message: The message to send
     message_type: "sms" for SMS or "whatsapp" for WhatsApp (default: "sms")
     """
-    import os
-    
-
     account_sid = os.getenv("TWILIO_ACCOUNT_SID")
     auth_token = os.getenv("TWILIO_AUTH_TOKEN")
     from_number = os.getenv("TWILIO_PHONE_NUMBER")
@@ -242,60 +257,73 @@ def send_whatapp_message(to_number: str, message: str, message_type: str = "sms"
 
     if not all([account_sid, auth_token, from_number, sms_number]):
         return "❌ Twilio credentials not found in environment variables."
-    
-    client = Client(account_sid, auth_token)
-    
-    try:
-        if message_type.lower() == "whatsapp":
-            message_obj = client.messages.create(
-                body=message,
-                to="whatsapp:" + to_number,
-                from_="whatsapp:" + str(from_number),
-            )
-        else:  # SMS
-            message_obj = client.messages.create(
-                body=message,
-                to=to_number,
-                from_=str(sms_number),
-            )
-        return f"✅ {message_type.upper()} sent! SID: {message_obj.sid}"
-    except Exception as e:
-        return f"❌ Failed to send {message_type}: {str(e)}"
-    
-def other_tools():
-    push_tool = Tool(name="send_push_notification", func=safe_tool(push), description="Use this tool when you want to send a push notification")
-    file_tools = get_file_tools()
-    file_link_tool = Tool(name="get_file_link", func=safe_tool(get_file_link), description="Use this tool to get a public link for a file")
-    save_pdf_tool = Tool(name="save_file_pdf", func=safe_tool(save_file_pdf), description="Use this tool to save content as a PDF file")
 
-    tool_search = Tool(
-        name="search",
-        func=safe_tool(serper.run),
-        description="Use this tool when you want to get the results of an online web search"
-    )
-    ocr_tool = Tool(
-        name="extract_text_from_file",
-        func=safe_tool(extract_text_from_file),  # Wrap with safe_tool for error handling
-        description="Extract text from a PDF or image file using OCR. Provide the file path in the sandbox directory (e.g., 'uploaded.pdf')."
-    )
+    channel = "whatsapp" if message_type.lower() == "whatsapp" else "sms"
+    return enqueue_notification(channel, to_number, message)
     
-    telegram_tool = StructuredTool.from_function(
-    name="send_telegram_message",
-    func=send_telegram_message,
-    description="Send a message to a Telegram bot."
-    )
-    whatsapp_tool = StructuredTool.from_function(
-    func=send_whatapp_message,
-    name="send_whatapp_message",
-    description="Send SMS or WhatsApp message using Twilio. Requires to_number (recipient), message (text), and optional message_type ('sms' or 'whatsapp')."
-)
+def file_tool_factory(name: str):
+    """Factory for one FileManagementToolkit tool."""
+    def factory():
+        toolkit = FileManagementToolkit(root_dir="sandbox", selected_tools=[name])
+        return indexing_file_tool(toolkit.get_tools()[0])
+    return factory
 
+def wikipedia_tool():
     wikipedia = WikipediaAPIWrapper(wiki_client=None)
-    wiki_tool = WikipediaQueryRun(api_wrapper=wikipedia)
-    
+    return WikipediaQueryRun(api_wrapper=wikipedia)
+
+def wolfram_tool():
     wolfram_api_id = os.getenv("WOLFRAMA_APP_ID")
     wolfram_wrapper = WolframAlphaAPIWrapper(wolfram_alpha_appid=wolfram_api_id)
-    wolfram_tool = WolframAlphaQueryRun(api_wrapper=wolfram_wrapper)
+    return WolframAlphaQueryRun(api_wrapper=wolfram_wrapper)
+
+def build_tool_registry() -> ToolRegistry:
+    """Register every Sidekick tool; each is constructed the first time a turn selects it."""
+    registry = ToolRegistry()
 
+    for name in FILE_TOOLKIT_TOOLS:
+        registry.register(name, ["files"], file_tool_factory(name))
+    registry.register("read_file", ["files"], read_file_tool)
+    registry.register("grep_files", ["files"], grep_files_tool)
 
-    return file_tools + [push_tool, tool_search, wiki_tool, file_link_tool, save_pdf_tool, ocr_tool, telegram_tool, whatsapp_tool, wolfram_tool]
\ No newline at end of file
+    registry.register("send_push_notification", ["messaging"], lambda: Tool(
+        name="send_push_notification", func=safe_tool(push),
+        description="Use this tool when you want to send a push notification"
+    ))
+    registry.register("search", ["web"], lambda: Tool(
+        name="search",
+        func=safe_tool(web_search),
+        description="Use this tool when you want to get the results of an online web search"
+    ))
+    registry.register("wikipedia", ["knowledge"], wikipedia_tool)
+    registry.register("get_file_link", ["files", "pdf"], lambda: Tool(
+        name="get_file_link", func=safe_tool(get_file_link),
+        description="Use this tool to get a public link for a file"
+    ))
+    registry.register("save_file_pdf", ["pdf"], save_file_pdf_tool)
+    registry.register("extract_text_from_file", ["ocr", "pdf"], lambda: Tool(
+        name="extract_text_from_file",
+        func=safe_tool(extract_text_tool),  # Wrap with safe_tool for error handling
+        description="Extract text from a PDF or image file using OCR. Provide the file path in the sandbox directory (e.g., 'uploaded.pdf'). Long results are truncated; use search_documents for the rest."
+    ))
+    registry.register("search_documents", ["files", "pdf", "ocr"], lambda: StructuredTool.from_function(
+        func=with_deadline_check(search_documents),
+        name="search_documents",
+        description="Search the sandbox documents (text files, PDFs and OCR'd files) and return only the most relevant passages. Prefer this over reading whole files."
+    ))
+    registry.register("send_telegram_message", ["messaging"], lambda: StructuredTool.from_function(
+        name="send_telegram_message",
+        func=with_deadline_check(send_telegram_message),
+        description="Send a message to a Telegram bot."
+    ))
+    registry.register("send_whatapp_message", ["messaging"], lambda: StructuredTool.from_function(
+        func=with_deadline_check(send_whatapp_message),
+        name="send_whatapp_message",
+        description="Send SMS or WhatsApp message using Twilio. Requires to_number (recipient), message (text), and optional message_type ('sms' or 'whatsapp')."
+    ))
+    registry.register("wolfram_alpha", ["math"], wolfram_tool)
+    return registry
+
+def other_tools():
+    """Every Sidekick tool, constructed eagerly."""
+    return build_tool_registry().tools()
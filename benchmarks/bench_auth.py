@@ -0,0 +1,81 @@
+"""
+Login throughput and session-verification overhead.
+
+`login` runs against a live server (it creates its own users and removes them
+afterwards); `verify` is an in-process micro-benchmark of the check every
+`/agent/*` request now pays, cold (first sight of a token) vs cached.
+
+    uv run python benchmarks/bench_auth.py login --base-url http://localhost:8000 -n 500 -c 50
+    uv run python benchmarks/bench_auth.py verify -n 100000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+async def bench_login(base_url: str, total: int, concurrency: int):
+    import httpx
+
+    run_id = uuid.uuid4().hex[:8]
+    users = [f"auth_{run_id}_{i}" for i in range(min(total, 50))]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        for username in users:
+            await client.post("/users/", json={"full_name": "Bench", "username": username, "password": "secret"})
+
+        async def one(i):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/users/login", json={"username": users[i % len(users)], "password": "secret"})
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - start
+
+        for username in users:
+            await client.delete(f"/users/{username}")
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"login  {total} reqs  {total / elapsed:8.1f} req/s  p50={p50:.1f}ms  p99={p99:.1f}ms")
+
+
+def bench_verify(total: int):
+    from utils.security import issue_session_token, verify_session_token
+
+    tokens = [issue_session_token(f"user{i}") for i in range(total)]
+    start = time.perf_counter()
+    for token in tokens:
+        verify_session_token(token)
+    cold = (time.perf_counter() - start) / total
+
+    token = tokens[-1]
+    start = time.perf_counter()
+    for _ in range(total):
+        verify_session_token(token)
+    cached = (time.perf_counter() - start) / total
+    print(f"verify cold={cold * 1e6:.2f}us  cached={cached * 1e6:.2f}us  per /agent/* request")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=["login", "verify"])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("-n", "--requests", type=int, default=500)
+    parser.add_argument("-c", "--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.mode == "login":
+        asyncio.run(bench_login(args.base_url, args.requests, args.concurrency))
+    else:
+        bench_verify(args.requests)
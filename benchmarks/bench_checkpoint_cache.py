@@ -0,0 +1,72 @@
+"""
+Latency of loading a thread's latest checkpoint: SQLite read vs cache hit.
+
+Saves one checkpoint holding a --messages message history through the same
+saver stack the agents use (CachedCheckpointSaver over SqliteSaver), then
+times get_tuple on the bare SqliteSaver (query plus deserialization) and on
+the cached saver, where every lookup after the first is a hit.
+
+    uv run python benchmarks/bench_checkpoint_cache.py --messages 500
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from utils.checkpointing import CachedCheckpointSaver, CheckpointCache
+
+
+def build_thread(count: int):
+    messages = []
+    for i in range(count):
+        if i % 2 == 0:
+            messages.append(HumanMessage(content=f"Question {i}: summarise the attached report section {i}.", id=f"h{i}"))
+        else:
+            messages.append(AIMessage(
+                content="Here is the summary. " + "Lorem ipsum dolor sit amet. " * 20,
+                id=f"a{i}",
+                response_metadata={"model_name": "gpt-4o-mini-2024-07-18", "finish_reason": "stop"},
+                usage_metadata={"input_tokens": 2400, "output_tokens": 180, "total_tokens": 2580},
+            ))
+    return messages
+
+
+def timed(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    sqlite = SqliteSaver(sqlite3.connect(":memory:", check_same_thread=False))
+    sqlite.setup()
+    cached = CachedCheckpointSaver(sqlite, cache=CheckpointCache(max_threads=10))
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {"messages": build_thread(args.messages)}
+    checkpoint["channel_versions"] = {"messages": 1}
+    config = {"configurable": {"thread_id": "bench", "checkpoint_ns": ""}}
+    cached.put(config, checkpoint, {}, {"messages": 1})
+
+    read_time = timed(lambda: sqlite.get_tuple(config), args.repeat)
+    hit_time = timed(lambda: cached.get_tuple(config), args.repeat)
+
+    print(f"{args.messages} messages")
+    print(f"sqlite read  {read_time * 1000:9.3f} ms")
+    print(f"cache hit    {hit_time * 1000:9.3f} ms   ({read_time / hit_time:,.0f}x faster, hit rate {cached.cache.stats()['hit_rate']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Context size and latency of document search versus passing whole files.
+
+Builds a sandbox of synthetic documents (or indexes --root), then for a set of
+queries compares the characters the model would receive from reading the full
+file with the top-k passages from search_documents. Also reports indexing
+time, incremental re-index time after one file changes, and query latency.
+
+    uv run python benchmarks/bench_document_search.py --documents 50 --pages 40
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.document_index import DocumentIndex
+
+VOCABULARY = (
+    "revenue quarter growth margin customer contract delivery schedule invoice payment supplier audit "
+    "compliance policy employee training budget forecast risk project milestone report summary region"
+).split()
+QUERIES = ["invoice payment terms", "audit compliance findings", "project milestone schedule", "budget forecast risk"]
+
+
+def build_sandbox(root: str, documents: int, pages: int) -> None:
+    random.seed(0)
+    for d in range(documents):
+        with open(os.path.join(root, f"doc{d:03d}.txt"), "w") as f:
+            for _ in range(pages * 40):  # ~40 lines of 12 words per page
+                f.write(" ".join(random.choice(VOCABULARY) for _ in range(12)) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--root", help="index an existing directory instead of synthetic documents")
+    parser.add_argument("--documents", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    root = args.root or tempfile.mkdtemp(prefix="sandbox-")
+    if not args.root:
+        build_sandbox(root, args.documents, args.pages)
+
+    index = DocumentIndex(root)
+    start = time.perf_counter()
+    index.refresh()
+    print(f"indexed {index.stats()} in {time.perf_counter() - start:.2f}s")
+
+    first = sorted(index.documents)[0]
+    with open(os.path.join(root, first), "a") as f:
+        f.write("late addition about invoice payment terms\n")
+    start = time.perf_counter()
+    index.refresh()
+    print(f"re-index after one file changed: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    for query in QUERIES:
+        start = time.perf_counter()
+        results = index.search(query, k=args.k)
+        elapsed = time.perf_counter() - start
+        path = results[0][1].path
+        full = os.path.getsize(os.path.join(root, path))
+        passages = sum(len(chunk.text) for _, chunk in results)
+        print(f"{query!r:32} {elapsed * 1000:6.1f} ms   full file {full:>8} chars (~{full // 4} tokens)   "
+              f"top-{args.k} {passages:>6} chars (~{passages // 4} tokens)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Queue wait per user under skewed load, FIFO vs weighted fair scheduling.
+
+One heavy user submits --heavy-runs runs at once while --light-users other
+users each submit a run every --light-interval-ms. Every run holds a slot
+for --run-ms and reports --run-tokens LLM tokens. The same load is replayed
+through a plain FIFO semaphore and through the FairScheduler with the same
+total concurrency, and queue-wait percentiles are printed per user class.
+
+    uv run python benchmarks/bench_fair_scheduler.py --heavy-runs 200 --light-users 4
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage
+
+from utils.llm_calls import percentile
+from utils.scheduler import FairScheduler
+
+
+def usage_message(tokens: int) -> AIMessage:
+    return AIMessage(content="ok", response_metadata={"token_usage": {"total_tokens": tokens}})
+
+
+async def replay(args, acquire) -> dict:
+    waits = {"heavy": [], "light": []}
+
+    async def run(username: str, kind: str):
+        queued = time.perf_counter()
+        async with acquire(username):
+            waits[kind].append(time.perf_counter() - queued)
+            await asyncio.sleep(args.run_ms / 1000)
+
+    async def light(username: str):
+        tasks = []
+        for _ in range(args.light_runs):
+            tasks.append(asyncio.create_task(run(username, "light")))
+            await asyncio.sleep(args.light_interval_ms / 1000)
+        await asyncio.gather(*tasks)
+
+    heavy = [asyncio.create_task(run("heavy", "heavy")) for _ in range(args.heavy_runs)]
+    await asyncio.gather(*heavy, *(light(f"light-{i}") for i in range(args.light_users)))
+    return waits
+
+
+def fifo(concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    @asynccontextmanager
+    async def slot(username: str):
+        async with semaphore:
+            yield
+    return slot
+
+
+def fair(args):
+    scheduler = FairScheduler(
+        concurrency=args.concurrency,
+        user_concurrency=args.user_concurrency,
+        max_queued=args.heavy_runs,
+        tokens_per_minute=0,
+        weights={},
+    )
+
+    @asynccontextmanager
+    async def slot(username: str):
+        async with scheduler.slot(username):
+            scheduler.record_usage(usage_message(args.run_tokens))
+            yield
+    return slot
+
+
+def report(name: str, waits: dict):
+    for kind, samples in waits.items():
+        print(
+            f"{name:5} {kind:5} runs={len(samples):4d} "
+            f"p50={1000 * percentile(samples, 0.5):8.1f}ms p95={1000 * percentile(samples, 0.95):8.1f}ms "
+            f"max={1000 * max(samples, default=0):8.1f}ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--heavy-runs", type=int, default=200)
+    parser.add_argument("--light-users", type=int, default=4)
+    parser.add_argument("--light-runs", type=int, default=10)
+    parser.add_argument("--light-interval-ms", type=float, default=100)
+    parser.add_argument("--run-ms", type=float, default=50)
+    parser.add_argument("--run-tokens", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--user-concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    report("fifo", asyncio.run(replay(args, fifo(args.concurrency))))
+    report("fair", asyncio.run(replay(args, fair(args))))
+
+
+if __name__ == "__main__":
+    main()
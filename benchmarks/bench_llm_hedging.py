@@ -0,0 +1,56 @@
+"""
+Tail latency of LLM calls with and without hedging.
+
+Replays calls against a simulated model whose latency is mostly fast with a
+slow tail (--slow-rate of calls take --slow-ms), through a ResilientCaller
+with hedging off and on, and prints first-request and served percentiles.
+
+    uv run python benchmarks/bench_llm_hedging.py --calls 1000 --slow-rate 0.03
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage
+
+from utils.llm_calls import ResilientCaller
+
+
+class SimulatedModel:
+    def __init__(self, fast_ms: float, slow_ms: float, slow_rate: float):
+        self.fast_ms = fast_ms
+        self.slow_ms = slow_ms
+        self.slow_rate = slow_rate
+
+    def invoke(self, messages, **kwargs):
+        slow = random.random() < self.slow_rate
+        time.sleep((self.slow_ms if slow else self.fast_ms) / 1000)
+        return AIMessage(content="ok")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument("--fast-ms", type=float, default=10)
+    parser.add_argument("--slow-ms", type=float, default=500)
+    parser.add_argument("--slow-rate", type=float, default=0.03)
+    parser.add_argument("--budget", type=float, default=0.05)
+    args = parser.parse_args()
+
+    model = SimulatedModel(args.fast_ms, args.slow_ms, args.slow_rate)
+    for hedging in (False, True):
+        random.seed(0)
+        caller = ResilientCaller(hedging=hedging, hedge_budget=args.budget, hedge_min_delay=args.fast_ms / 1000)
+        for _ in range(args.calls):
+            caller.invoke(model, [], key="bench")
+        stats = caller.latency_stats()["bench"]
+        served = "  ".join(f"{q} {ms:7.1f}" for q, ms in stats["served_ms"].items())
+        print(f"hedging={'on ' if hedging else 'off'}  served ms: {served}   hedges {stats['hedges']} (won {stats['hedge_wins']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Encode time and bytes on the wire for a thread's message history.
+
+Compares the previous response path (LangChain message objects through
+FastAPI's jsonable_encoder and json) with the compact encoder over the
+message index payloads (orjson), with and without gzip.
+
+    uv run python benchmarks/bench_message_encoding.py --messages 500
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from langchain_core.messages import AIMessage, HumanMessage, message_to_dict
+
+from utils.message_encoding import GZIP_LEVEL, encode_message_payload
+
+
+def build_thread(count: int):
+    """A thread shaped like real Sidekick history: user turns and replies with full OpenAI metadata."""
+    messages = []
+    for i in range(count):
+        if i % 2 == 0:
+            messages.append(HumanMessage(content=f"Question {i}: summarise the attached report section {i}.", id=f"h{i}"))
+        else:
+            messages.append(AIMessage(
+                content="Here is the summary. " + "Lorem ipsum dolor sit amet. " * 20,
+                id=f"a{i}",
+                additional_kwargs={"refusal": None},
+                response_metadata={
+                    "token_usage": {
+                        "completion_tokens": 180, "prompt_tokens": 2400, "total_tokens": 2580,
+                        "completion_tokens_details": {"accepted_prediction_tokens": 0, "audio_tokens": 0,
+                                                      "reasoning_tokens": 0, "rejected_prediction_tokens": 0},
+                        "prompt_tokens_details": {"audio_tokens": 0, "cached_tokens": 1920},
+                    },
+                    "model_name": "gpt-4o-mini-2024-07-18",
+                    "system_fingerprint": "fp_0123456789",
+                    "id": f"chatcmpl-{i:024d}",
+                    "service_tier": "default",
+                    "finish_reason": "stop",
+                    "logprobs": None,
+                },
+                usage_metadata={"input_tokens": 2400, "output_tokens": 180, "total_tokens": 2580,
+                                "input_token_details": {"audio": 0, "cache_read": 1920},
+                                "output_token_details": {"audio": 0, "reasoning": 0}},
+            ))
+    return messages
+
+
+def timed(func, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    messages = build_thread(args.messages)
+    # What the message index stores per row
+    rows = [("2026-01-01T00:00:00+00:00", json.dumps(message_to_dict(m))) for m in messages]
+
+    def legacy():
+        return json.dumps(jsonable_encoder({"messages": messages})).encode()
+
+    def compact():
+        encoded = [encode_message_payload(orjson.loads(payload), ts) for ts, payload in rows]
+        return orjson.dumps({"messages": encoded, "total": len(encoded), "next_before": None})
+
+    legacy_time, legacy_body = timed(legacy, args.repeat)
+    compact_time, compact_body = timed(compact, args.repeat)
+    gzip_time, gzip_body = timed(lambda: gzip.compress(compact_body, compresslevel=GZIP_LEVEL), args.repeat)
+
+    print(f"{args.messages} messages")
+    print(f"legacy   encode {legacy_time * 1000:8.2f} ms   {len(legacy_body):>9} bytes")
+    print(f"compact  encode {compact_time * 1000:8.2f} ms   {len(compact_body):>9} bytes")
+    print(f"+gzip    encode {(compact_time + gzip_time) * 1000:8.2f} ms   {len(gzip_body):>9} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Pages per second and memory of the streaming PDF renderer.
+
+Generates a synthetic Markdown report (headings, paragraphs with inline
+formatting, lists, code blocks and tables) of --sections sections, renders
+it in-process at each size in --scale to show peak Python memory staying
+flat as the document grows, then renders --documents copies through the
+process pool to measure throughput with PDF_RENDER_WORKERS workers.
+
+    uv run python benchmarks/bench_pdf_render.py --sections 200 --scale 1 4 --documents 8
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.pdf_renderer import PdfRenderPool, render_markdown_pdf
+
+WORDS = ("latency throughput agent model token cache request worker thread report summary revenue quarter "
+         "growth margin forecast customer region product pipeline budget metric").split()
+
+
+def sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 20))]
+    words[rng.randrange(len(words))] = f"**{rng.choice(WORDS)}**"
+    words[rng.randrange(len(words))] = f"`{rng.choice(WORDS)}()`"
+    return " ".join(words).capitalize() + "."
+
+
+def write_report(path: str, sections: int, seed: int = 7) -> None:
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("# Synthetic benchmark report\n\n")
+        for number in range(1, sections + 1):
+            f.write(f"## Section {number}\n\n")
+            for _ in range(3):
+                f.write(" ".join(sentence(rng) for _ in range(5)) + "\n\n")
+            for _ in range(4):
+                f.write(f"- {sentence(rng)}\n")
+            f.write("\n```python\n")
+            for line in range(8):
+                f.write(f"result_{line} = compute({line}, cache=True)  # {rng.choice(WORDS)}\n")
+            f.write("```\n\n| metric | value |\n|---|---|\n")
+            for _ in range(3):
+                f.write(f"| {rng.choice(WORDS)} | {rng.randint(1, 10000)} |\n")
+            f.write("\n---\n\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sections", type=int, default=200)
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--documents", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("PDF_RENDER_WORKERS", "2")))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in args.scale:
+            source = os.path.join(directory, f"report_{scale}.md")
+            target = os.path.join(directory, f"report_{scale}.pdf")
+            write_report(source, args.sections * scale)
+            started = time.perf_counter()
+            pages = render_markdown_pdf(target, source_path=source)
+            elapsed = time.perf_counter() - started
+            # Memory is measured on a second render, as tracing slows rendering down
+            tracemalloc.start()
+            render_markdown_pdf(target, source_path=source)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"in-process  sections={args.sections * scale:6d} pages={pages:5d} "
+                  f"{pages / elapsed:7.1f} pages/s  peak python memory {peak / 2**20:6.1f} MiB")
+
+        source = os.path.join(directory, "report_1.md")
+        write_report(source, args.sections)
+        pool = PdfRenderPool(workers=args.workers)
+        with ThreadPoolExecutor(max_workers=max(args.documents, args.workers)) as threads:
+            # Start every worker process before timing
+            list(threads.map(
+                lambda i: pool.render(os.path.join(directory, f"warmup_{i}.pdf"), content="# warm up\n\n" + "text " * 5000),
+                range(args.workers),
+            ))
+            started = time.perf_counter()
+            results = list(threads.map(
+                lambda i: pool.render(os.path.join(directory, f"pool_{i}.pdf"), source_path=source),
+                range(args.documents),
+            ))
+            elapsed = time.perf_counter() - started
+        pool.shutdown()
+        print(f"pool        workers={args.workers} documents={args.documents} pages={sum(results)} "
+              f"{sum(results) / elapsed:7.1f} pages/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Overhead of run profiling: off, CPU sampling only, and with tracemalloc.
+
+Each run serialises and re-parses a synthetic conversation of --messages
+messages, --repeat times, standing in for checkpoint serialization. The
+same run is timed --runs times inside RunProfiler.profile() with profiling
+not requested, requested without memory tracing, and requested with it;
+medians are printed with the slowdown relative to the plain run.
+
+    uv run python benchmarks/bench_profiling.py --messages 200 --repeat 50 --runs 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.profiling import RunProfiler
+
+
+def make_conversation(messages: int) -> list:
+    return [
+        {"type": "ai" if i % 2 else "human", "content": f"message {i} " + "lorem ipsum " * 40, "id": f"msg-{i}"}
+        for i in range(messages)
+    ]
+
+
+def workload(conversation: list, repeat: int) -> int:
+    size = 0
+    for _ in range(repeat):
+        size += len(json.loads(json.dumps(conversation)))
+    return size
+
+
+async def time_runs(profiler: RunProfiler, args, requested: bool) -> float:
+    conversation = make_conversation(args.messages)
+    timings = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        async with profiler.profile("bench", "bench", requested=requested):
+            workload(conversation, args.repeat)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--interval-ms", type=float, default=10)
+    args = parser.parse_args()
+
+    modes = [
+        ("off", RunProfiler(sample_rate=0, interval_ms=args.interval_ms), False),
+        ("cpu", RunProfiler(interval_ms=args.interval_ms, memory=False), True),
+        ("cpu+memory", RunProfiler(interval_ms=args.interval_ms, memory=True), True),
+    ]
+    baseline = None
+    for name, profiler, requested in modes:
+        elapsed = asyncio.run(time_runs(profiler, args, requested))
+        baseline = baseline or elapsed
+        print(f"{name:10} median {1000 * elapsed:8.1f}ms  x{elapsed / baseline:5.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Prompt tokens spent on tool schemas per Sidekick worker call.
+
+Compares binding every registered tool with the per-turn subset picked by the
+tool registry's selector, over a set of typical requests. Token counts are
+for the serialized OpenAI tool definitions, counted with tiktoken's o200k_base
+encoding, or estimated from their length where the encoding can't be
+downloaded (offline). With --live, each request is also
+sent to the model both ways and the reported prompt tokens and latency are
+printed (needs OPENAI_API_KEY).
+
+    uv run python benchmarks/bench_tool_selection.py
+    uv run python benchmarks/bench_tool_selection.py --live --repeat 3
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from typing import Callable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import HumanMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from agents.sidekick.tools import build_tool_registry
+
+REQUESTS = [
+    "What's the weather in Bangalore today?",
+    "Calculate the compound interest on 50000 at 7 percent for 5 years",
+    "Summarise this document. File uploaded: sandbox/report.pdf",
+    "Write a short poem about monsoon and save it as a PDF",
+    "Who founded the Chola empire? Give me a short history",
+    "Send me a Telegram reminder to call the bank",
+    "hello, how are you?",
+]
+
+
+# Characters of JSON per token, for the estimate used without tiktoken's encoding
+CHARS_PER_TOKEN = 4
+
+
+def token_counter() -> Callable[[str], int]:
+    """Counts tokens with tiktoken, or estimates them from the length when its encoding can't be loaded."""
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        print(f"tiktoken encoding unavailable ({type(e).__name__}); estimating 1 token per {CHARS_PER_TOKEN} characters")
+        return lambda text: math.ceil(len(text) / CHARS_PER_TOKEN)
+    return lambda text: len(encoding.encode(text))
+
+
+def schema_tokens(tools, count_tokens: Callable[[str], int]) -> int:
+    return count_tokens(json.dumps([convert_to_openai_tool(tool) for tool in tools]))
+
+
+def live_call(llm, messages, repeat: int):
+    tokens, elapsed = 0, 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = llm.invoke(messages)
+        elapsed += time.perf_counter() - start
+        tokens = response.usage_metadata["input_tokens"]
+    return tokens, elapsed / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--live", action="store_true", help="also call the model and report usage and latency")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    registry = build_tool_registry()
+    count_tokens = token_counter()
+    all_names = registry.names
+    all_tokens = schema_tokens(registry.tools(), count_tokens)
+    print(f"all tools: {len(all_names)} tools, {all_tokens} schema tokens")
+
+    llm = None
+    if args.live:
+        from langchain_openai import ChatOpenAI
+        llm = ChatOpenAI(model=args.model)
+
+    total_selected = 0
+    for text in REQUESTS:
+        messages = [HumanMessage(content=text)]
+        names = registry.select(messages)
+        tokens = schema_tokens(registry.tools(names), count_tokens)
+        total_selected += tokens
+        print(f"{len(names):>3} tools {tokens:>6} tokens ({tokens / all_tokens:5.1%})  {text}")
+        if llm is not None:
+            full_tokens, full_latency = live_call(registry.bind(llm, all_names), messages, args.repeat)
+            subset_tokens, subset_latency = live_call(registry.bind(llm, names), messages, args.repeat)
+            print(f"    prompt tokens {full_tokens} -> {subset_tokens}   "
+                  f"latency {full_latency * 1000:.0f} ms -> {subset_latency * 1000:.0f} ms")
+
+    mean = total_selected / len(REQUESTS)
+    print(f"mean selected: {mean:.0f} schema tokens per call, {1 - mean / all_tokens:.1%} fewer than binding all tools")
+
+
+if __name__ == "__main__":
+    main()
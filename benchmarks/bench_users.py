@@ -0,0 +1,61 @@
+"""
+Throughput benchmark for the user endpoints (create / get / login).
+
+Runs against a live server so the same script can be pointed at two builds
+to compare before/after numbers:
+
+    uv run uvicorn main:app --port 8000
+    uv run python benchmarks/bench_users.py --base-url http://localhost:8000 -n 2000 -c 50
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import httpx
+
+
+async def run_phase(name, client, requests, concurrency):
+    """Fire `requests` (a list of (method, url, json)) with bounded concurrency and report req/s."""
+    semaphore = asyncio.Semaphore(concurrency)
+    errors = 0
+
+    async def one(method, url, body):
+        nonlocal errors
+        async with semaphore:
+            response = await client.request(method, url, json=body)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(*req) for req in requests))
+    elapsed = time.perf_counter() - start
+    print(f"{name:<8} {len(requests):>6} reqs  {elapsed:8.2f}s  {len(requests) / elapsed:10.1f} req/s  errors={errors}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("-n", "--requests", type=int, default=1000, help="requests per phase")
+    parser.add_argument("-c", "--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    run_id = uuid.uuid4().hex[:8]
+    usernames = [f"bench_{run_id}_{i}" for i in range(args.requests)]
+    limits = httpx.Limits(max_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60) as client:
+        await run_phase("create", client, [
+            ("POST", "/users/", {"full_name": "Bench User", "username": u, "password": "secret"})
+            for u in usernames
+        ], args.concurrency)
+        await run_phase("get", client, [("GET", f"/users/{u}", None) for u in usernames], args.concurrency)
+        await run_phase("login", client, [
+            ("POST", "/users/login", {"username": u, "password": "secret"}) for u in usernames
+        ], args.concurrency)
+        # Clean up so repeated runs don't grow the table
+        await run_phase("delete", client, [("DELETE", f"/users/{u}", None) for u in usernames], args.concurrency)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -2,20 +2,31 @@ from fastapi import FastAPI
 from fastapi.concurrency import asynccontextmanager
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
-from routers.agent_router import router as agent_router
+from routers.agent_router import router as agent_router, job_manager
 from routers.user_router import router as user_router
-from fastapi.staticfiles import StaticFiles
+from routers.public_router import router as public_router
 
-from utils.database import init_db
+from utils.database import init_db, close_db
+from utils.notifications import notification_dispatcher
+from utils.pdf_renderer import pdf_render_pool
+from utils.artifacts import artifact_store
 
 
 # ✅ Modern lifespan event system
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("🚀 Starting up db...")
-    init_db()   # Initialize the database
+    await init_db()   # Initialize the database
+    await job_manager.start()   # Resume queued/running Sidekick jobs
+    await notification_dispatcher.start()   # Deliver queued notifications
+    await artifact_store.start()   # Compress cold published files
     yield
     print("🛑 Shutting down db...")
+    await job_manager.stop()
+    await notification_dispatcher.stop()
+    await artifact_store.stop()
+    pdf_render_pool.shutdown()
+    await close_db()
 
 app = FastAPI(
     title="LangGraph Agentic App",
@@ -42,9 +53,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount static files for serving zipped projects
-app.mount("/public", StaticFiles(directory="sandbox"), name="public")
-
 
 @app.get("/")
 async def root():
@@ -64,6 +72,7 @@ async def health_check():
 # Include routes
 app.include_router(agent_router)
 app.include_router(user_router)
+app.include_router(public_router)   # /public downloads, with ETag and Range support
 
 
 if __name__ == "__main__":
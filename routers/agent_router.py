@@ -1,15 +1,60 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Form
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Form, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from agents.llm.agent import agent
 from agents.llm.state import State
 from agents.sidekick.agent import Sidekick  # Import the Sidekick agent
 import aiosqlite
-from langchain_core.messages import AIMessage, HumanMessage
-from typing import Optional
+import asyncio
+import json
+import os
+from langchain_core.messages import HumanMessage
+import orjson
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional
+from datetime import datetime
 from fastapi import UploadFile
 from pathlib import Path
+from utils.deadline import (
+    AGENT_REQUEST_TIMEOUT,
+    Deadline,
+    DeadlineExceeded,
+    aclose_dangling_tool_calls,
+    close_dangling_tool_calls,
+    deadline_scope,
+    request_deadline,
+    run_until_disconnect,
+    with_deadline,
+)
+from utils.checkpointing import checkpoint_cache
+from utils.document_index import document_index
+from utils.jobs import Job, JobManager
+from utils.llm_calls import llm_caller
+from utils.llm_metrics import llm_metrics
+from utils.model_router import model_router_metrics
+from utils.message_encoding import encode_message_payload, json_response
+from utils.message_index import message_index
+from utils.notifications import notification_dispatcher, notification_outbox
+from utils.scheduler import QueueFull, fair_scheduler, user_scope
+from utils.artifacts import artifact_store
+from utils.profiling import RunProfile, request_profiling, run_profiler
+from utils.security import (
+    ADMIN_USERS,
+    THREAD_ID_SEPARATOR,
+    ensure_session_user,
+    require_admin,
+    require_session,
+    thread_id_for,
+)
 
 sidekick_agent = Sidekick()
+job_manager = JobManager(sidekick_agent)
+
+# Batch runs share the process with interactive traffic, so cap how many graph
+# executions a single batch may have in flight
+AGENT_BATCH_CONCURRENCY = int(os.getenv("AGENT_BATCH_CONCURRENCY", "8"))
+AGENT_BATCH_MAX_ITEMS = int(os.getenv("AGENT_BATCH_MAX_ITEMS", "5000"))
+
 # Initialize the API router for agent functionality
 router = APIRouter(prefix="/agent", tags=["Agent Endpoints"])
 
@@ -20,102 +65,406 @@ class AgentRequest(BaseModel):
     chat_id: str
     file: Optional[UploadFile] = None
 
+class JobOut(BaseModel):
+    id: str
+    username: str
+    chat_id: str
+    status: str
+    current_node: Optional[str] = None
+    iteration: int
+    result: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+async def run_scheduled(
+    username: str,
+    make_run: Callable[[], Awaitable[Any]],
+    kind: str,
+    profile: bool = False,
+    response: Optional[Response] = None,
+) -> Any:
+    """
+    Wait for the user's turn in the fair scheduler, then run.
+
+    The run is profiled if `profile` is set or it is sampled; its profile ID is returned in the `X-Profile-Id` header.
+    """
+    async with fair_scheduler.slot(username):
+        async with run_profiler.profile(kind, username, requested=profile) as run_profile:
+            if run_profile is not None and response is not None:
+                response.headers["X-Profile-Id"] = run_profile.id
+            return await make_run()
+
+class BatchItem(BaseModel):
+    username: str
+    chat_id: str
+    message: str
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem] = Field(..., min_length=1)
+
 @router.post("/run")
-async def run_agent(request: AgentRequest):
+async def run_agent(
+    request: AgentRequest,
+    http_request: Request,
+    response: Response,
+    deadline: Deadline = Depends(request_deadline),
+    profile: bool = Depends(request_profiling),
+    session_user: str = Depends(require_session)
+):
     """
     Endpoint to run the LangGraph agent with the provided message and context.
+
+    The run is bounded by the `X-Request-Timeout` deadline and stops early if the client disconnects.
+    Admins can send `X-Profile: 1` to profile it (see `GET /agent/profiles`).
     """
+    ensure_session_user(session_user, request.username)
+    config = {"configurable": {"thread_id": thread_id_for(request.username, request.chat_id)}}
     try:
         # Create the initial state with the user's message
-
-        config = {"configurable": {"thread_id": f"{request.username}_{request.chat_id}"}}
         initial_state = State(
             messages=[HumanMessage(content=request.message)]  # Use HumanMessage object, not dict
         )
         
-        # Run the LangGraph agent
-        result = agent.graph.invoke(initial_state, config=config)  # type: ignore
+        # Run the LangGraph agent in the user's turn; its SqliteSaver is sync-only, so off the event loop
+        result = await run_until_disconnect(http_request, deadline, lambda: run_scheduled(
+            request.username,
+            lambda: run_in_threadpool(with_deadline(deadline, agent.graph.invoke), initial_state, config),  # type: ignore
+            kind="agent", profile=profile, response=response,
+        ))
         
         # Extract the agent's response from the last message
         agent_response = result["messages"][-1].content
         
-        response = {
+        return {
             "agent_response": agent_response,
             "user_message": request.message,
         }
-        return response
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except DeadlineExceeded as e:
+        await run_in_threadpool(close_dangling_tool_calls, agent.graph, config, str(e))
+        raise HTTPException(status_code=504, detail=f"Agent error: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Agent error: {str(e)}")
     
+@router.post("/batch")
+async def run_agent_batch(request: BatchRequest, session_user: str = Depends(require_session)):
+    """
+    Run many independent prompts through the LangGraph agent with bounded concurrency.
+
+    Results are streamed back as NDJSON in completion order, one line per item
+    with its `index` in the request; a failing item yields an error line
+    instead of failing the batch.
+    """
+    if len(request.items) > AGENT_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch may contain at most {AGENT_BATCH_MAX_ITEMS} items.")
+    return StreamingResponse(stream_agent_batch(request.items, session_user), media_type="application/x-ndjson")
+
+async def run_batch_item(
+    index: int, item: BatchItem, session_user: str, semaphore: asyncio.Semaphore, running: set
+) -> dict:
+    result = {"index": index, "username": item.username, "chat_id": item.chat_id}
+    try:
+        ensure_session_user(session_user, item.username)
+        config = {"configurable": {"thread_id": thread_id_for(item.username, item.chat_id)}}
+    except HTTPException as e:
+        return {**result, "status": "error", "error": e.detail}
+    async with semaphore:
+        # Each item gets its own deadline once it starts running
+        deadline = Deadline(AGENT_REQUEST_TIMEOUT)
+        running.add(deadline)
+        try:
+            initial_state = State(messages=[HumanMessage(content=item.message)])
+            # Items take their user's turn like any other run; their tokens and published files are the user's
+            with deadline_scope(deadline), user_scope(item.username):
+                # The batch's own limit replaces the user's, still in fair order with other users
+                async with (
+                    fair_scheduler.slot(item.username, concurrency=AGENT_BATCH_CONCURRENCY),
+                    run_profiler.profile("agent-batch", item.username),
+                ):
+                    # The agent's SqliteSaver is sync-only, so run the graph on the threadpool
+                    output = await run_in_threadpool(with_deadline(deadline, agent.graph.invoke), initial_state, config)  # type: ignore
+            return {**result, "status": "ok", "agent_response": output["messages"][-1].content}
+        except QueueFull as e:
+            return {**result, "status": "error", "error": str(e)}
+        except DeadlineExceeded as e:
+            await run_in_threadpool(close_dangling_tool_calls, agent.graph, config, str(e))
+            return {**result, "status": "error", "error": f"Agent error: {str(e)}"}
+        except Exception as e:
+            return {**result, "status": "error", "error": f"Agent error: {str(e)}"}
+        finally:
+            running.discard(deadline)
+
+async def stream_agent_batch(items: List[BatchItem], session_user: str) -> AsyncIterator[str]:
+    semaphore = asyncio.Semaphore(AGENT_BATCH_CONCURRENCY)
+    running: set = set()
+    tasks = [
+        asyncio.create_task(run_batch_item(i, item, session_user, semaphore, running))
+        for i, item in enumerate(items)
+    ]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield json.dumps(await finished) + "\n"
+    finally:
+        # Client went away: stop running items at their next node and don't start the rest
+        for deadline in list(running):
+            deadline.cancel("Client disconnected")
+        for task in tasks:
+            task.cancel()
+
+async def save_upload(file: Optional[UploadFile], username: str) -> Optional[str]:
+    """
+    Save an uploaded file to the user's uploads directory in the sandbox and return its path.
+
+    Each user gets their own directory, so uploads with the same name don't overwrite each other.
+    """
+    if file is None:
+        return None
+    file_name = Path(file.filename or "").name
+    if not file_name:
+        raise HTTPException(status_code=400, detail="Uploaded file must have a filename.")
+    upload_dir = Path("sandbox") / "uploads" / Path(username).name
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    file_path = upload_dir / file_name
+    with open(file_path, "wb") as f:
+        content = await file.read()
+        f.write(content)
+    document_index.mark_stale()
+    return str(file_path)  # Convert to string for the message
+
+async def save_uploads(file: Optional[UploadFile], files: Optional[List[UploadFile]], username: str) -> List[str]:
+    """
+    Save the single `file` upload and any `files` uploads, returning their paths.
+    """
+    uploads = ([file] if file is not None else []) + list(files or [])
+    return [await save_upload(upload, username) for upload in uploads]
+
+def describe_uploads(message: str, file_paths: List[str]) -> str:
+    """Mention uploaded files in the message text, as the worker's tools need their paths."""
+    if len(file_paths) == 1:
+        return message + f" File uploaded: {file_paths[0]}"
+    if file_paths:
+        return message + f" Files uploaded: {', '.join(file_paths)}"
+    return message
+
 # Endpoint to run the Sidekick agent with the provided message and context
 @router.post("/sidekick/run")
 async def run_sidekick_agent(
+    http_request: Request,
+    response: Response,
     message: str = Form(...),
     username: str = Form(...),
     chat_id: str = Form(...),
-    file: Optional[UploadFile] = None
+    file: Optional[UploadFile] = None,
+    files: Optional[List[UploadFile]] = File(None),
+    deadline: Deadline = Depends(request_deadline),
+    profile: bool = Depends(request_profiling),
+    session_user: str = Depends(require_session)
 ):
     """
     Endpoint to run the Sidekick agent with the provided message and context.
     
-    Supports file upload via Swagger UI for tasks like OCR.
+    Supports file upload via Swagger UI for tasks like OCR; several documents can
+    be sent as `files` and are extracted and summarised in parallel before the
+    agent starts. The run is bounded by the `X-Request-Timeout` deadline and
+    stops early if the client disconnects. Admins can send `X-Profile: 1` to profile it.
     """
+    ensure_session_user(session_user, username)
+    config = {"configurable": {"thread_id": thread_id_for(username, chat_id)}}
     try:
         # Ensure the agent is set up (tools, graph, etc.)
         if sidekick_agent.graph is None:
             await sidekick_agent.setup()
             
-        # Handle file upload if present
-        file_path = None
-        if file and file.filename:
-            # Save the uploaded file to the sandbox directory
-            sandbox_dir = Path("sandbox")
-            sandbox_dir.mkdir(exist_ok=True)
-            file_path = sandbox_dir / file.filename
-            with open(file_path, "wb") as f:
-                content = await file.read()
-                f.write(content)
-            file_path = str(file_path)  # Convert to string for the message
-        elif file:
-            raise HTTPException(status_code=400, detail="Uploaded file must have a filename.")
-
-        # Prepare the message content, including file path if uploaded
-        message_content = message
-        if file_path:
-            message_content += f" File uploaded: {file_path}"
-            
-        
-        
+        # Handle file uploads if present, including the paths in the message
+        file_paths = await save_uploads(file, files, username)
+        message_content = describe_uploads(message, file_paths)
+
         # Prepare the state for Sidekick
-        state = {
-            "messages": [HumanMessage(content=message_content)],
-            "success_criteria": "The answer should be clear and accurate",
-            "feedback_on_work": None,
-            "success_criteria_met": False,
-            "user_input_needed": False,
-        }
+        state = sidekick_agent.initial_state(message_content, documents=file_paths)
 
-        # Run the Sidekick agent
-        result = await sidekick_agent.graph.ainvoke(state, config={"configurable": {"thread_id": f"{username}_{chat_id}"}}) # type: ignore
+        # Run the Sidekick agent in the user's turn
+        result = await run_until_disconnect(http_request, deadline, lambda: run_scheduled(
+            username, lambda: sidekick_agent.graph.ainvoke(state, config=config),  # type: ignore
+            kind="sidekick", profile=profile, response=response,
+        ))
         agent_response = result["messages"][-2].content  # Get the agent's response, not the evaluator feedback
 
-        response = {
+        return {
             "agent_response": agent_response,
             "user_message": message,
         }
-        return response
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except DeadlineExceeded as e:
+        await aclose_dangling_tool_calls(sidekick_agent.graph, config, str(e))
+        raise HTTPException(status_code=504, detail=f"Sidekick Agent error: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Sidekick Agent error: {str(e)}")
 
 
+@router.post("/sidekick/jobs", response_model=JobOut, status_code=202)
+async def submit_sidekick_job(
+    message: str = Form(...),
+    username: str = Form(...),
+    chat_id: str = Form(...),
+    file: Optional[UploadFile] = None,
+    files: Optional[List[UploadFile]] = File(None),
+    session_user: str = Depends(require_session)
+):
+    """
+    Queue a Sidekick run in the background and return its job ID immediately.
+
+    Poll `GET /agent/sidekick/jobs/{job_id}` for progress and the result.
+    """
+    ensure_session_user(session_user, username)
+    thread_id_for(username, chat_id)
+    file_paths = await save_uploads(file, files, username)
+    return await job_manager.submit(username, chat_id, describe_uploads(message, file_paths), documents=file_paths)
+
+async def get_owned_job(job_id: str, session_user: str) -> Job:
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    ensure_session_user(session_user, job.username)
+    return job
+
+@router.get("/sidekick/jobs/{job_id}", response_model=JobOut)
+async def get_sidekick_job(job_id: str, session_user: str = Depends(require_session)):
+    """
+    Get the status, progress and result of a Sidekick job.
+    """
+    return await get_owned_job(job_id, session_user)
+
+@router.delete("/sidekick/jobs/{job_id}", response_model=JobOut)
+async def cancel_sidekick_job(job_id: str, session_user: str = Depends(require_session)):
+    """
+    Cancel a queued or running Sidekick job.
+    """
+    await get_owned_job(job_id, session_user)
+    return await job_manager.cancel(job_id)
+
+
+@router.get("/checkpoint-cache/stats")
+async def get_checkpoint_cache_stats(session_user: str = Depends(require_session)):
+    """
+    Hit rate and approximate memory footprint of the latest-checkpoint cache.
+    """
+    return checkpoint_cache.stats()
+
+@router.get("/llm-metrics")
+async def get_llm_metrics(session_user: str = Depends(require_session)):
+    """
+    Prompt and cached prompt tokens per graph node, with the prompt-cache hit ratio.
+    """
+    return llm_metrics.stats()
+
+@router.get("/model-router/stats")
+async def get_model_router_stats(session_user: str = Depends(require_session)):
+    """
+    Calls, latency, cost and escalations per graph node and model tier.
+    """
+    return model_router_metrics.stats()
+
+@router.get("/llm-calls/stats")
+async def get_llm_call_stats(session_user: str = Depends(require_session)):
+    """
+    Retries, hedges and first-request vs served latency percentiles per node and model.
+    """
+    return llm_caller.latency_stats()
+
+@router.get("/scheduler/stats")
+async def get_scheduler_stats(session_user: str = Depends(require_session)):
+    """
+    Queued and running agent runs, token usage and queue-wait percentiles for the session user (every user for admins).
+    """
+    return fair_scheduler.stats(None if session_user in ADMIN_USERS else session_user)
+
+@router.get("/artifacts")
+async def list_artifacts(session_user: str = Depends(require_session)):
+    """
+    Files the session user has published, with their quota usage.
+    """
+    artifacts = await run_in_threadpool(artifact_store.artifacts, session_user)
+    usage = await run_in_threadpool(artifact_store.usage, session_user)
+    return {**usage, "artifacts": artifacts}
+
+@router.get("/artifacts/stats")
+async def get_artifact_stats(session_user: str = Depends(require_session)):
+    """
+    Published files, unique and on-disk bytes (after deduplication and compression) across the store.
+    """
+    return await run_in_threadpool(artifact_store.stats)
+
+@router.delete("/artifacts/{name:path}")
+async def delete_artifact(name: str, session_user: str = Depends(require_session)):
+    """
+    Unpublish one of the session user's files.
+    """
+    if not await run_in_threadpool(artifact_store.delete, session_user, name):
+        raise HTTPException(status_code=404, detail=f"Artifact '{name}' not found.")
+    return {"detail": f"Artifact '{name}' deleted successfully."}
+
+@router.get("/profiles")
+async def list_profiles(admin_user: str = Depends(require_admin)):
+    """
+    Profiled runs, newest first, with the sampling configuration (admin only).
+    """
+    return run_profiler.stats()
+
+def get_profile_or_404(profile_id: str) -> RunProfile:
+    profile = run_profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Profile '{profile_id}' not found.")
+    return profile
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, admin_user: str = Depends(require_admin)):
+    """
+    A run's busiest functions by CPU samples and its largest allocations still alive at the end (admin only).
+    """
+    return get_profile_or_404(profile_id).report()
+
+@router.get("/profiles/{profile_id}/collapsed", response_class=PlainTextResponse)
+async def get_profile_stacks(profile_id: str, admin_user: str = Depends(require_admin)):
+    """
+    A run's sampled stacks in collapsed format, for flamegraph.pl or speedscope (admin only).
+    """
+    return PlainTextResponse(get_profile_or_404(profile_id).collapsed())
+
+@router.get("/notifications/stats")
+async def get_notification_stats(admin_user: str = Depends(require_admin)):
+    """
+    Queued, sent and failed notifications per channel, and requests made by the dispatcher (ADMIN_USERS only).
+    """
+    return await run_in_threadpool(notification_dispatcher.stats)
+
+@router.get("/notifications/{notification_id}")
+async def get_notification(notification_id: str, session_user: str = Depends(require_session)):
+    """
+    Delivery status of a notification queued in one of the session user's runs (the id is returned by the notification tools).
+    """
+    notification = await run_in_threadpool(notification_outbox.get, notification_id, session_user)
+    if notification is None:
+        raise HTTPException(status_code=404, detail=f"Notification '{notification_id}' not found.")
+    return notification
+
 @router.get("/threads/{username}")
-async def get_user_threads(username: str):
+async def get_user_threads(username: str, session_user: str = Depends(require_session)):
     """
     Get all thread IDs for a specific user.
     """
+    ensure_session_user(session_user, username)
+    prefix = username + THREAD_ID_SEPARATOR
     try:
         conn = await aiosqlite.connect("memory.db")
-        cursor = await conn.execute("SELECT DISTINCT thread_id FROM checkpoints WHERE thread_id LIKE ?", (f"{username}_%",))
+        # An exact prefix, not LIKE (where "_" is a wildcard), with no separator after it: "bob" must not
+        # see "bob_x_1" or "bobby_1"
+        cursor = await conn.execute(
+            "SELECT DISTINCT thread_id FROM checkpoints WHERE substr(thread_id, 1, ?) = ? AND instr(substr(thread_id, ?), ?) = 0",
+            (len(prefix), prefix, len(prefix) + 1, THREAD_ID_SEPARATOR),
+        )
         rows = await cursor.fetchall()
         await conn.close()
         threads = [row[0] for row in rows]
@@ -124,46 +473,60 @@ async def get_user_threads(username: str):
         raise HTTPException(status_code=500, detail=f"Error retrieving threads: {str(e)}")
 
 @router.get("/thread/{username}/{chat_id}/messages")
-async def get_thread_messages(username: str, chat_id: str):
+async def get_thread_messages(
+    request: Request,
+    username: str,
+    chat_id: str,
+    before: Optional[int] = Query(None, description="Return messages older than this cursor (`next_before` of the previous page)"),
+    limit: int = Query(50, ge=1, le=500),
+    session_user: str = Depends(require_session)
+):
     """
-    Get all messages for a specific thread.
+    Get a window of messages for a specific thread, newest page first.
+
+    Reads only the requested window from the message index; `total` is the
+    number of visible messages in the thread and `next_before` the cursor
+    for the next older page (null when there is none). Messages use the
+    compact schema: role, content, id, timestamp and optional tool_calls.
     """
+    ensure_session_user(session_user, username)
+    thread_id = thread_id_for(username, chat_id)
     try:
-        thread_id = f"{username}_{chat_id}"
-        # Ensure the agent is set up
-        if sidekick_agent.graph is None:
-            await sidekick_agent.setup()
-        
-        config = {"configurable": {"thread_id": thread_id}}
-        state_snapshot = await sidekick_agent.graph.aget_state(config) # type: ignore
-        
-        if state_snapshot and state_snapshot.values:
-            messages = state_snapshot.values.get("messages", [])
-            # Filter to show only human messages and AI responses with response_metadata
-            filtered_messages = []
-            for msg in messages:
-                if isinstance(msg, HumanMessage):
-                    filtered_messages.append(msg)
-                elif isinstance(msg, AIMessage) and hasattr(msg, 'response_metadata') and msg.response_metadata:
-                    filtered_messages.append(msg)
-        else:
-            filtered_messages = []
-        
-        return {"messages": filtered_messages}
+        if not await asyncio.to_thread(message_index.has_thread, thread_id):
+            await backfill_message_index(thread_id)
+
+        rows, total, next_before = await asyncio.to_thread(message_index.page, thread_id, before, limit)
+        messages = [encode_message_payload(orjson.loads(payload), created_at) for _, created_at, payload in rows]
+        return json_response(request, {"messages": messages, "total": total, "next_before": next_before})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving messages: {str(e)}")
 
+async def backfill_message_index(thread_id: str):
+    """
+    Index a thread checkpointed before the message index existed (one full state read, once).
+
+    The thread is marked as backfilled even when it has no messages, so reads of it don't repeat the state read.
+    """
+    # Ensure the agent is set up
+    if sidekick_agent.graph is None:
+        await sidekick_agent.setup()
+    config = {"configurable": {"thread_id": thread_id}}
+    state_snapshot = await sidekick_agent.graph.aget_state(config)  # type: ignore
+    if state_snapshot and state_snapshot.values:
+        messages = state_snapshot.values.get("messages", [])
+        await asyncio.to_thread(message_index.index_messages, thread_id, messages)
+    await asyncio.to_thread(message_index.mark_backfilled, thread_id)
+
 @router.delete("/thread/{username}/{chat_id}")
-async def delete_thread(username: str, chat_id: str):
+async def delete_thread(username: str, chat_id: str, session_user: str = Depends(require_session)):
     """
     Delete all checkpoints/messages for a specific thread.
     """
+    ensure_session_user(session_user, username)
+    thread_id = thread_id_for(username, chat_id)
     try:
-        thread_id = f"{username}_{chat_id}"
-        conn = await aiosqlite.connect("memory.db")
-        await conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
-        await conn.commit()
-        await conn.close()
+        # Removes checkpoints, pending writes and the thread's message index rows
+        await run_in_threadpool(agent.graph.checkpointer.delete_thread, thread_id)  # type: ignore
         return {"detail": f"Thread '{thread_id}' deleted successfully."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting thread: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,62 @@
+import os
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, Response
+
+from utils.artifacts import StoredFile, artifact_store
+from utils.message_encoding import accepts_encoding
+from utils.sandbox_files import SANDBOX_DIR, resolve_sandbox_path
+
+# Public downloads are content-addressed, so clients may cache them for a while and revalidate by ETag
+PUBLIC_CACHE_CONTROL = "public, max-age=3600"
+
+router = APIRouter(prefix="/public", tags=["Public Files"])
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+def accepts_gzip(request: Request) -> bool:
+    # Ranges apply to the encoded bytes, so range requests always get the plain file
+    return accepts_encoding(request, "gzip") and "range" not in request.headers
+
+
+def artifact_response(request: Request, stored: StoredFile) -> Response:
+    headers = {"etag": stored.etag, "cache-control": PUBLIC_CACHE_CONTROL, "vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), stored.etag):
+        return Response(status_code=304, headers=headers)
+    if stored.gzipped:
+        headers["content-encoding"] = "gzip"
+    # FileResponse answers Range and If-Range requests against our ETag
+    return FileResponse(stored.path, media_type=stored.content_type, headers=headers)
+
+
+@router.api_route("/{path:path}", methods=["GET", "HEAD"])
+async def get_public_file(path: str, request: Request):
+    """
+    Download a published file (`/public/{username}/{name}`) with ETag and Range support.
+
+    Files still linked directly from the top level of the sandbox (`/public/{name}`) are served from there;
+    nothing below it, such as users' uploads, is public.
+    """
+    username, _, name = path.partition("/")
+    if name:
+        stored = await run_in_threadpool(artifact_store.open, username, name, accepts_gzip(request))
+        if stored is not None:
+            return artifact_response(request, stored)
+    try:
+        file_path = resolve_sandbox_path(path)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="File not found.")
+    # Compare the resolved path, so a top-level symlink into a subdirectory doesn't count either
+    if os.path.dirname(file_path) != os.path.realpath(SANDBOX_DIR):
+        raise HTTPException(status_code=404, detail="File not found.")
+    response = FileResponse(file_path, stat_result=os.stat(file_path))
+    if etag_matches(request.headers.get("if-none-match"), response.headers["etag"]):
+        return Response(status_code=304, headers={"etag": response.headers["etag"]})
+    return response
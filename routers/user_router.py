@@ -1,19 +1,43 @@
+import base64
+import json
 from datetime import datetime, timezone
-from typing import Optional, List
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlmodel import SQLModel, Field, Session, select, func, desc
+from typing import Any, AsyncIterator, Dict, Optional, List, Tuple
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Index, and_, delete, or_
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import SQLModel, Field, select, func, desc
+from sqlmodel.ext.asyncio.session import AsyncSession
 from pydantic import BaseModel
-from utils.database import get_session
+from utils.database import async_session, get_session
+from utils.security import (
+    ensure_session_user,
+    hash_password_async,
+    is_password_hash,
+    issue_session_token,
+    require_admin,
+    require_session,
+    revoke_user_sessions,
+    verify_password_async,
+    SESSION_TTL_SECONDS,
+    THREAD_ID_SEPARATOR,
+)
+
+# Rows fetched per query when streaming a full export
+USER_EXPORT_BATCH_SIZE = 1000
 
 # ===========================
 # User Table & Models
 # ===========================
 
 class User(SQLModel, table=True):
+    # Composite index backing the keyset pagination order (created_at DESC, id DESC)
+    __table_args__ = (Index("ix_user_created_at_id", "created_at", "id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     full_name: str
     username: str = Field(index=True, unique=True)
-    password: str  # In production, store hashed passwords!
+    password: str  # scrypt hash, see utils/security.py
     created_at: Optional[datetime] = Field(
         default_factory=lambda: datetime.now(timezone.utc), 
         nullable=False
@@ -50,121 +74,237 @@ class UserLogin(BaseModel):
 router = APIRouter(prefix="/users", tags=["Users"])
 
 @router.post("/", response_model=UserOut)
-def create_user(
+async def create_user(
     user: UserCreate,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_session)
 ):
-    return create_user_service(session, user)
+    return await create_user_service(session, user)
 
-@router.get("/", response_model=List[UserOut])
-def get_all_users(
-    session: Session = Depends(get_session)
+@router.get("/", response_model=List[Dict[str, Any]])
+async def get_all_users(
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="Opaque cursor returned in the `X-Next-Cursor` header of the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated subset of fields to return, e.g. `id,username`"),
+    output_format: str = Query(
+        "json", alias="format", pattern="^(json|ndjson)$", description="`ndjson` streams every user (admin export)"
+    ),
+    authorization: Optional[str] = Header(None),
+    session: AsyncSession = Depends(get_session)
 ):
-    return fetch_all_users(session)
+    """
+    List users newest first using keyset pagination on (created_at, id).
+
+    The body is a plain list of users; the cursor for the next page, if any,
+    is sent in the `X-Next-Cursor` header. The NDJSON export is admin only.
+    """
+    selected_fields = parse_user_fields(fields)
+    if output_format == "ndjson":
+        await require_admin(await require_session(authorization))
+        return StreamingResponse(stream_users_ndjson(selected_fields), media_type="application/x-ndjson")
+    users, next_cursor = await fetch_users_page(session, limit, decode_user_cursor(cursor), selected_fields)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return users
 
 @router.get("/{username}", response_model=UserOut)
-def get_user_by_username(
+async def get_user_by_username(
     username: str,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_session)
 ):
-    return fetch_user_by_username(session, username)
+    return await fetch_user_by_username(session, username)
 
 @router.patch("/{username}/password", response_model=UserOut)
-def update_user_password(
+async def update_user_password(
     username: str,
     password_update: UserUpdatePassword,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_session),
+    session_user: str = Depends(require_session)
 ):
-    return update_user_password_service(session, username, password_update.password)
+    ensure_session_user(session_user, username)
+    return await update_user_password_service(session, username, password_update.password)
 
 @router.delete("/{username}")
-def delete_user(
+async def delete_user(
     username: str,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_session),
+    session_user: str = Depends(require_session)
 ):
-    return delete_user_service(session, username)
+    ensure_session_user(session_user, username)
+    return await delete_user_service(session, username)
 
 @router.post("/login")
-def login_user(
+async def login_user(
     login: UserLogin,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_session)
 ):
     """
-    Simple login endpoint. In production, use hashed passwords and JWT tokens.
+    Verify the password off the event loop and issue a signed session token
+    for the `Authorization: Bearer` header of the agent endpoints.
     """
-    user = session.exec(
+    user = (await session.exec(
         select(User).where(User.username == login.username)
-    ).first()
-    if not user or user.password != login.password:
+    )).first()
+    if not user or not await verify_password_async(login.password, user.password):
         raise HTTPException(status_code=401, detail="Invalid username or password.")
-    return {"detail": "Login successful", "username": user.username, "full_name": user.full_name}
+    if not is_password_hash(user.password):
+        # Upgrade rows created before passwords were hashed
+        user.password = await hash_password_async(login.password)
+        session.add(user)
+        await session.commit()
+    return {
+        "detail": "Login successful",
+        "username": user.username,
+        "full_name": user.full_name,
+        "access_token": issue_session_token(user.username),
+        "token_type": "bearer",
+        "expires_in": SESSION_TTL_SECONDS,
+    }
 
 # ===========================
 # Service Functions
 # ===========================
 
-def create_user_service(session: Session, user_data: UserCreate) -> User:
+async def create_user_service(session: AsyncSession, user_data: UserCreate) -> User:
     """
     Create a new user. Username must be unique.
+
+    Relies on the unique index on `username` instead of a SELECT before the
+    INSERT, so creating a user is a single round trip.
     """
-    existing = session.exec(
-        select(User).where(User.username == user_data.username)
-    ).first()
-    if existing:
-        raise HTTPException(status_code=400, detail=f"User with username '{user_data.username}' already exists.")
+    if not user_data.username or THREAD_ID_SEPARATOR in user_data.username:
+        raise HTTPException(
+            status_code=400, detail=f"Username must be non-empty and not contain '{THREAD_ID_SEPARATOR}'."
+        )
     new_user = User(
         full_name=user_data.full_name,
         username=user_data.username,
-        password=user_data.password,  # In production, hash the password!
+        password=await hash_password_async(user_data.password),
     )
     session.add(new_user)
-    session.commit()
-    session.refresh(new_user)
+    try:
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(status_code=400, detail=f"User with username '{user_data.username}' already exists.")
+    # Defaults are generated client-side and the id is populated by the INSERT,
+    # so the instance is complete without a refresh
     return new_user
 
-def fetch_all_users(session: Session) -> List[User]:
+def parse_user_fields(fields: Optional[str]) -> List[str]:
+    """
+    Validate a comma-separated field projection against the public user fields.
+    """
+    allowed = list(UserOut.model_fields)
+    if not fields:
+        return allowed
+    selected = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in selected if f not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown user fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}.")
+    return selected
+
+def encode_user_cursor(created_at: datetime, user_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), user_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_user_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, user_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(user_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+async def fetch_users_page(
+    session: AsyncSession,
+    limit: int,
+    after: Optional[Tuple[datetime, int]],
+    fields: List[str],
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
     """
-    Fetch all users, ordered by created_at descending.
+    Fetch one page of users, ordered by created_at descending, starting after the given key.
+
+    Only the requested columns are selected (plus the key columns), and the
+    seek predicate lets the (created_at, id) index serve the page without a sort.
     """
-    query = select(User).order_by(desc(User.created_at))
-    return list(session.exec(query).all())
+    columns = list(dict.fromkeys(["id", "created_at", *fields]))
+    query = select(*[getattr(User, name) for name in columns])
+    if after is not None:
+        created_at, user_id = after
+        query = query.where(or_(
+            User.created_at < created_at,
+            and_(User.created_at == created_at, User.id < user_id),  # type: ignore
+        ))
+    query = query.order_by(desc(User.created_at), desc(User.id)).limit(limit)  # type: ignore
 
-def fetch_user_by_username(session: Session, username: str) -> Optional[User]:
+    rows = (await session.exec(query)).all()  # type: ignore
+    users = [{name: row._mapping[name] for name in fields} for row in rows]
+    next_cursor = None
+    if len(rows) == limit:
+        last = rows[-1]._mapping
+        next_cursor = encode_user_cursor(last["created_at"], last["id"])
+    return users, next_cursor
+
+def _json_default(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+async def stream_users_ndjson(fields: List[str]) -> AsyncIterator[str]:
+    """
+    Stream every user as NDJSON, one keyset batch at a time so memory stays constant.
+
+    Each batch uses its own short-lived session; the request-scoped session may
+    already be closed while the response body is still streaming.
+    """
+    after = None
+    while True:
+        async with async_session() as session:
+            users, next_cursor = await fetch_users_page(session, USER_EXPORT_BATCH_SIZE, after, fields)
+        if users:
+            yield "".join(json.dumps(user, default=_json_default) + "\n" for user in users)
+        if next_cursor is None:
+            break
+        after = decode_user_cursor(next_cursor)
+
+async def fetch_user_by_username(session: AsyncSession, username: str) -> Optional[User]:
     """
     Fetch a user by username.
     """
-    user = session.exec(
+    user = (await session.exec(
         select(User).where(User.username == username)
-    ).first()
+    )).first()
     if not user:
         raise HTTPException(status_code=404, detail=f"User with username '{username}' not found.")
     return user
 
-def update_user_password_service(session: Session, username: str, new_password: str) -> User:
+async def update_user_password_service(session: AsyncSession, username: str, new_password: str) -> User:
     """
     Update a user's password.
     """
-    user = session.exec(
+    user = (await session.exec(
         select(User).where(User.username == username)
-    ).first()
+    )).first()
     if not user:
         raise HTTPException(status_code=404, detail=f"User with username '{username}' not found.")
-    user.password = new_password  # In production, hash the password!
+    user.password = await hash_password_async(new_password)
     session.add(user)
-    session.commit()
-    session.refresh(user)
+    await session.commit()
+    await session.refresh(user)
+    revoke_user_sessions(username)
     return user
 
-def delete_user_service(session: Session, username: str) -> dict:
+async def delete_user_service(session: AsyncSession, username: str) -> dict:
     """
     Delete a user by username.
     """
-    user = session.exec(
-        select(User).where(User.username == username)
-    ).first()
-    if user:
-        session.delete(user)
-        session.commit()
+    result = await session.exec(delete(User).where(User.username == username))  # type: ignore
+    await session.commit()
+    if result.rowcount:
+        revoke_user_sessions(username)
         return {"detail": f"User '{username}' deleted successfully."}
     else:
-        raise HTTPException(status_code=404, detail=f"User with username '{username}' not found.")
\ No newline at end of file
+        raise HTTPException(status_code=404, detail=f"User with username '{username}' not found.")
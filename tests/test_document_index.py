@@ -0,0 +1,44 @@
+"""
+Incremental indexing of files the agent's file tools write, against a temporary sandbox.
+"""
+import pytest
+from langchain_community.agent_toolkits import FileManagementToolkit
+
+from utils.document_index import DocumentIndex, indexing_file_tool
+
+
+@pytest.fixture
+def sandbox(tmp_path):
+    # A refresh interval longer than the test, so only the tool wrapper can pick up new files
+    index = DocumentIndex(root=str(tmp_path), refresh_interval=3600)
+    index.refresh()
+    toolkit = FileManagementToolkit(root_dir=str(tmp_path))
+    tools = {tool.name: indexing_file_tool(tool, index) for tool in toolkit.get_tools()}
+    return index, tools
+
+
+def paths(index: DocumentIndex, query: str):
+    return [chunk.path for _, chunk in index.search(query)]
+
+
+def test_written_file_is_searchable_immediately(sandbox):
+    index, tools = sandbox
+    assert paths(index, "quarterly revenue") == []
+    tools["write_file"].invoke({"file_path": "notes/report.md", "text": "Quarterly revenue grew by ten percent."})
+    assert paths(index, "quarterly revenue") == ["notes/report.md"]
+
+
+def test_move_copy_and_delete_update_the_index(sandbox):
+    index, tools = sandbox
+    tools["write_file"].invoke({"file_path": "draft.txt", "text": "zebrafish migration patterns"})
+    tools["move_file"].invoke({"source_path": "draft.txt", "destination_path": "final.txt"})
+    assert paths(index, "zebrafish") == ["final.txt"]
+    tools["copy_file"].invoke({"source_path": "final.txt", "destination_path": "backup.txt"})
+    assert sorted(paths(index, "zebrafish")) == ["backup.txt", "final.txt"]
+    tools["file_delete"].invoke({"file_path": "final.txt"})
+    assert paths(index, "zebrafish") == ["backup.txt"]
+
+
+def test_read_only_tools_are_not_wrapped(sandbox):
+    _, tools = sandbox
+    assert type(tools["list_directory"]).__name__ == "ListDirectoryTool"
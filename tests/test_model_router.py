@@ -0,0 +1,103 @@
+"""
+Offline tests of the model cascade, with fake chat models as tiers.
+"""
+import time
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+
+from utils.deadline import Deadline, DeadlineExceeded, deadline_scope
+from utils.llm_calls import ResilientCaller
+from utils.model_router import ModelRouter, ModelRouterMetrics, ModelTier, validation_error
+
+PROMPT = [HumanMessage(content="hi")]
+
+
+def fake_tier(name: str, *responses: AIMessage) -> ModelTier:
+    return ModelTier(name, FakeMessagesListChatModel(responses=list(responses)))
+
+
+def make_router(*tiers: ModelTier) -> ModelRouter:
+    return ModelRouter(tiers, metrics=ModelRouterMetrics(), caller=ResilientCaller(max_retries=0, hedging=False))
+
+
+class RecordingModel:
+    """Answers after `delay` seconds and records the timeout each call was given."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.timeouts = []
+
+    def invoke(self, messages, timeout=None, **kwargs):
+        self.timeouts.append(timeout)
+        time.sleep(self.delay)
+        return AIMessage(content="", invalid_tool_calls=[{"name": "f", "args": "{", "id": "1", "error": "bad"}])
+
+
+def test_valid_response_stays_on_first_tier():
+    router = make_router(fake_tier("small", AIMessage(content="ok")), fake_tier("large", AIMessage(content="large")))
+    response, tier = router.invoke_with_tier("node", PROMPT)
+    assert (response.content, tier) == ("ok", 0)
+    assert router.metrics.stats()["node"]["escalation_rate"] == 0.0
+
+
+def test_malformed_tool_call_escalates():
+    bad = AIMessage(content="", invalid_tool_calls=[{"name": "search", "args": "{", "id": "1", "error": "bad json"}])
+    router = make_router(fake_tier("small", bad), fake_tier("large", AIMessage(content="fixed")))
+    response, tier = router.invoke_with_tier("node", PROMPT)
+    assert (response.content, tier) == ("fixed", 1)
+    stats = router.metrics.stats()["node"]
+    assert stats["escalation_reasons"] == {"malformed tool call": 1}
+    assert stats["tiers"]["small"]["escalations"] == 1
+
+
+def test_custom_validation_escalates_structured_output():
+    router = make_router(fake_tier("small", AIMessage(content="x")), fake_tier("large", AIMessage(content="y")))
+
+    def parse(model):
+        return model | (lambda message: {"raw": message, "parsed": None if message.content == "x" else message.content,
+                                         "parsing_error": None})
+
+    response, tier = router.invoke_with_tier("node", PROMPT, prepare=parse)
+    assert (response["parsed"], tier) == ("y", 1)
+
+
+def test_top_tier_response_is_returned_even_if_invalid():
+    router = make_router(fake_tier("small", AIMessage(content="")), fake_tier("large", AIMessage(content="")))
+    response, tier = router.invoke_with_tier("node", PROMPT)
+    assert tier == 1 and validation_error(response) == "empty response"
+
+
+def test_start_tier_and_escalate_are_clamped():
+    router = make_router(fake_tier("small", AIMessage(content="s")), fake_tier("large", AIMessage(content="l")))
+    assert router.invoke_with_tier("node", PROMPT, start_tier=5)[1] == 1
+    assert router.escalate("node", 0, "evaluator rejected") == 1
+    assert router.escalate("node", 1, "evaluator rejected") == 1
+
+
+@pytest.mark.parametrize("message, reason", [
+    (AIMessage(content="cut", response_metadata={"finish_reason": "length"}), "truncated response"),
+    (AIMessage(content=""), "empty response"),
+    (AIMessage(content="", tool_calls=[{"name": "f", "args": {}, "id": "1"}]), None),
+    ({"raw": AIMessage(content="x"), "parsed": None, "parsing_error": ValueError("bad")}, "invalid structured output"),
+])
+def test_validation_error(message, reason):
+    assert validation_error(message) == reason
+
+
+def test_timeout_is_recomputed_for_each_tier():
+    small, large = RecordingModel(delay=0.3), RecordingModel()
+    router = make_router(ModelTier("small", small), ModelTier("large", large))
+    with deadline_scope(Deadline(1.0)):
+        router.invoke_with_tier("node", PROMPT, timeout=60)
+    assert small.timeouts[0] <= 1.0
+    assert large.timeouts[0] <= small.timeouts[0] - 0.25
+
+
+def test_escalation_stops_at_the_deadline():
+    small, large = RecordingModel(delay=0.2), RecordingModel()
+    router = make_router(ModelTier("small", small), ModelTier("large", large))
+    with deadline_scope(Deadline(0.1)), pytest.raises(DeadlineExceeded):
+        router.invoke_with_tier("node", PROMPT, timeout=60)
+    assert large.timeouts == []
@@ -0,0 +1,168 @@
+"""
+Outbox delivery, retry and dead-lettering against a local stub provider.
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+from utils import notifications
+from utils.notifications import (
+    STATUS_FAILED,
+    STATUS_PENDING,
+    STATUS_SENT,
+    NotificationDispatcher,
+    NotificationOutbox,
+    retry_delay,
+)
+
+
+class StubProvider:
+    """An HTTP server answering with queued status codes (200 once they run out) and recording each request."""
+
+    def __init__(self):
+        self.statuses = []
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+                stub.requests.append((self.path, {key: values[0] for key, values in parse_qs(body).items()}))
+                status = stub.statuses.pop(0) if stub.statuses else 200
+                self.send_response(status)
+                self.end_headers()
+                self.wfile.write(b'{"ok": %s}' % (b"true" if status < 400 else b"false"))
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    stub = StubProvider()
+    monkeypatch.setattr(notifications, "TELEGRAM_API_BASE", stub.url)
+    monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "test-token")
+    yield stub
+    stub.close()
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    return NotificationOutbox(path=str(tmp_path / "outbox.db"))
+
+
+def make_due(outbox: NotificationOutbox) -> None:
+    """Skip the backoff wait of every pending message."""
+    with sqlite3.connect(outbox.path) as connection:
+        connection.execute("UPDATE notification SET next_attempt_at = 0 WHERE status = ?", (STATUS_PENDING,))
+
+
+def deliver_due(dispatcher: NotificationDispatcher) -> None:
+    rows = dispatcher.outbox.claim_due()
+    assert rows
+    dispatcher.deliver(rows)
+
+
+def test_messages_to_one_recipient_share_a_request(provider, outbox):
+    dispatcher = NotificationDispatcher(outbox)
+    first, _ = outbox.enqueue("telegram", "42", "build finished", username="bob")
+    second, _ = outbox.enqueue("telegram", "42", "report ready", username="bob")
+    deliver_due(dispatcher)
+    assert len(provider.requests) == 1
+    path, form = provider.requests[0]
+    assert path == "/bottest-token/sendMessage"
+    assert form == {"chat_id": "42", "text": "build finished\n\nreport ready"}
+    assert [outbox.get(i, "bob")["status"] for i in (first, second)] == [STATUS_SENT, STATUS_SENT]
+    assert dispatcher.messages_sent == 2 and dispatcher.requests_sent == 1
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_transient_errors_are_retried_with_backoff(provider, outbox, status):
+    dispatcher = NotificationDispatcher(outbox)
+    provider.statuses = [status]
+    notification_id, _ = outbox.enqueue("telegram", "42", "hello", username="bob")
+    before = time.time()
+    deliver_due(dispatcher)
+
+    notification = outbox.get(notification_id, "bob")
+    assert notification["status"] == STATUS_PENDING
+    assert notification["attempts"] == 1
+    assert notification["last_error"].startswith(f"HTTP {status}")
+    assert notification["next_attempt_at"] >= before + notifications.NOTIFICATION_RETRY_BASE_DELAY / 2
+    assert outbox.claim_due() == []  # not due until the backoff has passed
+
+    make_due(outbox)
+    deliver_due(dispatcher)
+    notification = outbox.get(notification_id, "bob")
+    assert (notification["status"], notification["attempts"], notification["last_error"]) == (STATUS_SENT, 2, None)
+
+
+def test_gives_up_after_max_attempts(provider, outbox):
+    dispatcher = NotificationDispatcher(outbox, max_attempts=3)
+    provider.statuses = [500] * 5
+    notification_id, _ = outbox.enqueue("telegram", "42", "hello", username="bob")
+    for _ in range(3):
+        deliver_due(dispatcher)
+        make_due(outbox)
+    notification = outbox.get(notification_id, "bob")
+    assert (notification["status"], notification["attempts"]) == (STATUS_FAILED, 3)
+    assert outbox.claim_due() == []
+    assert len(provider.requests) == 3
+
+
+def test_permanent_errors_fail_at_once(provider, outbox):
+    dispatcher = NotificationDispatcher(outbox)
+    provider.statuses = [400]
+    notification_id, _ = outbox.enqueue("telegram", "42", "hello", username="bob")
+    deliver_due(dispatcher)
+    notification = outbox.get(notification_id, "bob")
+    assert (notification["status"], notification["attempts"]) == (STATUS_FAILED, 1)
+
+
+def test_unreachable_provider_is_retried(monkeypatch, outbox):
+    stub = StubProvider()
+    stub.close()  # nothing listens on its port any more
+    monkeypatch.setattr(notifications, "TELEGRAM_API_BASE", stub.url)
+    monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "test-token")
+    notification_id, _ = outbox.enqueue("telegram", "42", "hello", username="bob")
+    deliver_due(NotificationDispatcher(outbox))
+    notification = outbox.get(notification_id, "bob")
+    assert (notification["status"], notification["attempts"]) == (STATUS_PENDING, 1)
+
+
+def test_retry_delay_grows_exponentially_up_to_the_cap():
+    for attempt, ceiling in ((1, 5), (2, 10), (3, 20), (10, 300)):
+        for _ in range(20):
+            assert ceiling / 2 <= retry_delay(attempt, base=5, cap=300) <= ceiling
+
+
+def test_dispatcher_delivers_queued_messages_in_the_background(provider, outbox):
+    async def scenario():
+        dispatcher = NotificationDispatcher(outbox, batch_delay=0)
+        await dispatcher.start()
+        try:
+            notification_id, _ = outbox.enqueue("telegram", "42", "hello", username="bob")
+            dispatcher.wake()
+            for _ in range(100):
+                if outbox.get(notification_id, "bob")["status"] == STATUS_SENT:
+                    break
+                await asyncio.sleep(0.02)
+            return outbox.get(notification_id, "bob")["status"]
+        finally:
+            await dispatcher.stop()
+
+    assert asyncio.run(scenario()) == STATUS_SENT
+    assert len(provider.requests) == 1
@@ -0,0 +1,30 @@
+"""
+Ranged reads of sandbox files, against a temporary sandbox.
+"""
+import pytest
+
+from utils.sandbox_files import SANDBOX_DIR, read_file_range
+
+
+@pytest.fixture(autouse=True)
+def sandbox(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / SANDBOX_DIR).mkdir()
+    (tmp_path / SANDBOX_DIR / "log.txt").write_text("".join(f"line {n}\n" for n in range(1, 11)))
+
+
+def test_reads_an_inclusive_window_of_lines():
+    output = read_file_range("log.txt", start_line=3, end_line=4)
+    assert output.splitlines()[1:] == ["3| line 3", "4| line 4"]
+
+
+@pytest.mark.parametrize("arguments, message", [
+    ({"start_line": 5, "end_line": 2}, "end_line (2) is before start_line (5)"),
+    ({"start_line": 0}, "must be at least 1"),
+    ({"end_line": -1}, "must be at least 1"),
+    ({"byte_offset": -5}, "byte_offset must be at least 0"),
+    ({"byte_offset": 0, "byte_length": 0}, "byte_length at least 1"),
+])
+def test_invalid_ranges_are_rejected(arguments, message):
+    output = read_file_range("log.txt", **arguments)
+    assert output.startswith("Error:") and message in output
@@ -0,0 +1,368 @@
+"""
+Content-addressed store for files published from the sandbox.
+
+The sandbox stays the agents' working directory; files leave it through
+`get_file_link`, which publishes them here. Bytes are stored once per
+SHA-256 under `blobs/`, and each user has a namespace mapping file names to
+hashes, so the same report published twice, or by two users, takes the
+space of one copy, and one user's links can't be overwritten by another's.
+
+A SQLite index records every blob's size and every name's last access.
+Publishing beyond a user's quota evicts that user's least recently
+accessed names first; the store as a whole is capped the same way across
+all users. Blobs no name refers to are deleted.
+
+A maintenance pass gzips blobs nobody has read for ARTIFACT_COLD_AFTER_DAYS
+if that saves space. Cold blobs are served to clients that accept gzip as
+they are, and decompressed back in place for everyone else (and for range
+requests), since a read makes them hot again.
+"""
+import asyncio
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import quote
+
+from utils.sandbox_files import SANDBOX_DIR, resolve_sandbox_path
+from utils.scheduler import current_user
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "artifacts")
+ARTIFACT_USER_QUOTA_BYTES = int(os.getenv("ARTIFACT_USER_QUOTA_BYTES", str(1024 * 1024 * 1024)))
+ARTIFACT_STORE_MAX_BYTES = int(os.getenv("ARTIFACT_STORE_MAX_BYTES", str(10 * 1024 * 1024 * 1024)))
+ARTIFACT_COLD_AFTER_DAYS = float(os.getenv("ARTIFACT_COLD_AFTER_DAYS", "7"))
+ARTIFACT_MAINTENANCE_INTERVAL = float(os.getenv("ARTIFACT_MAINTENANCE_INTERVAL", "3600"))
+# Namespace for files published outside a user's run
+ARTIFACT_SHARED_NAMESPACE = "shared"
+# Blobs smaller than this aren't worth compressing
+COMPRESS_MIN_BYTES = 4096
+# Keep a compressed copy only if it is at most this fraction of the original
+COMPRESS_MAX_RATIO = 0.9
+CHUNK_SIZE = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blob (
+    hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    stored_size INTEGER NOT NULL,
+    compressed INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS artifact (
+    username TEXT NOT NULL,
+    name TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    content_type TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (username, name)
+);
+CREATE INDEX IF NOT EXISTS ix_artifact_lru ON artifact (username, last_access);
+CREATE INDEX IF NOT EXISTS ix_artifact_hash ON artifact (hash);
+CREATE INDEX IF NOT EXISTS ix_blob_cold ON blob (compressed, last_access);
+"""
+
+
+class QuotaExceeded(Exception):
+    """Raised when a file is larger than the user's whole quota."""
+
+
+@dataclass
+class StoredFile:
+    """A file to serve: the blob on disk and how it is encoded."""
+    path: str
+    hash: str
+    size: int
+    content_type: str
+    gzipped: bool
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.hash}-gz"' if self.gzipped else f'"{self.hash}"'
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compressible(path: str) -> bool:
+    """Whether the start of a file compresses well enough to be worth gzipping."""
+    with open(path, "rb") as f:
+        sample = f.read(64 * 1024)
+    return bool(sample) and len(zlib.compress(sample, 6)) <= COMPRESS_MAX_RATIO * len(sample)
+
+
+class ArtifactStore:
+    def __init__(
+        self,
+        root: str = ARTIFACT_DIR,
+        user_quota: int = ARTIFACT_USER_QUOTA_BYTES,
+        max_bytes: int = ARTIFACT_STORE_MAX_BYTES,
+        cold_after_days: float = ARTIFACT_COLD_AFTER_DAYS,
+    ):
+        self.root = root
+        self.user_quota = user_quota
+        self.max_bytes = max_bytes
+        self.cold_after = cold_after_days * 86400
+        # Serialises index changes with the blob files they describe
+        self.lock = threading.RLock()
+        self._initialized = False
+        self._task: Optional[asyncio.Task] = None
+
+    def blob_path(self, digest: str, compressed: bool = False) -> str:
+        return os.path.join(self.root, "blobs", digest[:2], digest + (".gz" if compressed else ""))
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        if not self._initialized:
+            os.makedirs(os.path.join(self.root, "blobs"), exist_ok=True)
+        connection = sqlite3.connect(os.path.join(self.root, "index.db"), timeout=10)
+        connection.row_factory = sqlite3.Row
+        try:
+            if not self._initialized:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.executescript(SCHEMA)
+                self._initialized = True
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def put_file(self, username: str, name: str, source: str) -> Dict[str, Any]:
+        """Store a copy of `source` as `name` in the user's namespace, evicting LRU names over quota."""
+        size = os.path.getsize(source)
+        if size > self.user_quota:
+            raise QuotaExceeded(f"{name} is {size} bytes, more than the {self.user_quota}-byte quota.")
+        digest = file_sha256(source)
+        now = time.time()
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        with self.lock:
+            with self._connect() as connection:
+                if connection.execute("SELECT 1 FROM blob WHERE hash = ?", (digest,)).fetchone() is None:
+                    path = self.blob_path(digest)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    partial = f"{path}.{os.getpid()}.partial"
+                    shutil.copyfile(source, partial)
+                    os.replace(partial, path)
+                    connection.execute(
+                        "INSERT INTO blob (hash, size, stored_size, compressed, created_at, last_access) "
+                        "VALUES (?, ?, ?, 0, ?, ?)",
+                        (digest, size, size, now, now),
+                    )
+                else:
+                    connection.execute("UPDATE blob SET last_access = ? WHERE hash = ?", (now, digest))
+                connection.execute(
+                    "INSERT INTO artifact (username, name, hash, size, content_type, created_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (username, name) DO UPDATE SET "
+                    "hash = excluded.hash, size = excluded.size, content_type = excluded.content_type, "
+                    "created_at = excluded.created_at, last_access = excluded.last_access",
+                    (username, name, digest, size, content_type, now, now),
+                )
+                self._enforce_quotas(connection, username, name)
+                self._collect_garbage(connection)
+        return {"username": username, "name": name, "hash": digest, "size": size, "content_type": content_type}
+
+    def _enforce_quotas(self, connection: sqlite3.Connection, username: str, keep: str) -> None:
+        used = connection.execute("SELECT COALESCE(SUM(size), 0) FROM artifact WHERE username = ?", (username,)).fetchone()[0]
+        if used > self.user_quota:
+            for row in connection.execute(
+                "SELECT name, size FROM artifact WHERE username = ? AND name != ? ORDER BY last_access", (username, keep)
+            ).fetchall():
+                logger.info("Evicting %s/%s: user over artifact quota", username, row["name"])
+                connection.execute("DELETE FROM artifact WHERE username = ? AND name = ?", (username, row["name"]))
+                used -= row["size"]
+                if used <= self.user_quota:
+                    break
+        # Store-wide cap on bytes on disk: evict across users, least recently accessed first
+        stored = self._stored_bytes(connection)
+        if stored > self.max_bytes:
+            for row in connection.execute(
+                "SELECT username, name FROM artifact WHERE NOT (username = ? AND name = ?) ORDER BY last_access",
+                (username, keep),
+            ).fetchall():
+                logger.info("Evicting %s/%s: artifact store full", row["username"], row["name"])
+                connection.execute("DELETE FROM artifact WHERE username = ? AND name = ?", (row["username"], row["name"]))
+                self._collect_garbage(connection)
+                stored = self._stored_bytes(connection)
+                if stored <= self.max_bytes:
+                    break
+
+    def _stored_bytes(self, connection: sqlite3.Connection) -> int:
+        return connection.execute("SELECT COALESCE(SUM(stored_size), 0) FROM blob").fetchone()[0]
+
+    def _collect_garbage(self, connection: sqlite3.Connection) -> None:
+        """Delete blobs that no name refers to."""
+        for row in connection.execute(
+            "SELECT hash, compressed FROM blob WHERE hash NOT IN (SELECT hash FROM artifact)"
+        ).fetchall():
+            connection.execute("DELETE FROM blob WHERE hash = ?", (row["hash"],))
+            try:
+                os.remove(self.blob_path(row["hash"], bool(row["compressed"])))
+            except FileNotFoundError:
+                pass
+
+    def open(self, username: str, name: str, accept_gzip: bool = False) -> Optional[StoredFile]:
+        """The blob to serve for a name, or None. Cold blobs are decompressed unless `accept_gzip`."""
+        now = time.time()
+        with self.lock:
+            with self._connect() as connection:
+                row = connection.execute(
+                    "SELECT a.hash, a.size, a.content_type, b.compressed FROM artifact a JOIN blob b ON a.hash = b.hash "
+                    "WHERE a.username = ? AND a.name = ?",
+                    (username, name),
+                ).fetchone()
+                if row is None:
+                    return None
+                connection.execute(
+                    "UPDATE artifact SET last_access = ? WHERE username = ? AND name = ?", (now, username, name)
+                )
+                connection.execute("UPDATE blob SET last_access = ? WHERE hash = ?", (now, row["hash"]))
+                compressed = bool(row["compressed"])
+                if compressed and not accept_gzip:
+                    self._decompress(connection, row["hash"])
+                    compressed = False
+        return StoredFile(
+            path=self.blob_path(row["hash"], compressed),
+            hash=row["hash"],
+            size=row["size"],
+            content_type=row["content_type"],
+            gzipped=compressed,
+        )
+
+    def _decompress(self, connection: sqlite3.Connection, digest: str) -> None:
+        path = self.blob_path(digest)
+        partial = f"{path}.{os.getpid()}.partial"
+        with gzip.open(self.blob_path(digest, compressed=True), "rb") as source, open(partial, "wb") as target:
+            shutil.copyfileobj(source, target, CHUNK_SIZE)
+        os.replace(partial, path)
+        connection.execute(
+            "UPDATE blob SET compressed = 0, stored_size = size WHERE hash = ?", (digest,)
+        )
+        os.remove(self.blob_path(digest, compressed=True))
+
+    def compress_cold(self) -> int:
+        """Gzip blobs not read for the cold period, where it saves space; returns how many were compressed."""
+        with self._connect() as connection:
+            cold = connection.execute(
+                "SELECT hash, size FROM blob WHERE compressed = 0 AND last_access < ? AND size >= ?",
+                (time.time() - self.cold_after, COMPRESS_MIN_BYTES),
+            ).fetchall()
+        count = 0
+        for row in cold:
+            path = self.blob_path(row["hash"])
+            if not compressible(path):
+                continue
+            target = self.blob_path(row["hash"], compressed=True)
+            partial = f"{target}.{os.getpid()}.partial"
+            # Compress outside the lock; the swap below re-checks the blob wasn't read meanwhile
+            with open(path, "rb") as source, gzip.open(partial, "wb", compresslevel=6) as compressed:
+                shutil.copyfileobj(source, compressed, CHUNK_SIZE)
+            stored_size = os.path.getsize(partial)
+            with self.lock:
+                with self._connect() as connection:
+                    current = connection.execute(
+                        "SELECT last_access, compressed FROM blob WHERE hash = ?", (row["hash"],)
+                    ).fetchone()
+                    if (
+                        current is None or current["compressed"] or current["last_access"] >= time.time() - self.cold_after
+                        or stored_size > COMPRESS_MAX_RATIO * row["size"]
+                    ):
+                        os.remove(partial)
+                        continue
+                    os.replace(partial, target)
+                    connection.execute(
+                        "UPDATE blob SET compressed = 1, stored_size = ? WHERE hash = ?", (stored_size, row["hash"])
+                    )
+                    os.remove(path)
+                    count += 1
+        return count
+
+    def delete(self, username: str, name: str) -> bool:
+        with self.lock:
+            with self._connect() as connection:
+                deleted = connection.execute(
+                    "DELETE FROM artifact WHERE username = ? AND name = ?", (username, name)
+                ).rowcount
+                self._collect_garbage(connection)
+        return bool(deleted)
+
+    def artifacts(self, username: str) -> List[Dict[str, Any]]:
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT name, hash, size, content_type, created_at, last_access FROM artifact "
+                "WHERE username = ? ORDER BY name",
+                (username,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def usage(self, username: str) -> Dict[str, int]:
+        with self._connect() as connection:
+            used = connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM artifact WHERE username = ?", (username,)
+            ).fetchone()[0]
+        return {"used_bytes": used, "quota_bytes": self.user_quota}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as connection:
+            artifacts, logical = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM artifact").fetchone()
+            blobs, unique, stored, compressed = connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(stored_size), 0), COALESCE(SUM(compressed), 0) FROM blob"
+            ).fetchone()
+        return {
+            "artifacts": artifacts,
+            "blobs": blobs,
+            "compressed_blobs": compressed,
+            "logical_bytes": logical,
+            "unique_bytes": unique,
+            "stored_bytes": stored,
+            "max_bytes": self.max_bytes,
+        }
+
+    async def start(self):
+        self._task = asyncio.create_task(self._maintain())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _maintain(self):
+        while True:
+            try:
+                compressed = await asyncio.to_thread(self.compress_cold)
+                if compressed:
+                    logger.info("Compressed %d cold artifact(s).", compressed)
+            except Exception:
+                logger.exception("Artifact maintenance failed")
+            await asyncio.sleep(ARTIFACT_MAINTENANCE_INTERVAL)
+
+
+artifact_store = ArtifactStore()
+
+
+def publish_sandbox_file(file_name: str) -> str:
+    """Publish a sandbox file in the current user's namespace and return its public link."""
+    path = resolve_sandbox_path(file_name)
+    name = os.path.relpath(path, os.path.realpath(SANDBOX_DIR)).replace(os.sep, "/")
+    username = current_user() or ARTIFACT_SHARED_NAMESPACE
+    artifact_store.put_file(username, name, path)
+    base_url = os.getenv("BASE_URL", "http://localhost:8000/public/")
+    return base_url + quote(username, safe="") + "/" + quote(name)
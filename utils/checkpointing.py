@@ -0,0 +1,380 @@
+"""
+Checkpointer decorators shared by the LangGraph agent and Sidekick.
+
+`DelegatingCheckpointSaver` forwards every call to a wrapped saver
+(SqliteSaver / AsyncSqliteSaver) so subclasses only override what they add.
+"""
+import asyncio
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    copy_checkpoint,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from pydantic import BaseModel
+
+from utils.message_index import MessageIndex, message_index
+
+# Latest-checkpoint cache shared by both agents (they write the same memory.db threads).
+# It assumes a thread is served by one process; set CHECKPOINT_CACHE_MAX_THREADS=0 to disable.
+CHECKPOINT_CACHE_MAX_THREADS = int(os.getenv("CHECKPOINT_CACHE_MAX_THREADS", "1000"))
+CHECKPOINT_CACHE_MAX_BYTES = int(os.getenv("CHECKPOINT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+class DelegatingCheckpointSaver(BaseCheckpointSaver):
+    def __init__(self, inner: BaseCheckpointSaver):
+        super().__init__(serde=inner.serde)
+        self.inner = inner
+
+    @property
+    def config_specs(self) -> list:
+        return self.inner.config_specs
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self.inner.get_tuple(config)
+
+    def list(self, config: Optional[RunnableConfig], **kwargs: Any) -> Iterator[CheckpointTuple]:
+        return self.inner.list(config, **kwargs)
+
+    def put(
+        self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions
+    ) -> RunnableConfig:
+        return self.inner.put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[tuple], task_id: str, task_path: str = "") -> None:
+        return self.inner.put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id: str) -> None:
+        return self.inner.delete_thread(thread_id)
+
+    def delete_for_runs(self, run_ids: Sequence[str]) -> None:
+        return self.inner.delete_for_runs(run_ids)
+
+    def copy_thread(self, source_thread_id: str, target_thread_id: str) -> None:
+        return self.inner.copy_thread(source_thread_id, target_thread_id)
+
+    def prune(self, thread_ids: Sequence[str], **kwargs: Any) -> None:
+        return self.inner.prune(thread_ids, **kwargs)
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await self.inner.aget_tuple(config)
+
+    async def alist(self, config: Optional[RunnableConfig], **kwargs: Any) -> AsyncIterator[CheckpointTuple]:
+        async for item in self.inner.alist(config, **kwargs):
+            yield item
+
+    async def aput(
+        self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions
+    ) -> RunnableConfig:
+        return await self.inner.aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self, config: RunnableConfig, writes: Sequence[tuple], task_id: str, task_path: str = ""
+    ) -> None:
+        return await self.inner.aput_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await self.inner.adelete_thread(thread_id)
+
+    async def adelete_for_runs(self, run_ids: Sequence[str]) -> None:
+        return await self.inner.adelete_for_runs(run_ids)
+
+    async def acopy_thread(self, source_thread_id: str, target_thread_id: str) -> None:
+        return await self.inner.acopy_thread(source_thread_id, target_thread_id)
+
+    async def aprune(self, thread_ids: Sequence[str], **kwargs: Any) -> None:
+        return await self.inner.aprune(thread_ids, **kwargs)
+
+    def get_next_version(self, current: Any, channel: None) -> Any:
+        return self.inner.get_next_version(current, channel)
+
+
+class IndexedCheckpointSaver(DelegatingCheckpointSaver):
+    """
+    Keeps the message index in step with the checkpoints: whenever a root-graph
+    checkpoint changes the `messages` channel, new messages are indexed.
+    """
+
+    def __init__(self, inner: BaseCheckpointSaver, index: MessageIndex = message_index):
+        super().__init__(inner)
+        self.index = index
+
+    def _messages_to_index(self, config: RunnableConfig, checkpoint: Checkpoint, new_versions: ChannelVersions):
+        configurable = config.get("configurable", {})
+        if configurable.get("checkpoint_ns") or "messages" not in new_versions:
+            return None
+        messages = checkpoint.get("channel_values", {}).get("messages")
+        if not messages:
+            return None
+        return configurable["thread_id"], messages
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        next_config = self.inner.put(config, checkpoint, metadata, new_versions)
+        pending = self._messages_to_index(config, checkpoint, new_versions)
+        if pending:
+            self.index.index_messages(*pending)
+        return next_config
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        next_config = await self.inner.aput(config, checkpoint, metadata, new_versions)
+        pending = self._messages_to_index(config, checkpoint, new_versions)
+        if pending:
+            await asyncio.to_thread(self.index.index_messages, *pending)
+        return next_config
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.inner.delete_thread(thread_id)
+        self.index.delete_thread(thread_id)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await self.inner.adelete_thread(thread_id)
+        await asyncio.to_thread(self.index.delete_thread, thread_id)
+
+
+def _approx_size(value: Any, depth: int = 0) -> int:
+    """Cheap estimate of the memory held by a checkpoint value (no serialization)."""
+    if isinstance(value, (str, bytes)):
+        return sys.getsizeof(value)
+    if depth > 8:
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_approx_size(v, depth + 1) for v in value.values())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(_approx_size(v, depth + 1) for v in value)
+    if isinstance(value, BaseModel):
+        return sys.getsizeof(value) + _approx_size(value.__dict__, depth + 1)
+    return sys.getsizeof(value)
+
+
+def _copy_tuple(entry: CheckpointTuple) -> CheckpointTuple:
+    """
+    Hand out a tuple whose containers callers may change without touching the cache.
+
+    The checkpoint dict, its channel_values and versions maps, and the
+    pending-writes list are copied; the values themselves (messages) are
+    shared. LangGraph treats loaded channel values as immutable, since reducers
+    such as add_messages build new lists, so nothing edits them in place.
+    Deep copies of a long thread cost more than reading it back from SQLite.
+    """
+    return entry._replace(checkpoint=copy_checkpoint(entry.checkpoint), pending_writes=list(entry.pending_writes or []))
+
+
+class CheckpointCache:
+    """
+    Memory-bounded LRU of the latest root checkpoint per thread, with hit/miss counters.
+    """
+
+    def __init__(self, max_threads: int = CHECKPOINT_CACHE_MAX_THREADS, max_bytes: int = CHECKPOINT_CACHE_MAX_BYTES):
+        self.max_threads = max_threads
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # thread_id -> (latest checkpoint tuple, approximate size, {(task_id, idx): (task_path, channel, value)})
+        self.entries: "OrderedDict[str, Tuple[CheckpointTuple, int, Dict[tuple, tuple]]]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_threads > 0
+
+    def get(self, thread_id: str, checkpoint_id: Optional[str]) -> Optional[CheckpointTuple]:
+        with self.lock:
+            entry = self.entries.get(thread_id)
+            if entry is None or (checkpoint_id and entry[0].checkpoint["id"] != checkpoint_id):
+                self.misses += 1
+                return None
+            self.entries.move_to_end(thread_id)
+            self.hits += 1
+            return _copy_tuple(entry[0])
+
+    def store(self, thread_id: str, value: CheckpointTuple, writes: Optional[Dict[tuple, tuple]] = None) -> None:
+        size = _approx_size(value.checkpoint["channel_values"])
+        if size > self.max_bytes:
+            return
+        value = _copy_tuple(value)
+        with self.lock:
+            current = self.entries.get(thread_id)
+            if current is not None:
+                if current[0].checkpoint["id"] > value.checkpoint["id"]:
+                    return  # a newer checkpoint is already cached
+                self.bytes -= current[1]
+            self.entries[thread_id] = (value, size, writes if writes is not None else {})
+            self.entries.move_to_end(thread_id)
+            self.bytes += size
+            while self.entries and (len(self.entries) > self.max_threads or self.bytes > self.max_bytes):
+                _, (_, evicted_size, _) = self.entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def add_writes(self, thread_id: str, checkpoint_id: str, writes: Sequence[tuple], task_id: str, task_path: str) -> None:
+        """Mirror SqliteSaver.put_writes: special channels replace, regular writes are insert-if-absent."""
+        with self.lock:
+            entry = self.entries.get(thread_id)
+            if entry is None or entry[0].checkpoint["id"] != checkpoint_id:
+                return
+            value, size, pending = entry
+            for idx, (channel, channel_value) in enumerate(writes):
+                key = (task_id, WRITES_IDX_MAP.get(channel, idx))
+                if channel in WRITES_IDX_MAP or key not in pending:
+                    pending[key] = (task_path, channel, channel_value)
+            ordered = sorted(pending.items(), key=lambda item: (item[1][0], item[0][0], item[0][1]))
+            value = value._replace(pending_writes=[(task, channel, v) for (task, _), (_, channel, v) in ordered])
+            self.entries[thread_id] = (value, size, pending)
+
+    def invalidate(self, thread_id: Optional[str] = None) -> None:
+        with self.lock:
+            if thread_id is None:
+                self.entries.clear()
+                self.bytes = 0
+                return
+            entry = self.entries.pop(thread_id, None)
+            if entry is not None:
+                self.bytes -= entry[1]
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "threads": len(self.entries),
+                "max_threads": self.max_threads,
+                "approx_bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+            }
+
+
+checkpoint_cache = CheckpointCache()
+
+
+class CachedCheckpointSaver(DelegatingCheckpointSaver):
+    """
+    Write-through cache of each thread's latest root checkpoint, so the next
+    turn on an active thread loads its state without reading SQLite.
+    """
+
+    def __init__(self, inner: BaseCheckpointSaver, cache: CheckpointCache = checkpoint_cache):
+        super().__init__(inner)
+        self.cache = cache
+
+    def _cacheable(self, config: RunnableConfig) -> bool:
+        return self.cache.enabled and not config.get("configurable", {}).get("checkpoint_ns")
+
+    def _lookup(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self.cache.get(config["configurable"]["thread_id"], get_checkpoint_id(config))
+
+    def _remember_loaded(self, config: RunnableConfig, value: Optional[CheckpointTuple]) -> None:
+        # Only a "latest" lookup is known to return the head of the thread. Heads
+        # with pending writes (an interrupted step) are rare and left uncached,
+        # since the loaded writes don't carry the indexes needed to merge new ones.
+        if value is not None and not get_checkpoint_id(config) and not value.pending_writes:
+            self.cache.store(config["configurable"]["thread_id"], value)
+
+    def _remember_put(
+        self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, next_config: RunnableConfig
+    ) -> None:
+        configurable = config["configurable"]
+        parent_id = configurable.get("checkpoint_id")
+        parent_config = (
+            {"configurable": {"thread_id": configurable["thread_id"], "checkpoint_ns": "", "checkpoint_id": parent_id}}
+            if parent_id else None
+        )
+        value = CheckpointTuple(
+            next_config, checkpoint, get_checkpoint_metadata(config, metadata), parent_config, []
+        )
+        self.cache.store(configurable["thread_id"], value)
+
+    def get_tuple(self, config):
+        if not self._cacheable(config):
+            return self.inner.get_tuple(config)
+        cached = self._lookup(config)
+        if cached is not None:
+            return cached
+        value = self.inner.get_tuple(config)
+        self._remember_loaded(config, value)
+        return value
+
+    async def aget_tuple(self, config):
+        if not self._cacheable(config):
+            return await self.inner.aget_tuple(config)
+        cached = self._lookup(config)
+        if cached is not None:
+            return cached
+        value = await self.inner.aget_tuple(config)
+        self._remember_loaded(config, value)
+        return value
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        next_config = self.inner.put(config, checkpoint, metadata, new_versions)
+        if self._cacheable(config):
+            self._remember_put(config, checkpoint, metadata, next_config)
+        return next_config
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        next_config = await self.inner.aput(config, checkpoint, metadata, new_versions)
+        if self._cacheable(config):
+            self._remember_put(config, checkpoint, metadata, next_config)
+        return next_config
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        self.inner.put_writes(config, writes, task_id, task_path)
+        if self._cacheable(config):
+            configurable = config["configurable"]
+            self.cache.add_writes(configurable["thread_id"], configurable["checkpoint_id"], writes, task_id, task_path)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        await self.inner.aput_writes(config, writes, task_id, task_path)
+        if self._cacheable(config):
+            configurable = config["configurable"]
+            self.cache.add_writes(configurable["thread_id"], configurable["checkpoint_id"], writes, task_id, task_path)
+
+    def delete_thread(self, thread_id):
+        self.cache.invalidate(thread_id)
+        self.inner.delete_thread(thread_id)
+
+    async def adelete_thread(self, thread_id):
+        self.cache.invalidate(thread_id)
+        await self.inner.adelete_thread(thread_id)
+
+    def delete_for_runs(self, run_ids):
+        self.cache.invalidate()
+        self.inner.delete_for_runs(run_ids)
+
+    async def adelete_for_runs(self, run_ids):
+        self.cache.invalidate()
+        await self.inner.adelete_for_runs(run_ids)
+
+    def copy_thread(self, source_thread_id, target_thread_id):
+        self.cache.invalidate(target_thread_id)
+        self.inner.copy_thread(source_thread_id, target_thread_id)
+
+    async def acopy_thread(self, source_thread_id, target_thread_id):
+        self.cache.invalidate(target_thread_id)
+        await self.inner.acopy_thread(source_thread_id, target_thread_id)
+
+    def prune(self, thread_ids, **kwargs):
+        for thread_id in thread_ids:
+            self.cache.invalidate(thread_id)
+        self.inner.prune(thread_ids, **kwargs)
+
+    async def aprune(self, thread_ids, **kwargs):
+        for thread_id in thread_ids:
+            self.cache.invalidate(thread_id)
+        await self.inner.aprune(thread_ids, **kwargs)
@@ -1,15 +1,78 @@
-from sqlmodel import SQLModel, create_engine, Session
+from sqlalchemy import event, inspect
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
 import os
 from dotenv import load_dotenv
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///database.db")
 
-engine = create_engine(DATABASE_URL, echo=True)
+# SQL echo is formatted and logged for every statement, so keep it opt-in
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() in ("1", "true", "yes")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
 
-def init_db():
-    SQLModel.metadata.create_all(engine)
 
-def get_session():
-    with Session(engine) as session:
-        yield session
\ No newline at end of file
+def _async_url(url: str) -> str:
+    """Map a sync database URL onto its asyncio driver (sqlite -> aiosqlite, postgresql -> asyncpg)."""
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("postgresql:"):
+        return url.replace("postgresql:", "postgresql+asyncpg:", 1)
+    return url
+
+
+ASYNC_DATABASE_URL = _async_url(DATABASE_URL)
+
+engine_kwargs = {"echo": DB_ECHO, "pool_pre_ping": True}
+# In-memory SQLite uses a single static connection, so pool sizing doesn't apply
+if ":memory:" not in ASYNC_DATABASE_URL:
+    engine_kwargs.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+
+engine = create_async_engine(ASYNC_DATABASE_URL, **engine_kwargs)
+
+if ASYNC_DATABASE_URL.startswith("sqlite"):
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers proceed while a writer holds the lock
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+def _create_all(sync_conn):
+    SQLModel.metadata.create_all(sync_conn)
+    # create_all skips tables that already exist, including any columns and
+    # indexes added to them since, so add missing nullable columns and indexes explicitly
+    inspector = inspect(sync_conn)
+    for table in SQLModel.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                column_type = column.type.compile(dialect=sync_conn.dialect)
+                sync_conn.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}')
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+
+async def init_db():
+    async with engine.begin() as conn:
+        await conn.run_sync(_create_all)
+
+
+async def close_db():
+    await engine.dispose()
+
+
+async def get_session():
+    async with async_session() as session:
+        yield session
@@ -0,0 +1,154 @@
+"""
+Per-request deadlines for graph runs.
+
+A `Deadline` is created for each agent request and carried through a context
+variable, which LangGraph copies into the threads that run sync nodes and
+tools. Nodes call `check_deadline()` before doing work and use
+`request_timeout()` to bound LLM and network calls, so a run stops
+cooperatively at the next node boundary once the deadline passes or the
+client disconnects. LangGraph has already checkpointed every finished step
+by then; `aclose_dangling_tool_calls()` answers tool calls cut off mid-step
+so the thread can continue with the next message.
+"""
+import asyncio
+import functools
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import Header, HTTPException, Request
+from langchain_core.messages import AIMessage, ToolMessage
+
+AGENT_REQUEST_TIMEOUT = float(os.getenv("AGENT_REQUEST_TIMEOUT", "300"))
+AGENT_MAX_REQUEST_TIMEOUT = float(os.getenv("AGENT_MAX_REQUEST_TIMEOUT", "900"))
+# How long a run may overshoot its deadline (e.g. inside a blocking call) before it is hard-cancelled
+DEADLINE_GRACE_SECONDS = float(os.getenv("DEADLINE_GRACE_SECONDS", "10"))
+DISCONNECT_POLL_INTERVAL = 0.5
+
+
+class DeadlineExceeded(Exception):
+    """Raised inside a graph run once its deadline has passed or it was cancelled."""
+
+
+class Deadline:
+    def __init__(self, timeout: float = AGENT_REQUEST_TIMEOUT):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+        self.cancel_reason: Optional[str] = None
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def cancel(self, reason: str = "Request cancelled") -> None:
+        self.cancel_reason = reason
+
+    def check(self) -> None:
+        if self.cancel_reason:
+            raise DeadlineExceeded(self.cancel_reason)
+        if self.remaining() <= 0:
+            raise DeadlineExceeded(f"Request deadline of {self.timeout:g}s exceeded")
+
+    def bound(self, timeout: float) -> float:
+        """Clamp a per-call timeout to what is left of the deadline."""
+        return max(0.001, min(timeout, self.remaining()))
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("current_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def check_deadline() -> None:
+    deadline = _current_deadline.get()
+    if deadline is not None:
+        deadline.check()
+
+
+def request_timeout(default: float) -> float:
+    """Timeout for a single LLM/network call: `default`, shortened to the remaining deadline."""
+    deadline = _current_deadline.get()
+    return deadline.bound(default) if deadline is not None else default
+
+
+@contextmanager
+def deadline_scope(deadline: Deadline):
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def with_deadline(deadline: Deadline, func: Callable) -> Callable:
+    """Wrap a sync callable so it runs under `deadline` (e.g. on the threadpool)."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with deadline_scope(deadline):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def request_deadline(x_request_timeout: Optional[float] = Header(None)) -> Deadline:
+    """FastAPI dependency: a deadline from the `X-Request-Timeout` header (seconds), capped by config."""
+    timeout = AGENT_REQUEST_TIMEOUT if x_request_timeout is None else x_request_timeout
+    if timeout <= 0:
+        raise HTTPException(status_code=400, detail="X-Request-Timeout must be positive.")
+    return Deadline(min(timeout, AGENT_MAX_REQUEST_TIMEOUT))
+
+
+async def run_until_disconnect(request: Request, deadline: Deadline, make_run: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Run `make_run()` under `deadline`, cancelling it when the client disconnects.
+
+    Cancellation is cooperative (the run raises `DeadlineExceeded` at its next
+    check); a run that overshoots the deadline by more than the grace period
+    is cancelled outright.
+    """
+    with deadline_scope(deadline):
+        task = asyncio.ensure_future(make_run())
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if deadline.cancel_reason is None and await request.is_disconnected():
+                deadline.cancel("Client disconnected")
+            if deadline.remaining() < -DEADLINE_GRACE_SECONDS:
+                task.cancel()
+                raise DeadlineExceeded(f"Request deadline of {deadline.timeout:g}s exceeded")
+    finally:
+        if not task.done():
+            deadline.cancel("Request cancelled")
+            task.cancel()
+
+
+def _dangling_tool_messages(values: dict, reason: str) -> list:
+    messages = values.get("messages") or []
+    answered = {m.tool_call_id for m in messages if isinstance(m, ToolMessage)}
+    last_ai = next((m for m in reversed(messages) if isinstance(m, AIMessage)), None)
+    if last_ai is None:
+        return []
+    return [
+        ToolMessage(content=f"Tool call cancelled: {reason}", tool_call_id=call["id"], name=call["name"])
+        for call in last_ai.tool_calls
+        if call["id"] not in answered
+    ]
+
+
+def close_dangling_tool_calls(graph: Any, config: dict, reason: str) -> None:
+    """Answer tool calls left unanswered by a cancelled run, so the next turn's LLM call is valid."""
+    snapshot = graph.get_state(config)
+    dangling = _dangling_tool_messages(snapshot.values or {}, reason)
+    if dangling:
+        graph.update_state(config, {"messages": dangling}, as_node="tools")
+
+
+async def aclose_dangling_tool_calls(graph: Any, config: dict, reason: str) -> None:
+    snapshot = await graph.aget_state(config)
+    dangling = _dangling_tool_messages(snapshot.values or {}, reason)
+    if dangling:
+        await graph.aupdate_state(config, {"messages": dangling}, as_node="tools")
@@ -0,0 +1,267 @@
+"""
+Local BM25 index over the documents in the sandbox.
+
+Text files and the text layer of PDFs are chunked into overlapping word
+windows and kept in an in-memory inverted index. Files are re-indexed only
+when their size or modification time changed. A search within one file
+re-checks just that file; a search across the sandbox rescans it, at most
+once per DOCUMENT_INDEX_REFRESH_INTERVAL, so the walk's cost doesn't grow
+with every search. Files the agent's file tools and save_file_pdf write,
+copy, move or delete are re-indexed as soon as the tool returns, and an
+upload makes the next search rescan. Text that needs OCR is added explicitly with
+`index_text` when it is extracted, since rescans never call the OCR service.
+
+Tools return the top-scoring chunks instead of whole documents, which keeps
+large files out of the message history. The index covers every user's
+uploads, so searches are filtered to the chunks the searching user may read.
+"""
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from langchain_core.tools import BaseTool, StructuredTool
+from pypdf import PdfReader
+
+from utils.sandbox_files import visible_to
+
+logger = logging.getLogger(__name__)
+
+SANDBOX_DIR = "sandbox"
+TEXT_EXTENSIONS = {".txt", ".md", ".csv", ".json", ".html", ".xml", ".log", ".py"}
+CHUNK_WORDS = int(os.getenv("DOCUMENT_CHUNK_WORDS", "200"))
+CHUNK_OVERLAP = int(os.getenv("DOCUMENT_CHUNK_OVERLAP", "40"))
+# Files larger than this are not read by rescans
+DOCUMENT_INDEX_MAX_BYTES = int(os.getenv("DOCUMENT_INDEX_MAX_BYTES", str(50 * 1024 * 1024)))
+# Seconds between full sandbox rescans triggered by searches
+DOCUMENT_INDEX_REFRESH_INTERVAL = float(os.getenv("DOCUMENT_INDEX_REFRESH_INTERVAL", "30"))
+# FileManagementToolkit tools that change files, and the arguments naming them (relative to the sandbox)
+FILE_WRITING_TOOLS = {"copy_file", "file_delete", "move_file", "write_file"}
+FILE_TOOL_PATH_ARGS = ("file_path", "source_path", "destination_path")
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the this to was were will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+def chunk_text(text: str, size: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """Split text into windows of `size` words overlapping by `overlap` words."""
+    words = text.split()
+    if not words:
+        return []
+    step = max(1, size - overlap)
+    return [" ".join(words[start:start + size]) for start in range(0, max(1, len(words) - overlap), step)]
+
+
+def read_document_text(path: str) -> Optional[str]:
+    """Text of a file without OCR, or None for types that need it."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in TEXT_EXTENSIONS:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            return f.read()
+    if extension == ".pdf":
+        reader = PdfReader(path)
+        return "\n".join(page.extract_text() or "" for page in reader.pages)
+    return None
+
+
+@dataclass
+class Chunk:
+    path: str
+    ordinal: int
+    text: str
+    length: int
+    terms: Counter
+
+
+class DocumentIndex:
+    def __init__(self, root: str = SANDBOX_DIR, refresh_interval: float = DOCUMENT_INDEX_REFRESH_INTERVAL):
+        self.root = root
+        self.refresh_interval = refresh_interval
+        self._last_refresh: Optional[float] = None
+        self.lock = threading.Lock()
+        self.chunks: Dict[int, Chunk] = {}
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.documents: Dict[str, List[int]] = {}
+        # path -> (size, mtime) of the file version last indexed, or skipped as unreadable
+        self.versions: Dict[str, Tuple[int, float]] = {}
+        self.total_length = 0
+        self._next_id = 0
+
+    def relative(self, path: str) -> str:
+        """Index key for a path given relative to the sandbox or to the working directory."""
+        if not os.path.isabs(path) and not os.path.exists(path):
+            path = os.path.join(self.root, path)
+        return os.path.relpath(os.path.abspath(path), os.path.abspath(self.root))
+
+    def _version(self, key: str) -> Optional[Tuple[int, float]]:
+        try:
+            stat = os.stat(os.path.join(self.root, key))
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime
+
+    def _remove(self, key: str) -> None:
+        for chunk_id in self.documents.pop(key, []):
+            chunk = self.chunks.pop(chunk_id)
+            self.total_length -= chunk.length
+            for term in chunk.terms:
+                postings = self.postings[term]
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self.postings[term]
+        self.versions.pop(key, None)
+
+    def _add(self, key: str, text: str, version: Optional[Tuple[int, float]]) -> None:
+        self._remove(key)
+        ids = []
+        for ordinal, chunk in enumerate(chunk_text(text)):
+            terms = Counter(tokenize(chunk))
+            if not terms:
+                continue
+            chunk_id = self._next_id
+            self._next_id += 1
+            length = sum(terms.values())
+            self.chunks[chunk_id] = Chunk(key, ordinal, chunk, length, terms)
+            for term, count in terms.items():
+                self.postings[term][chunk_id] = count
+            self.total_length += length
+            ids.append(chunk_id)
+        self.documents[key] = ids
+        if version is not None:
+            self.versions[key] = version
+
+    def index_text(self, path: str, text: str) -> None:
+        """Index text extracted from a file (e.g. by OCR) for its current version."""
+        key = self.relative(path)
+        with self.lock:
+            self._add(key, text, self._version(key))
+
+    def refresh_file(self, key: str) -> None:
+        """Re-index one file if it changed, or drop it if it is gone."""
+        version = self._version(key)
+        if version is None:
+            with self.lock:
+                self._remove(key)
+            return
+        if self.versions.get(key) == version:
+            return
+        text = None
+        if version[0] <= DOCUMENT_INDEX_MAX_BYTES:
+            try:
+                text = read_document_text(os.path.join(self.root, key))
+            except Exception as e:
+                logger.warning("Could not index %s: %s", key, e)
+        with self.lock:
+            if text is not None and (text.strip() or key not in self.documents):
+                self._add(key, text, version)
+            else:
+                # Not readable without OCR: keep any text indexed for it earlier, don't retry this version
+                self.versions[key] = version
+
+    def refresh(self) -> None:
+        """Re-index new and changed files and drop deleted ones."""
+        self._last_refresh = time.monotonic()
+        present: Set[str] = set()
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                key = os.path.relpath(os.path.join(directory, name), self.root)
+                present.add(key)
+                self.refresh_file(key)
+        with self.lock:
+            for key in (set(self.documents) | set(self.versions)) - present:
+                self._remove(key)
+
+    def refresh_paths(self, *names: str) -> None:
+        """Re-index files just written, copied, moved or deleted, given relative to the sandbox."""
+        for name in names:
+            key = os.path.normpath(name)
+            if key == os.pardir or key.startswith(os.pardir + os.sep) or os.path.isabs(key):
+                continue
+            if os.path.isdir(os.path.join(self.root, key)):
+                self.mark_stale()  # a moved or copied directory: let the next search rescan
+            else:
+                self.refresh_file(key)
+
+    def mark_stale(self) -> None:
+        """Make the next search rescan the sandbox, e.g. after an upload."""
+        self._last_refresh = None
+
+    def refresh_if_stale(self) -> None:
+        if self._last_refresh is None or time.monotonic() - self._last_refresh >= self.refresh_interval:
+            self.refresh()
+
+    def search(
+        self, query: str, k: int = 5, path: Optional[str] = None, username: Optional[str] = None
+    ) -> List[Tuple[float, Chunk]]:
+        """Top `k` chunks by BM25 score among those visible to `username`, optionally within one file."""
+        key = self.relative(path) if path else None
+        if key is not None:
+            if key == os.pardir or key.startswith(os.pardir + os.sep) or not visible_to(key, username):
+                return []  # outside the sandbox, or another user's upload
+            self.refresh_file(key)
+        else:
+            self.refresh_if_stale()
+        with self.lock:
+            count = len(self.chunks)
+            if not count:
+                return []
+            average_length = self.total_length / count
+            scores: Dict[int, float] = defaultdict(float)
+            visible: Dict[str, bool] = {}
+
+            def readable(chunk_path: str) -> bool:
+                if chunk_path not in visible:
+                    visible[chunk_path] = visible_to(chunk_path, username)
+                return visible[chunk_path]
+
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    chunk = self.chunks[chunk_id]
+                    if key is not None:
+                        if chunk.path != key:
+                            continue
+                    elif not readable(chunk.path):
+                        continue
+                    norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * chunk.length / average_length)
+                    scores[chunk_id] += idf * tf * (BM25_K1 + 1) / norm
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [(score, self.chunks[chunk_id]) for chunk_id, score in best]
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"documents": len(self.documents), "chunks": len(self.chunks), "terms": len(self.postings)}
+
+
+document_index = DocumentIndex()
+
+
+def indexing_file_tool(tool: BaseTool, index: Optional[DocumentIndex] = None) -> BaseTool:
+    """Wrap a FileManagementToolkit tool that changes files so the files it touched are re-indexed right away."""
+    if tool.name not in FILE_WRITING_TOOLS:
+        return tool
+
+    def run(**kwargs: Any) -> Any:
+        result = tool.invoke(kwargs)
+        (index or document_index).refresh_paths(*(kwargs[name] for name in FILE_TOOL_PATH_ARGS if kwargs.get(name)))
+        return result
+
+    return StructuredTool.from_function(
+        func=run, name=tool.name, description=tool.description, args_schema=tool.args_schema
+    )
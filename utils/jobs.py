@@ -0,0 +1,191 @@
+"""
+Background job runner for long Sidekick runs.
+
+Submitting a job returns immediately. Each job then waits for its user's
+turn in the fair scheduler (utils.scheduler), alongside that user's
+interactive runs, so one user's pile of jobs can't hold up everyone else's.
+Once running, the job records status, progress (current node and worker
+iteration) and the result in the `job` table. Jobs that were queued or
+running when the process stopped are picked up again on startup and resume
+from the thread's last checkpoint.
+"""
+import asyncio
+import json
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlmodel import SQLModel, Field, select, col
+
+from utils.database import async_session
+from utils.deadline import aclose_dangling_tool_calls
+from utils.profiling import run_profiler
+from utils.scheduler import fair_scheduler
+from utils.security import THREAD_ID_SEPARATOR
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_STATUSES = (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class Job(SQLModel, table=True):
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex, primary_key=True)
+    username: str = Field(index=True)
+    chat_id: str
+    message: str
+    # JSON list of uploaded file paths
+    documents: Optional[str] = None
+    status: str = Field(default=JOB_QUEUED, index=True)
+    current_node: Optional[str] = None
+    iteration: int = 0
+    # Latest checkpoint of the thread before this job first ran; tells a
+    # resumed job whether the graph already made progress on its input
+    base_checkpoint_id: Optional[str] = None
+    result: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=_now, nullable=False)
+    updated_at: datetime = Field(default_factory=_now, nullable=False)
+
+    @property
+    def thread_id(self) -> str:
+        return f"{self.username}{THREAD_ID_SEPARATOR}{self.chat_id}"
+
+    @property
+    def document_paths(self) -> List[str]:
+        return json.loads(self.documents) if self.documents else []
+
+
+class JobManager:
+    def __init__(self, sidekick: Any):
+        self.sidekick = sidekick
+        # job id -> task of a queued or running job
+        self.running: Dict[str, asyncio.Task] = {}
+        self._setup_lock = asyncio.Lock()
+
+    async def start(self):
+        """Re-queue jobs left over from a previous process."""
+        async with async_session() as session:
+            pending = (await session.exec(
+                select(Job)
+                .where(col(Job.status).in_([JOB_RUNNING, JOB_QUEUED]))
+                .order_by(col(Job.status).desc(), col(Job.created_at))  # running before queued
+            )).all()
+        for job in pending:
+            self._spawn(job.id)
+        if pending:
+            logger.info("Resuming %d Sidekick job(s) from a previous run.", len(pending))
+
+    async def stop(self):
+        """Stop all jobs; they keep their status and resume on the next start."""
+        tasks = list(self.running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def submit(self, username: str, chat_id: str, message: str, documents: Optional[List[str]] = None) -> Job:
+        job = Job(username=username, chat_id=chat_id, message=message, documents=json.dumps(documents) if documents else None)
+        async with async_session() as session:
+            session.add(job)
+            await session.commit()
+        self._spawn(job.id)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        async with async_session() as session:
+            return await session.get(Job, job_id)
+
+    async def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued or running job. Finished jobs are returned unchanged."""
+        job = await self.get(job_id)
+        if job is None or job.status in FINISHED_STATUSES:
+            return job
+        started = job.status == JOB_RUNNING
+        job = await self._update(job_id, status=JOB_CANCELLED)
+        task = self.running.get(job_id)
+        if task is not None:
+            # A queued job just leaves the scheduler's queue
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        if started and job is not None and self.sidekick.graph is not None:
+            # Finished steps are checkpointed; answer tool calls cut off mid-step
+            config = {"configurable": {"thread_id": job.thread_id}}
+            await aclose_dangling_tool_calls(self.sidekick.graph, config, "Job cancelled")
+        return job
+
+    async def _update(self, job_id: str, **fields) -> Optional[Job]:
+        async with async_session() as session:
+            job = await session.get(Job, job_id)
+            if job is None:
+                return None
+            for name, value in fields.items():
+                setattr(job, name, value)
+            job.updated_at = _now()
+            session.add(job)
+            await session.commit()
+            return job
+
+    def _spawn(self, job_id: str) -> None:
+        task = asyncio.create_task(self._execute(job_id))
+        self.running[job_id] = task
+        task.add_done_callback(lambda _: self.running.pop(job_id, None))
+
+    async def _execute(self, job_id: str):
+        try:
+            job = await self.get(job_id)
+            if job is None or job.status in FINISHED_STATUSES:
+                return
+            # Jobs are persisted, so they may wait beyond the scheduler's per-user queue limit
+            async with fair_scheduler.slot(job.username, bounded=False):
+                job = await self.get(job_id)
+                if job is not None and job.status not in FINISHED_STATUSES:
+                    await self._run(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Sidekick job %s could not be run", job_id)
+
+    async def _run(self, job: Job):
+        # Set up lazily so the app starts even when the Sidekick tools aren't configured
+        async with self._setup_lock:
+            if self.sidekick.graph is None:
+                await self.sidekick.setup()
+        graph = self.sidekick.graph
+        config = {"configurable": {"thread_id": job.thread_id}}
+        snapshot = await graph.aget_state(config)
+        latest_checkpoint = snapshot.config["configurable"].get("checkpoint_id")
+
+        graph_input: Any = self.sidekick.initial_state(job.message, documents=job.document_paths)
+        if job.status == JOB_RUNNING and latest_checkpoint != job.base_checkpoint_id:
+            # Interrupted after making progress: continue from the last checkpoint,
+            # or just collect the result if the run had already finished
+            graph_input = None if snapshot.next else False
+        else:
+            job = await self._update(job.id, status=JOB_RUNNING, base_checkpoint_id=latest_checkpoint) or job
+
+        iteration = job.iteration
+        try:
+            if graph_input is not False:
+                async with run_profiler.profile("sidekick-job", job.username):
+                    async for update in graph.astream(graph_input, config=config, stream_mode="updates"):
+                        for node in update:
+                            if node == "worker":
+                                iteration += 1
+                            await self._update(job.id, current_node=node, iteration=iteration)
+            final = await graph.aget_state(config)
+            result = final.values["messages"][-2].content  # the agent's response, not the evaluator feedback
+            await self._update(job.id, status=JOB_SUCCEEDED, result=result, current_node=None)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("Sidekick job %s failed", job.id)
+            await self._update(job.id, status=JOB_FAILED, error=f"Sidekick Agent error: {str(e)}")
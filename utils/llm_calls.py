@@ -0,0 +1,216 @@
+"""
+Retried and hedged LLM calls.
+
+Every model call made through the ModelRouter goes through a ResilientCaller.
+Transient failures (connection errors, timeouts, 429 and 5xx responses) are
+retried with full-jitter exponential backoff within the request deadline.
+With hedging enabled, a duplicate request is sent when the first has not
+returned within the observed p95 latency for that node and model, and the
+first response to arrive is used. A budget caps hedges to a fraction of
+calls so a slow provider isn't hit with double load.
+
+Latency is tracked both for the first request of each call and for the
+response actually served, so the stats show what hedging does to the tail.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from typing import Any, Deque, Dict, Hashable, Optional
+
+import httpx
+import openai
+
+from utils.deadline import DeadlineExceeded, check_deadline, current_deadline, request_timeout
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+LLM_HEDGING = os.getenv("LLM_HEDGING", "false").lower() in ("1", "true", "yes")
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+# Hedges allowed as a fraction of calls
+LLM_HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.05"))
+# Latency samples needed before a call may be hedged, and the floor of the hedge delay
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1.0"))
+LLM_HEDGE_WORKERS = int(os.getenv("LLM_HEDGE_WORKERS", "16"))
+LATENCY_WINDOW = 500
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, DeadlineExceeded):
+        return False
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError, httpx.TransportError, TimeoutError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return status_code in RETRYABLE_STATUS_CODES
+
+
+def backoff_delay(attempt: int, base: float = LLM_RETRY_BASE_DELAY, cap: float = LLM_RETRY_MAX_DELAY) -> float:
+    """Full-jitter exponential backoff for the given retry (1-based)."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def percentile(samples, quantile: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+class LatencyStats:
+    def __init__(self):
+        self.primary: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.served: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+
+class ResilientCaller:
+    def __init__(
+        self,
+        max_retries: int = LLM_MAX_RETRIES,
+        hedging: bool = LLM_HEDGING,
+        hedge_quantile: float = LLM_HEDGE_QUANTILE,
+        hedge_budget: float = LLM_HEDGE_BUDGET,
+        hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+        hedge_min_delay: float = LLM_HEDGE_MIN_DELAY,
+    ):
+        self.max_retries = max_retries
+        self.hedging = hedging
+        self.hedge_quantile = hedge_quantile
+        self.hedge_budget = hedge_budget
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.lock = threading.Lock()
+        self.stats: Dict[Hashable, LatencyStats] = defaultdict(LatencyStats)
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self.lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=LLM_HEDGE_WORKERS, thread_name_prefix="llm-hedge")
+            return self._executor
+
+    def invoke(self, runnable: Any, messages: Any, key: Hashable = "default", **kwargs) -> Any:
+        """Invoke `runnable` with retries on transient errors, hedging slow attempts when enabled."""
+        timeout = kwargs.pop("timeout", None)
+        started = time.perf_counter()
+        with self.lock:
+            self.stats[key].calls += 1
+        attempt = 0
+        while True:
+            check_deadline()
+            call_kwargs = dict(kwargs)
+            if timeout is not None:
+                call_kwargs["timeout"] = request_timeout(timeout)
+            try:
+                response = self._attempt(runnable, messages, key, call_kwargs)
+                with self.lock:
+                    self.stats[key].served.append(time.perf_counter() - started)
+                return response
+            except Exception as e:
+                attempt += 1
+                if not is_retryable(e) or attempt > self.max_retries:
+                    with self.lock:
+                        self.stats[key].failures += 1
+                    raise
+                delay = backoff_delay(attempt)
+                deadline = current_deadline()
+                if deadline is not None and deadline.remaining() <= delay:
+                    with self.lock:
+                        self.stats[key].failures += 1
+                    raise
+                with self.lock:
+                    self.stats[key].retries += 1
+                logger.warning("LLM call %s failed (%s); retry %d in %.2fs", key, e, attempt, delay)
+                time.sleep(delay)
+
+    def _attempt(self, runnable: Any, messages: Any, key: Hashable, kwargs: Dict[str, Any]) -> Any:
+        hedge_after = self._hedge_delay(key)
+        if hedge_after is None:
+            started = time.perf_counter()
+            response = runnable.invoke(messages, **kwargs)
+            with self.lock:
+                self.stats[key].primary.append(time.perf_counter() - started)
+            return response
+
+        primary = self._submit(runnable, messages, kwargs, key, record_primary=True)
+        done, _ = wait([primary], timeout=hedge_after)
+        if done or not self._take_hedge(key):
+            return primary.result()
+
+        logger.info("LLM call %s slower than %.2fs; sending a hedged request", key, hedge_after)
+        hedge = self._submit(runnable, messages, kwargs, key, record_primary=False)
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        with self.lock:
+                            self.stats[key].hedge_wins += 1
+                    # The slower request can't be aborted; its result is discarded
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _submit(self, runnable: Any, messages: Any, kwargs: Dict[str, Any], key: Hashable, record_primary: bool) -> Future:
+        context = copy_context()  # keep the request deadline in the worker thread
+        started = time.perf_counter()
+        future = self.executor.submit(context.run, runnable.invoke, messages, **kwargs)
+        if record_primary:
+            def record(_future: Future):
+                with self.lock:
+                    self.stats[key].primary.append(time.perf_counter() - started)
+            future.add_done_callback(record)
+        return future
+
+    def _hedge_delay(self, key: Hashable) -> Optional[float]:
+        if not self.hedging:
+            return None
+        with self.lock:
+            samples = list(self.stats[key].primary)
+        if len(samples) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, percentile(samples, self.hedge_quantile))
+
+    def _take_hedge(self, key: Hashable) -> bool:
+        with self.lock:
+            stats = self.stats[key]
+            if stats.hedges + 1 > self.hedge_budget * stats.calls:
+                return False
+            stats.hedges += 1
+            return True
+
+    def latency_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            result = {}
+            for key, stats in self.stats.items():
+                name = ":".join(map(str, key)) if isinstance(key, tuple) else str(key)
+                result[name] = {
+                    "calls": stats.calls,
+                    "retries": stats.retries,
+                    "failures": stats.failures,
+                    "hedges": stats.hedges,
+                    "hedge_wins": stats.hedge_wins,
+                    "primary_ms": {q: 1000 * percentile(stats.primary, p) for q, p in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))},
+                    "served_ms": {q: 1000 * percentile(stats.served, p) for q, p in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))},
+                }
+            return result
+
+
+llm_caller = ResilientCaller()
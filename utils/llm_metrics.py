@@ -0,0 +1,57 @@
+"""
+Per-node LLM usage metrics.
+
+Records prompt and cached prompt tokens reported by the provider for every
+call a graph node makes, so the prompt-cache hit ratio of each node can be
+tracked over time.
+"""
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Optional, Tuple
+
+
+def usage_tokens(message: Any) -> Optional[Tuple[int, int]]:
+    """(prompt tokens, cached prompt tokens) reported for an LLM response, or None if absent."""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        details = usage.get("input_token_details") or {}
+        return usage.get("input_tokens", 0), details.get("cache_read", 0) or 0
+    token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage")
+    if token_usage:
+        details = token_usage.get("prompt_tokens_details") or {}
+        return token_usage.get("prompt_tokens", 0), details.get("cached_tokens", 0) or 0
+    return None
+
+
+class LLMMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.nodes: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "cache_hits": 0}
+        )
+
+    def record(self, node: str, message: Any) -> None:
+        tokens = usage_tokens(message)
+        if tokens is None:
+            return
+        prompt_tokens, cached_tokens = tokens
+        with self.lock:
+            stats = self.nodes[node]
+            stats["calls"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["cached_tokens"] += cached_tokens
+            stats["cache_hits"] += int(cached_tokens > 0)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self.lock:
+            return {
+                node: {
+                    **stats,
+                    "cached_token_ratio": stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0,
+                    "cache_hit_rate": stats["cache_hits"] / stats["calls"] if stats["calls"] else 0.0,
+                }
+                for node, stats in self.nodes.items()
+            }
+
+
+llm_metrics = LLMMetrics()
@@ -0,0 +1,74 @@
+"""
+Compact wire format for chat messages.
+
+API responses carry only what the frontend renders (role, content, id,
+timestamp and any tool calls) instead of LangChain message objects with their
+response_metadata, additional_kwargs and usage blocks. Encoding works on the
+stored `message_to_dict` payloads, so no message objects are constructed.
+"""
+import gzip
+from typing import Any, Dict, Optional
+
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+
+# Compress responses at least this large when the client accepts gzip
+GZIP_MIN_SIZE = 1024
+GZIP_LEVEL = 5
+
+ROLE_BY_TYPE = {"human": "user", "ai": "assistant", "system": "system", "tool": "tool"}
+
+
+def encode_message_payload(payload: Dict[str, Any], timestamp: Optional[str] = None) -> Dict[str, Any]:
+    """Project a `message_to_dict` payload onto the compact wire schema."""
+    data = payload.get("data", {})
+    encoded = {
+        "role": ROLE_BY_TYPE.get(payload.get("type", ""), payload.get("type")),
+        "content": data.get("content"),
+        "id": data.get("id"),
+        "timestamp": timestamp,
+    }
+    tool_calls = data.get("tool_calls")
+    if tool_calls:
+        encoded["tool_calls"] = [
+            {"id": call.get("id"), "name": call.get("name"), "args": call.get("args")} for call in tool_calls
+        ]
+    return encoded
+
+
+def accepts_encoding(request: Request, coding: str = "gzip") -> bool:
+    """
+    Whether the request's Accept-Encoding allows `coding`, honouring q-values.
+
+    `gzip;q=0` refuses gzip; `*` covers codings not listed explicitly.
+    """
+    wildcard = None
+    for item in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name == coding:
+            return quality > 0
+        if name == "*":
+            wildcard = quality > 0
+    return bool(wildcard)
+
+
+def json_response(request: Request, content: Any, status_code: int = 200) -> Response:
+    """Serialize with orjson, gzip-compressing large bodies for clients that accept it."""
+    body = orjson.dumps(content)
+    headers = {"Vary": "Accept-Encoding"}
+    if len(body) >= GZIP_MIN_SIZE and accepts_encoding(request, "gzip"):
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
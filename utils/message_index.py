@@ -0,0 +1,179 @@
+"""
+Message-level index of thread history.
+
+Every message a graph checkpoints is also written as one row of
+`thread_messages` (in memory.db, next to the checkpoints), keyed by a
+per-thread sequence number. Message history endpoints page through this
+table with `before`/`limit` cursors instead of deserializing the thread's
+whole checkpoint. Threads checkpointed before the index existed are
+backfilled from their state once; `indexed_threads` remembers that, even
+for threads that turned out to have no messages.
+
+The connection is opened on first use and shared by the threads the
+checkpointer and the endpoints run on, so every access holds `lock`.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, message_to_dict
+
+MESSAGE_INDEX_DB = "memory.db"
+# Threads whose known message ids are kept in memory to skip re-writing unchanged messages
+KNOWN_THREADS_CACHE_SIZE = 1024
+
+
+def is_visible_message(message: BaseMessage) -> bool:
+    """Messages shown in chat history: user input and model replies (not evaluator feedback or tool traffic)."""
+    if isinstance(message, HumanMessage):
+        return True
+    return isinstance(message, AIMessage) and bool(message.response_metadata)
+
+
+def _content_hash(message: BaseMessage) -> str:
+    return hashlib.blake2b(repr(message.content).encode(), digest_size=8).hexdigest()
+
+
+class MessageIndex:
+    def __init__(self, db_path: str = MESSAGE_INDEX_DB):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self.lock = threading.Lock()
+        # thread_id -> {message_id: content hash} for recently written threads
+        self._known: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The shared connection, opened on first use; callers must hold `lock`."""
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS thread_messages (
+                    thread_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    message_id TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    visible INTEGER NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    PRIMARY KEY (thread_id, seq),
+                    UNIQUE (thread_id, message_id)
+                );
+                CREATE INDEX IF NOT EXISTS ix_thread_messages_visible
+                    ON thread_messages (thread_id, visible, seq);
+                CREATE TABLE IF NOT EXISTS indexed_threads (
+                    thread_id TEXT PRIMARY KEY,
+                    backfilled_at TEXT NOT NULL
+                );
+            """)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _known_ids(self, thread_id: str) -> Dict[str, str]:
+        known = self._known.get(thread_id)
+        if known is None:
+            rows = self.conn.execute(
+                "SELECT message_id, content_hash FROM thread_messages WHERE thread_id = ?", (thread_id,)
+            ).fetchall()
+            known = dict(rows)
+            self._known[thread_id] = known
+            if len(self._known) > KNOWN_THREADS_CACHE_SIZE:
+                self._known.popitem(last=False)
+        else:
+            self._known.move_to_end(thread_id)
+        return known
+
+    def index_messages(self, thread_id: str, messages: List[BaseMessage]) -> None:
+        """Append new messages of a thread and refresh any whose content changed."""
+        with self.lock:
+            known = self._known_ids(thread_id)
+            changed = []
+            for message in messages:
+                if not message.id:
+                    continue
+                digest = _content_hash(message)
+                if known.get(message.id) != digest:
+                    changed.append((message, digest))
+            if not changed:
+                return
+            (next_seq,) = self.conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM thread_messages WHERE thread_id = ?", (thread_id,)
+            ).fetchone()
+            now = datetime.now(timezone.utc).isoformat()
+            for message, digest in changed:
+                payload = json.dumps(message_to_dict(message), default=str)
+                if message.id in known:
+                    self.conn.execute(
+                        "UPDATE thread_messages SET content_hash = ?, payload = ?, visible = ? "
+                        "WHERE thread_id = ? AND message_id = ?",
+                        (digest, payload, int(is_visible_message(message)), thread_id, message.id),
+                    )
+                else:
+                    self.conn.execute(
+                        "INSERT INTO thread_messages "
+                        "(thread_id, seq, message_id, type, visible, content_hash, payload, created_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (thread_id, next_seq, message.id, message.type, int(is_visible_message(message)),
+                         digest, payload, now),
+                    )
+                    next_seq += 1
+                known[message.id] = digest
+            self.conn.commit()
+
+    def has_thread(self, thread_id: str) -> bool:
+        """Whether the thread's history is in the index: it has rows, or it was backfilled (possibly empty)."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM thread_messages WHERE thread_id = ? "
+                "UNION ALL SELECT 1 FROM indexed_threads WHERE thread_id = ? LIMIT 1",
+                (thread_id, thread_id),
+            ).fetchone()
+        return row is not None
+
+    def mark_backfilled(self, thread_id: str) -> None:
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO indexed_threads (thread_id, backfilled_at) VALUES (?, ?)",
+                (thread_id, datetime.now(timezone.utc).isoformat()),
+            )
+            self.conn.commit()
+
+    def page(
+        self, thread_id: str, before: Optional[int], limit: int
+    ) -> Tuple[List[Tuple[int, str, str]], int, Optional[int]]:
+        """
+        Return up to `limit` visible messages older than sequence `before` (newest window when None).
+
+        Rows are (seq, created_at, payload) in chronological order, along with
+        the thread's total visible count and the cursor for the next older page.
+        """
+        with self.lock:
+            (total,) = self.conn.execute(
+                "SELECT COUNT(*) FROM thread_messages WHERE thread_id = ? AND visible = 1", (thread_id,)
+            ).fetchone()
+            rows = self.conn.execute(
+                "SELECT seq, created_at, payload FROM thread_messages "
+                "WHERE thread_id = ? AND visible = 1 AND seq < ? ORDER BY seq DESC LIMIT ?",
+                (thread_id, before if before is not None else 2 ** 62, limit + 1),
+            ).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        rows.reverse()
+        next_before = rows[0][0] if has_more and rows else None
+        return rows, total, next_before
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self.lock:
+            self.conn.execute("DELETE FROM thread_messages WHERE thread_id = ?", (thread_id,))
+            self.conn.execute("DELETE FROM indexed_threads WHERE thread_id = ?", (thread_id,))
+            self.conn.commit()
+            self._known.pop(thread_id, None)
+
+
+message_index = MessageIndex()
@@ -0,0 +1,248 @@
+"""
+Small-to-large model cascade.
+
+A ModelRouter holds an ordered list of model tiers, cheapest first. A call
+starts at the requested tier and moves up one tier whenever the response
+fails validation: a malformed tool call, an unparseable structured output, a
+truncated or empty reply. Callers can also start later calls at a higher
+tier, which is how the Sidekick escalates after the evaluator rejects an
+answer. Latency, cost and escalations are recorded per node and tier.
+Each tier's call is retried and hedged by the ResilientCaller in
+utils.llm_calls, so escalation only reacts to bad output, not transient errors. A
+`timeout` is the budget of each tier's call, re-derived from what is left of
+the request deadline before every tier, so an escalated call never outlives
+the run. Token usage is charged to the current user's scheduler quota
+(utils.scheduler).
+
+Tiers are any chat models, so the router runs offline with fake models.
+"""
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional, Sequence, Tuple
+
+from langchain_core.language_models import BaseChatModel
+
+from utils.deadline import check_deadline, request_timeout
+from utils.llm_calls import ResilientCaller, llm_caller
+from utils.llm_metrics import llm_metrics
+from utils.scheduler import fair_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated model names, cheapest first
+LLM_TIERS = os.getenv("LLM_TIERS", "gpt-4o-mini,gpt-4o")
+# USD per million input/output tokens, as "model=input/output,..."; overrides the defaults below
+LLM_TIER_PRICES = os.getenv("LLM_TIER_PRICES", "")
+
+DEFAULT_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+}
+
+
+def parse_prices(spec: str) -> Dict[str, Tuple[float, float]]:
+    prices = dict(DEFAULT_PRICES)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        input_price, _, output_price = value.partition("/")
+        prices[name.strip()] = (float(input_price), float(output_price or input_price))
+    return prices
+
+
+@dataclass
+class ModelTier:
+    name: str
+    model: BaseChatModel
+    input_price: float = 0.0   # USD per million tokens
+    output_price: float = 0.0
+
+    def cost(self, response: Any) -> float:
+        usage = getattr(response, "usage_metadata", None) or {}
+        return (usage.get("input_tokens", 0) * self.input_price
+                + usage.get("output_tokens", 0) * self.output_price) / 1_000_000
+
+
+def validation_error(response: Any) -> Optional[str]:
+    """Why a response should be retried on a stronger model, or None if it is usable."""
+    if isinstance(response, dict) and "raw" in response:
+        # with_structured_output(include_raw=True)
+        if response.get("parsing_error") is not None or response.get("parsed") is None:
+            return "invalid structured output"
+        return None
+    if getattr(response, "invalid_tool_calls", None):
+        return "malformed tool call"
+    if (getattr(response, "response_metadata", None) or {}).get("finish_reason") == "length":
+        return "truncated response"
+    if not getattr(response, "content", None) and not getattr(response, "tool_calls", None):
+        return "empty response"
+    return None
+
+
+def raw_message(response: Any) -> Any:
+    if isinstance(response, dict) and "raw" in response:
+        return response["raw"]
+    return response
+
+
+class ModelRouterMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # node -> tier name -> counters
+        self.tiers: Dict[str, Dict[str, Dict[str, float]]] = defaultdict(lambda: defaultdict(
+            lambda: {"calls": 0, "latency_seconds": 0.0, "cost_usd": 0.0, "escalations": 0}
+        ))
+        self.requests: Dict[str, Dict[str, int]] = defaultdict(lambda: {"requests": 0, "escalated": 0})
+        self.reasons: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def record_call(self, node: str, tier: str, latency: float, cost: float) -> None:
+        with self.lock:
+            stats = self.tiers[node][tier]
+            stats["calls"] += 1
+            stats["latency_seconds"] += latency
+            stats["cost_usd"] += cost
+
+    def record_escalation(self, node: str, tier: str, reason: str) -> None:
+        with self.lock:
+            self.tiers[node][tier]["escalations"] += 1
+            self.reasons[node][reason] += 1
+
+    def record_request(self, node: str, escalated: bool) -> None:
+        with self.lock:
+            self.requests[node]["requests"] += 1
+            self.requests[node]["escalated"] += int(escalated)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            result = {}
+            for node, tiers in self.tiers.items():
+                requests = self.requests[node]
+                result[node] = {
+                    "requests": requests["requests"],
+                    "escalation_rate": requests["escalated"] / requests["requests"] if requests["requests"] else 0.0,
+                    "escalation_reasons": dict(self.reasons[node]),
+                    "tiers": {
+                        tier: {
+                            "calls": int(stats["calls"]),
+                            "mean_latency_ms": 1000 * stats["latency_seconds"] / stats["calls"] if stats["calls"] else 0.0,
+                            "cost_usd": round(stats["cost_usd"], 6),
+                            "escalations": int(stats["escalations"]),
+                            "escalation_rate": stats["escalations"] / stats["calls"] if stats["calls"] else 0.0,
+                        }
+                        for tier, stats in tiers.items()
+                    },
+                }
+            return result
+
+
+model_router_metrics = ModelRouterMetrics()
+
+
+class ModelRouter:
+    def __init__(
+        self,
+        tiers: Sequence[ModelTier],
+        metrics: ModelRouterMetrics = model_router_metrics,
+        caller: ResilientCaller = llm_caller,
+    ):
+        if not tiers:
+            raise ValueError("ModelRouter needs at least one tier.")
+        self.tiers = list(tiers)
+        self.metrics = metrics
+        self.caller = caller
+        self._prepared: Dict[Tuple[Hashable, int], Any] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, tiers: str = LLM_TIERS, prices: str = LLM_TIER_PRICES, **model_kwargs) -> "ModelRouter":
+        """One ChatOpenAI per model named in LLM_TIERS."""
+        from langchain_openai import ChatOpenAI
+
+        # Retries are done by the ResilientCaller, which also hedges and respects the deadline
+        model_kwargs.setdefault("max_retries", 0)
+        price_table = parse_prices(prices)
+        return cls([
+            ModelTier(name, ChatOpenAI(model=name, **model_kwargs), *price_table.get(name, (0.0, 0.0)))
+            for name in (part.strip() for part in tiers.split(",")) if name
+        ])
+
+    @property
+    def top_tier(self) -> int:
+        return len(self.tiers) - 1
+
+    def _runnable(self, index: int, prepare: Optional[Callable[[BaseChatModel], Any]], cache_key: Optional[Hashable]) -> Any:
+        model = self.tiers[index].model
+        if prepare is None:
+            return model
+        if cache_key is None:
+            return prepare(model)
+        with self._lock:
+            runnable = self._prepared.get((cache_key, index))
+            if runnable is None:
+                runnable = prepare(model)
+                self._prepared[(cache_key, index)] = runnable
+            return runnable
+
+    def invoke(self, node: str, messages: Any, **kwargs) -> Any:
+        return self.invoke_with_tier(node, messages, **kwargs)[0]
+
+    def invoke_with_tier(
+        self,
+        node: str,
+        messages: Any,
+        *,
+        start_tier: int = 0,
+        prepare: Optional[Callable[[BaseChatModel], Any]] = None,
+        cache_key: Optional[Hashable] = None,
+        validate: Callable[[Any], Optional[str]] = validation_error,
+        **kwargs,
+    ) -> Tuple[Any, int]:
+        """
+        Invoke the cascade from `start_tier`, escalating while responses fail `validate`.
+
+        `prepare` turns a tier's model into the runnable to call (binding tools or
+        a structured output schema); pass `cache_key` to build it once per tier.
+        `timeout` is each tier's call budget, shortened to the remaining deadline.
+        The top tier's response is returned even if it fails validation.
+        Returns the response and the index of the tier that produced it.
+        """
+        index = min(max(start_tier, 0), self.top_tier)
+        escalated = False
+        timeout = kwargs.pop("timeout", None)
+        while True:
+            check_deadline()
+            tier = self.tiers[index]
+            runnable = self._runnable(index, prepare, cache_key)
+            if timeout is not None:
+                kwargs["timeout"] = request_timeout(timeout)
+            started = time.perf_counter()
+            response = self.caller.invoke(runnable, messages, key=(node, tier.name), **kwargs)
+            latency = time.perf_counter() - started
+            raw = raw_message(response)
+            self.metrics.record_call(node, tier.name, latency, tier.cost(raw))
+            llm_metrics.record(node, raw)
+            fair_scheduler.record_usage(raw)
+
+            reason = validate(response)
+            if reason is None or index == self.top_tier:
+                if reason is not None:
+                    logger.warning("%s: %s from top tier %s", node, reason, tier.name)
+                self.metrics.record_request(node, escalated)
+                return response, index
+            logger.info("%s: %s from %s, escalating", node, reason, tier.name)
+            self.metrics.record_escalation(node, tier.name, reason)
+            escalated = True
+            index += 1
+
+    def escalate(self, node: str, tier: int, reason: str) -> int:
+        """Record an escalation decided by the caller and return the next tier to start from."""
+        if tier >= self.top_tier:
+            return self.top_tier
+        self.metrics.record_escalation(node, self.tiers[tier].name, reason)
+        return tier + 1
@@ -0,0 +1,432 @@
+"""
+Durable outbox for push, Telegram and SMS/WhatsApp notifications.
+
+The notification tools only write a row to a local SQLite outbox and return,
+so a tool step no longer waits on a provider round trip. A background
+dispatcher, started with the app, delivers queued messages:
+
+- Messages for the same channel and recipient that are due together are
+  joined into one request (up to the provider's message length), after a
+  short delay that lets a burst of messages collect.
+- Failed deliveries are retried with jittered exponential backoff; errors
+  that won't go away on a retry (4xx responses other than 429, missing
+  credentials) fail the message at once.
+- A message identical to one queued for the same recipient within the dedupe
+  window is not queued again.
+
+Delivery is at least once: messages that were being sent when the process
+stopped are sent again on the next start. Provider base URLs come from the
+environment, so the dispatcher can be pointed at local stub servers.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import requests
+from dotenv import load_dotenv
+
+from utils.scheduler import current_user
+
+load_dotenv(override=True)
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_OUTBOX_PATH = os.getenv("NOTIFICATION_OUTBOX_PATH", "notifications.db")
+# How long the dispatcher waits after a wake-up so messages queued together go out together
+NOTIFICATION_BATCH_DELAY = float(os.getenv("NOTIFICATION_BATCH_DELAY", "2"))
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", "50"))
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", "6"))
+NOTIFICATION_RETRY_BASE_DELAY = float(os.getenv("NOTIFICATION_RETRY_BASE_DELAY", "5"))
+NOTIFICATION_RETRY_MAX_DELAY = float(os.getenv("NOTIFICATION_RETRY_MAX_DELAY", "300"))
+NOTIFICATION_DEDUPE_WINDOW = float(os.getenv("NOTIFICATION_DEDUPE_WINDOW", "300"))
+NOTIFICATION_SEND_TIMEOUT = float(os.getenv("NOTIFICATION_SEND_TIMEOUT", "10"))
+# Sent and failed messages older than this are deleted when the dispatcher starts
+NOTIFICATION_RETENTION_DAYS = float(os.getenv("NOTIFICATION_RETENTION_DAYS", "7"))
+# Longest the dispatcher sleeps without a wake-up
+NOTIFICATION_POLL_INTERVAL = 30.0
+
+PUSHOVER_URL = os.getenv("PUSHOVER_URL", "https://api.pushover.net/1/messages.json")
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org")
+TWILIO_API_BASE = os.getenv("TWILIO_API_BASE", "https://api.twilio.com")
+
+STATUS_PENDING = "pending"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+
+BATCH_SEPARATOR = "\n\n"
+
+
+class DeliveryError(Exception):
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+@dataclass
+class Channel:
+    name: str
+    # Longest text the provider accepts in one message
+    max_chars: int
+    send: Callable[[requests.Session, str, str], None]
+
+
+def _check_response(response: requests.Response) -> None:
+    if response.status_code < 400:
+        return
+    retryable = response.status_code == 429 or response.status_code >= 500
+    raise DeliveryError(f"HTTP {response.status_code}: {response.text[:300]}", retryable=retryable)
+
+
+def send_pushover(session: requests.Session, recipient: str, text: str) -> None:
+    token = os.getenv("PUSHOVER_TOKEN")
+    if not token:
+        raise DeliveryError("PUSHOVER_TOKEN not set.", retryable=False)
+    response = session.post(
+        PUSHOVER_URL,
+        data={"token": token, "user": recipient, "message": text},
+        timeout=NOTIFICATION_SEND_TIMEOUT,
+    )
+    _check_response(response)
+
+
+def send_telegram(session: requests.Session, recipient: str, text: str) -> None:
+    token = os.getenv("TELEGRAM_BOT_TOKEN")
+    if not token:
+        raise DeliveryError("TELEGRAM_BOT_TOKEN not set.", retryable=False)
+    response = session.post(
+        f"{TELEGRAM_API_BASE}/bot{token}/sendMessage",
+        data={"chat_id": recipient, "text": text},
+        timeout=NOTIFICATION_SEND_TIMEOUT,
+    )
+    _check_response(response)
+
+
+def _twilio_sender(prefix: str, from_variable: str) -> Callable[[requests.Session, str, str], None]:
+    def send(session: requests.Session, recipient: str, text: str) -> None:
+        account_sid = os.getenv("TWILIO_ACCOUNT_SID")
+        auth_token = os.getenv("TWILIO_AUTH_TOKEN")
+        from_number = os.getenv(from_variable)
+        if not all([account_sid, auth_token, from_number]):
+            raise DeliveryError("Twilio credentials not found in environment variables.", retryable=False)
+        response = session.post(
+            f"{TWILIO_API_BASE}/2010-04-01/Accounts/{account_sid}/Messages.json",
+            data={"Body": text, "To": prefix + recipient, "From": prefix + str(from_number)},
+            auth=(account_sid, auth_token),
+            timeout=NOTIFICATION_SEND_TIMEOUT,
+        )
+        _check_response(response)
+    return send
+
+
+CHANNELS: Dict[str, Channel] = {
+    "pushover": Channel("pushover", 1024, send_pushover),
+    "telegram": Channel("telegram", 4096, send_telegram),
+    "whatsapp": Channel("whatsapp", 1600, _twilio_sender("whatsapp:", "TWILIO_PHONE_NUMBER")),
+    "sms": Channel("sms", 1600, _twilio_sender("", "TWILIO_PHONE_SMS_NUMBER")),
+}
+
+
+def retry_delay(attempt: int, base: float = NOTIFICATION_RETRY_BASE_DELAY, cap: float = NOTIFICATION_RETRY_MAX_DELAY) -> float:
+    """Exponential backoff with jitter for the given failed attempt (1-based)."""
+    delay = min(cap, base * 2 ** (attempt - 1))
+    return random.uniform(delay / 2, delay)
+
+
+def pack_batches(rows: List[sqlite3.Row], max_chars: int) -> List[Tuple[List[str], str]]:
+    """Group messages (in order) into (ids, joined text) batches that fit in one provider message."""
+    batches: List[Tuple[List[str], str]] = []
+    ids: List[str] = []
+    text = ""
+    for row in rows:
+        candidate = row["text"] if not ids else text + BATCH_SEPARATOR + row["text"]
+        if ids and len(candidate) > max_chars:
+            batches.append((ids, text))
+            ids, candidate = [], row["text"]
+        ids.append(row["id"])
+        text = candidate
+    if ids:
+        batches.append((ids, text))
+    return batches
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notification (
+    id TEXT PRIMARY KEY,
+    username TEXT,
+    channel TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    text TEXT NOT NULL,
+    dedupe_key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    batch_id TEXT,
+    created_at REAL NOT NULL,
+    sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_notification_due ON notification (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS ix_notification_dedupe ON notification (dedupe_key, created_at);
+"""
+
+
+class NotificationOutbox:
+    """The SQLite outbox. Safe to use from tool threads and the dispatcher at once."""
+
+    def __init__(self, path: str = NOTIFICATION_OUTBOX_PATH, dedupe_window: float = NOTIFICATION_DEDUPE_WINDOW):
+        self.path = path
+        self.dedupe_window = dedupe_window
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        connection = sqlite3.connect(self.path, timeout=10)
+        connection.row_factory = sqlite3.Row
+        try:
+            with self._lock:
+                if not self._initialized:
+                    connection.execute("PRAGMA journal_mode=WAL")
+                    connection.executescript(SCHEMA)
+                    columns = {row["name"] for row in connection.execute("PRAGMA table_info(notification)")}
+                    if "username" not in columns:
+                        # Outboxes created before notifications had an owner
+                        connection.execute("ALTER TABLE notification ADD COLUMN username TEXT")
+                    self._initialized = True
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def enqueue(self, channel: str, recipient: str, text: str, username: Optional[str] = None) -> Tuple[str, bool]:
+        """
+        Queue a message for `username`; returns its id and whether it duplicates
+        one the same user queued within the dedupe window.
+        """
+        if channel not in CHANNELS:
+            raise ValueError(f"Unknown notification channel: {channel}")
+        dedupe_key = hashlib.sha256(f"{channel}\0{recipient}\0{text}".encode("utf-8")).hexdigest()
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")  # serialise the duplicate check with the insert
+            duplicate = connection.execute(
+                "SELECT id FROM notification WHERE dedupe_key = ? AND created_at >= ? AND status != ? AND username IS ? "
+                "ORDER BY created_at DESC LIMIT 1",
+                (dedupe_key, now - self.dedupe_window, STATUS_FAILED, username),
+            ).fetchone()
+            if duplicate is not None:
+                return duplicate["id"], True
+            notification_id = uuid.uuid4().hex
+            connection.execute(
+                "INSERT INTO notification "
+                "(id, username, channel, recipient, text, dedupe_key, status, next_attempt_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (notification_id, username, channel, recipient, text, dedupe_key, STATUS_PENDING, now, now),
+            )
+        return notification_id, False
+
+    def recover(self, retention_days: float = NOTIFICATION_RETENTION_DAYS) -> int:
+        """Requeue messages left mid-send by a previous process and drop old finished ones."""
+        with self._connect() as connection:
+            connection.execute(
+                "DELETE FROM notification WHERE status IN (?, ?) AND created_at < ?",
+                (STATUS_SENT, STATUS_FAILED, time.time() - retention_days * 86400),
+            )
+            return connection.execute(
+                "UPDATE notification SET status = ? WHERE status = ?", (STATUS_PENDING, STATUS_SENDING)
+            ).rowcount
+
+    def claim_due(self, limit: int = NOTIFICATION_BATCH_SIZE) -> List[sqlite3.Row]:
+        """Mark up to `limit` due messages as sending and return them, oldest first."""
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            rows = connection.execute(
+                "SELECT * FROM notification WHERE status = ? AND next_attempt_at <= ? ORDER BY created_at LIMIT ?",
+                (STATUS_PENDING, time.time(), limit),
+            ).fetchall()
+            connection.executemany(
+                "UPDATE notification SET status = ? WHERE id = ?", [(STATUS_SENDING, row["id"]) for row in rows]
+            )
+        return rows
+
+    def next_due(self) -> Optional[float]:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT MIN(next_attempt_at) AS due FROM notification WHERE status = ?", (STATUS_PENDING,)
+            ).fetchone()
+        return row["due"]
+
+    def mark_sent(self, ids: List[str], batch_id: str) -> None:
+        now = time.time()
+        with self._connect() as connection:
+            connection.executemany(
+                "UPDATE notification SET status = ?, attempts = attempts + 1, sent_at = ?, batch_id = ?, "
+                "last_error = NULL WHERE id = ?",
+                [(STATUS_SENT, now, batch_id, notification_id) for notification_id in ids],
+            )
+
+    def mark_failed(self, rows: List[sqlite3.Row], error: DeliveryError, max_attempts: int) -> None:
+        """Schedule a retry for each message, or fail it once it is out of attempts or the error is permanent."""
+        now = time.time()
+        updates = []
+        for row in rows:
+            attempts = row["attempts"] + 1
+            if error.retryable and attempts < max_attempts:
+                updates.append((STATUS_PENDING, attempts, now + retry_delay(attempts), str(error), row["id"]))
+            else:
+                updates.append((STATUS_FAILED, attempts, now, str(error), row["id"]))
+        with self._connect() as connection:
+            connection.executemany(
+                "UPDATE notification SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                updates,
+            )
+
+    def get(self, notification_id: str, username: str) -> Optional[Dict[str, Any]]:
+        """A notification queued by `username`, or None (also for other users' notifications)."""
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT id, channel, recipient, text, status, attempts, next_attempt_at, last_error, batch_id, "
+                "created_at, sent_at FROM notification WHERE id = ? AND username = ?",
+                (notification_id, username),
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Message counts per channel and status."""
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT channel, status, COUNT(*) AS count FROM notification GROUP BY channel, status"
+            ).fetchall()
+        result: Dict[str, Dict[str, int]] = defaultdict(dict)
+        for row in rows:
+            result[row["channel"]][row["status"]] = row["count"]
+        return dict(result)
+
+
+class NotificationDispatcher:
+    def __init__(
+        self,
+        outbox: NotificationOutbox,
+        batch_delay: float = NOTIFICATION_BATCH_DELAY,
+        max_attempts: int = NOTIFICATION_MAX_ATTEMPTS,
+    ):
+        self.outbox = outbox
+        self.batch_delay = batch_delay
+        self.max_attempts = max_attempts
+        self.requests_sent = 0
+        self.messages_sent = 0
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        recovered = await asyncio.to_thread(self.outbox.recover)
+        if recovered:
+            logger.info("Requeued %d notification(s) left mid-send by a previous run.", recovered)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop dispatching; queued messages stay in the outbox for the next start."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._loop = None
+
+    def wake(self) -> None:
+        """Tell the dispatcher a message was queued. Callable from any thread."""
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wake.set)
+
+    async def _run(self):
+        while True:
+            try:
+                await self._drain()
+                due = await asyncio.to_thread(self.outbox.next_due)
+            except Exception:
+                logger.exception("Notification dispatch failed")
+                due = None
+            timeout = NOTIFICATION_POLL_INTERVAL if due is None else max(0.0, min(NOTIFICATION_POLL_INTERVAL, due - time.time()))
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+                # Give the rest of a burst a moment to arrive so it can share a request
+                await asyncio.sleep(self.batch_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _drain(self):
+        while True:
+            rows = await asyncio.to_thread(self.outbox.claim_due)
+            if not rows:
+                return
+            groups: Dict[Tuple[str, str], List[sqlite3.Row]] = defaultdict(list)
+            for row in rows:
+                groups[(row["channel"], row["recipient"])].append(row)
+            # Recipients are independent; the batches of one recipient go out in order
+            await asyncio.gather(*(asyncio.to_thread(self.deliver, group) for group in groups.values()))
+
+    def deliver(self, rows: List[sqlite3.Row]) -> None:
+        """Send one recipient's messages, joined into as few provider messages as fit."""
+        channel = CHANNELS.get(rows[0]["channel"])
+        if channel is None:
+            error = DeliveryError(f"Unknown channel {rows[0]['channel']}", retryable=False)
+            self.outbox.mark_failed(rows, error, self.max_attempts)
+            return
+        by_id = {row["id"]: row for row in rows}
+        for ids, text in pack_batches(rows, channel.max_chars):
+            try:
+                channel.send(self._session, rows[0]["recipient"], text)
+            except requests.RequestException as e:
+                error = DeliveryError(str(e))
+            except DeliveryError as e:
+                error = e
+            except Exception as e:
+                # Unexpected errors are retried like transient ones, so the rows never stay claimed
+                logger.exception("Unexpected error delivering %s notification(s)", channel.name)
+                error = DeliveryError(f"{type(e).__name__}: {e}")
+            else:
+                with self._lock:
+                    self.requests_sent += 1
+                    self.messages_sent += len(ids)
+                self.outbox.mark_sent(ids, batch_id=uuid.uuid4().hex)
+                continue
+            logger.warning("Delivering %d %s notification(s) failed: %s", len(ids), channel.name, error)
+            self.outbox.mark_failed([by_id[i] for i in ids], error, self.max_attempts)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "requests_sent": self.requests_sent,
+            "messages_sent": self.messages_sent,
+            "messages": self.outbox.stats(),
+        }
+
+
+notification_outbox = NotificationOutbox()
+notification_dispatcher = NotificationDispatcher(notification_outbox)
+
+
+def enqueue_notification(channel: str, recipient: str, text: str) -> str:
+    """Queue a notification and return a status line for the model."""
+    notification_id, duplicate = notification_outbox.enqueue(channel, recipient, text, username=current_user())
+    if duplicate:
+        return f"An identical {channel} message was queued moments ago (id {notification_id}); not sending it again."
+    notification_dispatcher.wake()
+    return f"{channel.capitalize()} message queued for delivery (id {notification_id})."
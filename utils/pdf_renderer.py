@@ -0,0 +1,354 @@
+"""
+Multi-page PDF rendering of agent output.
+
+Text is converted line by line into ReportLab platypus flowables: `#`
+headings, paragraphs with **bold**, *italic*, `code` and [links](url),
+bullet and numbered lists, fenced code blocks, pipe tables (kept as
+monospace) and `---` rules. Paragraphs wrap and flow across as many pages
+as the text needs.
+
+The document is built from a generator rather than a list: flowables are
+created a few at a time just ahead of the layout loop and dropped once they
+are placed, and page streams are compressed as they are finished, so
+memory stays close to flat however long the document is. Source files are
+read line by line for the same reason.
+
+Rendering is CPU-bound, so it runs in a small process pool: tool threads
+wait on it without holding the GIL the event loop needs, and at most
+PDF_RENDER_WORKERS documents render at once. A render that outlives its
+timeout can't be cancelled once started, so the pool's workers are killed
+and a fresh pool takes over; renders that lose their worker this way, or to
+a crash, are retried once on the new pool.
+"""
+import html
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from langchain_core.tools import StructuredTool
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, StyleSheet1, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import Flowable, Frame, PageTemplate, Paragraph, Preformatted, Spacer
+from reportlab.platypus.doctemplate import BaseDocTemplate
+from reportlab.platypus.flowables import HRFlowable
+
+from utils.deadline import DeadlineExceeded, check_deadline, request_timeout
+from utils.document_index import document_index
+from utils.sandbox_files import SANDBOX_DIR, resolve_sandbox_path
+
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", "2"))
+PDF_RENDER_TIMEOUT = float(os.getenv("PDF_RENDER_TIMEOUT", "300"))
+# Flowables created ahead of the layout loop (covers keep-with-next chains of headings)
+LOOKAHEAD = 16
+# Code blocks are emitted in pieces of this many lines so a huge block is never held at once
+CODE_CHUNK_LINES = 60
+CODE_LINE_CHARS = 95
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*)$")
+_BULLET_RE = re.compile(r"^(\s*)[-*+]\s+(.*)$")
+_NUMBERED_RE = re.compile(r"^(\s*)(\d+)[.)]\s+(.*)$")
+_RULE_RE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+_BOLD_RE = re.compile(r"\*\*(.+?)\*\*|__(.+?)__")
+_ITALIC_RE = re.compile(r"(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?!\*)|(?<!\w)_(?!\s)(.+?)(?<!\s)_(?!\w)")
+_CODE_RE = re.compile(r"`([^`]+)`")
+_LINK_RE = re.compile(r"\[([^\]]+)\]\((https?://[^)\s]+)\)")
+
+
+def build_styles() -> StyleSheet1:
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle("Body", parent=styles["BodyText"], fontSize=10.5, leading=14, spaceAfter=6))
+    styles.add(ParagraphStyle("ListItem", parent=styles["Body"], leftIndent=18, bulletIndent=6, spaceAfter=2))
+    styles.add(ParagraphStyle(
+        "CodeBlock", parent=styles["Code"], fontSize=8.5, leading=10.5, backColor=colors.whitesmoke,
+        leftIndent=6, rightIndent=6, spaceBefore=0, spaceAfter=0,
+    ))
+    for level in range(1, 7):
+        styles[f"Heading{level}"].keepWithNext = 1
+    return styles
+
+
+def inline_markup(text: str) -> str:
+    """Escape text for a Paragraph and convert Markdown inline formatting to ReportLab markup."""
+    code_spans: List[str] = []
+
+    def stash_code(match: re.Match) -> str:
+        code_spans.append(f'<font face="Courier">{match.group(1)}</font>')
+        return f"\x00{len(code_spans) - 1}\x00"
+
+    text = html.escape(text, quote=False)
+    text = _CODE_RE.sub(stash_code, text)  # no formatting inside code spans
+    text = _LINK_RE.sub(lambda m: f'<link href="{m.group(2)}" color="blue">{m.group(1)}</link>', text)
+    text = _BOLD_RE.sub(lambda m: f"<b>{m.group(1) or m.group(2)}</b>", text)
+    text = _ITALIC_RE.sub(lambda m: f"<i>{m.group(1) or m.group(2)}</i>", text)
+    return re.sub("\x00(\\d+)\x00", lambda m: code_spans[int(m.group(1))], text)
+
+
+def _code_flowables(lines: List[str], styles: StyleSheet1) -> Iterator[Flowable]:
+    for start in range(0, len(lines), CODE_CHUNK_LINES):
+        chunk = "\n".join(lines[start:start + CODE_CHUNK_LINES])
+        yield Preformatted(chunk, styles["CodeBlock"], maxLineLength=CODE_LINE_CHARS, newLineChars="")
+
+
+def markdown_flowables(lines: Iterable[str], styles: StyleSheet1) -> Iterator[Flowable]:
+    """Flowables for Markdown-ish text, produced lazily from an iterable of lines."""
+    paragraph: List[str] = []
+    code: Optional[List[str]] = None
+    table: List[str] = []
+    list_styles: Dict[int, ParagraphStyle] = {}
+
+    def flush() -> Iterator[Flowable]:
+        if paragraph:
+            yield Paragraph(inline_markup(" ".join(paragraph)), styles["Body"])
+            paragraph.clear()
+        if table:
+            yield from _code_flowables(table, styles)
+            yield Spacer(1, 6)
+            table.clear()
+
+    for raw in lines:
+        line = raw.rstrip("\r\n")
+        if code is not None:
+            if line.lstrip().startswith("```"):
+                yield from _code_flowables(code, styles)
+                yield Spacer(1, 6)
+                code = None
+            else:
+                code.append(line.expandtabs(4))
+                if len(code) >= CODE_CHUNK_LINES:
+                    yield from _code_flowables(code, styles)
+                    code = []
+            continue
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            yield from flush()
+            code = []
+            continue
+        if stripped.startswith("|"):
+            if paragraph:
+                yield from flush()
+            table.append(stripped)
+            continue
+        if table:
+            yield from flush()
+        if not stripped:
+            yield from flush()
+            continue
+        heading = _HEADING_RE.match(stripped)
+        if heading:
+            yield from flush()
+            level = min(len(heading.group(1)), 6)
+            yield Paragraph(inline_markup(heading.group(2)), styles[f"Heading{level}"])
+            continue
+        if _RULE_RE.match(stripped):
+            yield from flush()
+            yield HRFlowable(width="100%", thickness=0.5, color=colors.grey, spaceBefore=4, spaceAfter=8)
+            continue
+        bullet = _BULLET_RE.match(line)
+        numbered = _NUMBERED_RE.match(line)
+        if bullet or numbered:
+            yield from flush()
+            indent, text = (bullet.group(1), bullet.group(2)) if bullet else (numbered.group(1), numbered.group(3))
+            depth = len(indent.expandtabs(4)) // 2
+            style = list_styles.get(depth)
+            if style is None:
+                style = ParagraphStyle(f"ListItem{depth}", parent=styles["ListItem"], leftIndent=18 + 12 * depth)
+                list_styles[depth] = style
+            marker = "•" if bullet else f"{numbered.group(2)}."
+            yield Paragraph(inline_markup(text), style, bulletText=marker)
+            continue
+        paragraph.append(stripped)
+
+    if code:
+        yield from _code_flowables(code, styles)
+    yield from flush()
+
+
+class StreamingDocTemplate(BaseDocTemplate):
+    """A letter-size document with page numbers, built from an iterator of flowables."""
+
+    def __init__(self, filename: str, title: str = "", **kwargs):
+        super().__init__(
+            filename, pagesize=letter, title=title, leftMargin=0.9 * inch, rightMargin=0.9 * inch,
+            topMargin=0.9 * inch, bottomMargin=0.9 * inch, pageCompression=1, **kwargs,
+        )
+        frame = Frame(self.leftMargin, self.bottomMargin, self.width, self.height, id="body")
+        self.addPageTemplates([PageTemplate(id="page", frames=[frame], onPage=self._footer)])
+
+    def _footer(self, canv, doc) -> None:
+        canv.saveState()
+        canv.setFont("Helvetica", 8)
+        canv.setFillColor(colors.grey)
+        canv.drawRightString(self.pagesize[0] - self.rightMargin, 0.5 * inch, f"Page {doc.page}")
+        if self.title:
+            canv.drawString(self.leftMargin, 0.5 * inch, self.title[:90])
+        canv.restoreState()
+
+    def build_stream(self, flowables: Iterable[Flowable]) -> int:
+        """Lay out flowables as they are produced; returns the number of pages."""
+        source = iter(flowables)
+        pending: List[Flowable] = []
+        exhausted = False
+        self._startBuild()
+        canv = self.canv
+        try:
+            canv._doctemplate = self
+            while True:
+                while not exhausted and len(pending) < LOOKAHEAD:
+                    try:
+                        pending.append(next(source))
+                    except StopIteration:
+                        exhausted = True
+                if not pending:
+                    break
+                self.clean_hanging()
+                self.handle_flowable(pending)
+        finally:
+            del canv._doctemplate
+        self._endBuild()
+        return self.page
+
+
+def _source_lines(content: Optional[str], source_path: Optional[str]) -> Iterator[str]:
+    if source_path is not None:
+        with open(source_path, encoding="utf-8", errors="replace") as f:
+            yield from f
+    elif content:
+        start = 0
+        while start <= len(content):
+            end = content.find("\n", start)
+            if end < 0:
+                yield content[start:]
+                return
+            yield content[start:end]
+            start = end + 1
+
+
+def render_markdown_pdf(path: str, content: Optional[str] = None, source_path: Optional[str] = None, title: str = "") -> int:
+    """Render Markdown-ish text (or a text file) to a PDF at `path`; returns the page count."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    partial = path + ".partial"
+    try:
+        doc = StreamingDocTemplate(partial, title=title)
+        pages = doc.build_stream(markdown_flowables(_source_lines(content, source_path), build_styles()))
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return pages
+
+
+class PdfRenderPool:
+    def __init__(self, workers: int = PDF_RENDER_WORKERS):
+        self.workers = workers
+        self.lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        with self.lock:
+            if self._executor is None:
+                # spawn: the app has threads running, which fork doesn't copy safely
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def _discard(self, executor: ProcessPoolExecutor, terminate: bool = False) -> None:
+        """Stop handing out `executor`; with `terminate`, also kill its workers and whatever they are rendering."""
+        with self.lock:
+            if self._executor is executor:
+                self._executor = None
+        if terminate:
+            for process in list((executor._processes or {}).values()):
+                process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def render(self, path: str, content: Optional[str] = None, source_path: Optional[str] = None, title: str = "",
+               timeout: float = PDF_RENDER_TIMEOUT) -> int:
+        """Render in a worker process and wait for it; raises TimeoutError after `timeout` seconds."""
+        deadline = time.monotonic() + timeout
+        for attempt in range(2):
+            executor = self.executor
+            try:
+                future = executor.submit(render_markdown_pdf, path, content, source_path, title)
+                return future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except TimeoutError:
+                # Cancelling only helps a render that hasn't started; a started one would hold its worker to the end
+                if not future.cancel():
+                    self._discard(executor, terminate=True)
+                raise
+            except BrokenProcessPool:
+                self._discard(executor)
+                if attempt:
+                    raise
+
+    def shutdown(self) -> None:
+        with self.lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+
+pdf_render_pool = PdfRenderPool()
+
+
+def parse_title(content: Optional[str], source_path: Optional[str]) -> str:
+    """The document's leading heading, used as its title."""
+    for line in _source_lines(content, source_path):
+        if line.strip():
+            heading = _HEADING_RE.match(line.strip())
+            return heading.group(2).strip() if heading else ""
+    return ""
+
+
+def save_file_pdf(file_name: str, content: Optional[str] = None, source_file: Optional[str] = None) -> str:
+    """
+    Save Markdown-formatted text as a multi-page PDF in the sandbox directory.
+
+    Supports # headings, paragraphs, **bold**, *italic*, `code`, [links](url),
+    bullet and numbered lists, ``` code blocks, | tables and --- rules; long
+    text is wrapped and paginated. For long reports, write the text to a file
+    in the sandbox first and pass it as source_file instead of content.
+
+    Args:
+        file_name (str): The name of the PDF file to be created (e.g., 'report.pdf').
+        content (str, optional): The text to write into the PDF.
+        source_file (str, optional): A text or Markdown file in the sandbox to render instead of content.
+
+    Returns:
+        str: A message with the file path and page count, or an error.
+    """
+    if not file_name or not isinstance(file_name, str):
+        return "Error: file_name (str) is required to save as PDF. Please provide a valid file name (e.g., 'output.pdf')."
+    if not content and not source_file:
+        return "Error: content (str) or source_file is required to save as PDF. Please provide the content to save."
+    check_deadline()
+    try:
+        root = os.path.realpath(SANDBOX_DIR)
+        path = os.path.realpath(os.path.join(root, file_name))
+        if os.path.commonpath([root, path]) != root:
+            return f"Error: Access denied: {file_name} is outside the sandbox."
+        source_path = resolve_sandbox_path(source_file) if source_file else None
+        title = parse_title(content, source_path)
+        pages = pdf_render_pool.render(path, content, source_path, title, timeout=request_timeout(PDF_RENDER_TIMEOUT))
+        document_index.refresh_paths(os.path.relpath(path, root))
+        return f"File saved as {os.path.join(SANDBOX_DIR, file_name)} ({pages} pages)"
+    except TimeoutError:
+        return "Error saving PDF: rendering did not finish in time."
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        return f"Error saving PDF: {str(e)}"
+
+
+def save_file_pdf_tool() -> StructuredTool:
+    return StructuredTool.from_function(func=save_file_pdf, name="save_file_pdf")
@@ -0,0 +1,331 @@
+"""
+Opt-in CPU and memory profiling of individual agent runs.
+
+A run is profiled when an admin's request carries `X-Profile: 1`, or at
+random for PROFILE_SAMPLE_RATE of runs. Every other run pays only for that
+check: no sampler thread exists and tracemalloc stays off. The header is
+ignored for other users, since a profiled run slows the whole process.
+
+While a run is profiled, a daemon thread wakes every PROFILE_INTERVAL_MS,
+reads every thread's stack with sys._current_frames() and counts it in
+collapsed form (`thread;outer;...;inner`) if the thread used CPU since the
+previous sample. Per-thread CPU clocks tell busy threads from idle ones (the
+event loop waiting in select, pool workers waiting for work); where the
+platform has no such clocks every stack is counted. With PROFILE_MEMORY,
+tracemalloc runs alongside, and the allocations still alive when the run
+ends, grouped by traceback, are kept with the peak traced memory. Tracing
+slows allocation-heavy code several times over, which also inflates its
+share of the CPU samples; set PROFILE_MEMORY=false for CPU-only profiles.
+
+The sampler sees the whole process, so only one run is profiled at a time
+and a run picked while another is profiled just runs unprofiled. Work of
+other runs interleaved on the event loop or the threadpool is counted too,
+which matters less the quieter the worker; PDF rendering happens in the
+renderer's worker processes and only shows up as the time spent waiting.
+
+The last PROFILE_MAX_STORED profiles are kept in memory for the admin
+endpoints. The collapsed stacks load directly into flamegraph.pl or
+speedscope.
+"""
+import asyncio
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import Depends, Header
+
+from utils.security import ADMIN_USERS, require_session
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+PROFILE_MAX_STORED = int(os.getenv("PROFILE_MAX_STORED", "50"))
+PROFILE_TOP_ALLOCATIONS = int(os.getenv("PROFILE_TOP_ALLOCATIONS", "25"))
+PROFILE_MEMORY = os.getenv("PROFILE_MEMORY", "true").lower() == "true"
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "4"))
+# Deeper stacks are cut at the outermost frames
+MAX_STACK_DEPTH = 128
+TOP_FUNCTIONS = 30
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_display_paths: Dict[str, str] = {}
+
+
+def display_path(filename: str) -> str:
+    """A short path for a code file: relative to the repo, or to the sys.path entry it was imported from."""
+    shown = _display_paths.get(filename)
+    if shown is None:
+        roots = [REPO_ROOT] + sorted((p for p in sys.path if p), key=len, reverse=True)
+        shown = next(
+            (os.path.relpath(filename, root) for root in roots if filename.startswith(root.rstrip(os.sep) + os.sep)),
+            filename,
+        )
+        _display_paths[filename] = shown
+    return shown
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({display_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(thread_name: str, frame) -> str:
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    labels.append(thread_name)
+    return ";".join(reversed(labels))
+
+
+def thread_cpu_time(ident: int) -> Optional[float]:
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(ident))
+    except (AttributeError, OSError):
+        return None
+
+
+def thread_names() -> Dict[int, str]:
+    # Pool threads differ only by a numeric suffix; merge them in the profile
+    return {thread.ident: re.sub(r"[-_]\d+$", "", thread.name) for thread in threading.enumerate() if thread.ident}
+
+
+class StackSampler:
+    """Counts the collapsed stacks of busy threads on a background thread."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._cpu: Dict[int, Optional[float]] = {}
+
+    def start(self):
+        self._cpu = {ident: thread_cpu_time(ident) for ident in sys._current_frames()}
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = thread_names()
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                used = thread_cpu_time(ident)
+                previous = self._cpu.get(ident)
+                self._cpu[ident] = used
+                if used is not None and (previous is None or used <= previous):
+                    continue
+                self.stacks[collapse_stack(names.get(ident, f"thread-{ident}"), frame)] += 1
+            self.samples += 1
+
+
+@dataclass
+class RunProfile:
+    id: str
+    kind: str
+    username: str
+    reason: str
+    interval_ms: float
+    started_at: float
+    duration: float = 0.0
+    cpu_seconds: float = 0.0
+    samples: int = 0
+    peak_bytes: int = 0
+    retained_bytes: int = 0
+    error: Optional[str] = None
+    stacks: Counter = field(default_factory=Counter)
+    top_allocations: List[Dict[str, Any]] = field(default_factory=list)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "username": self.username,
+            "reason": self.reason,
+            "started_at": self.started_at,
+            "duration": round(self.duration, 3),
+            "cpu_seconds": round(self.cpu_seconds, 3),
+            "samples": self.samples,
+            "busy_samples": sum(self.stacks.values()),
+            "interval_ms": self.interval_ms,
+            "peak_bytes": self.peak_bytes,
+            "retained_bytes": self.retained_bytes,
+            "error": self.error,
+        }
+
+    def top_functions(self, limit: int = TOP_FUNCTIONS) -> List[Dict[str, Any]]:
+        """Functions by samples spent in them (`self`) and anywhere below them (`total`)."""
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            if frames:
+                own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        busy = sum(self.stacks.values()) or 1
+        return [
+            {
+                "function": function,
+                "self": count,
+                "self_pct": round(100 * count / busy, 1),
+                "total": total[function],
+                "total_pct": round(100 * total[function] / busy, 1),
+            }
+            for function, count in own.most_common(limit)
+        ]
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def report(self) -> Dict[str, Any]:
+        return {**self.summary(), "top_functions": self.top_functions(), "top_allocations": self.top_allocations}
+
+
+def top_allocations(snapshot: tracemalloc.Snapshot, limit: int) -> List[Dict[str, Any]]:
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    ))
+    return [
+        {
+            "size": stat.size,
+            "count": stat.count,
+            # Innermost frame first
+            "traceback": [f"{display_path(frame.filename)}:{frame.lineno}" for frame in reversed(stat.traceback)],
+        }
+        for stat in snapshot.statistics("traceback")[:limit]
+    ]
+
+
+class RunProfiler:
+    def __init__(
+        self,
+        sample_rate: float = PROFILE_SAMPLE_RATE,
+        interval_ms: float = PROFILE_INTERVAL_MS,
+        max_stored: int = PROFILE_MAX_STORED,
+        memory: bool = PROFILE_MEMORY,
+    ):
+        self.sample_rate = sample_rate
+        self.memory = memory
+        self.interval_ms = interval_ms
+        self.max_stored = max_stored
+        self.profiles: "OrderedDict[str, RunProfile]" = OrderedDict()
+        self._active = False
+        self._lock = threading.Lock()
+        self.skipped_busy = 0
+
+    def _reason(self, requested: bool) -> Optional[str]:
+        if requested:
+            return "requested"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    @asynccontextmanager
+    async def profile(self, kind: str, username: str, requested: bool = False) -> AsyncIterator[Optional[RunProfile]]:
+        """Profile the body if requested or sampled; yields the profile, or None when not profiling."""
+        reason = self._reason(requested)
+        if reason is not None:
+            with self._lock:
+                if self._active:
+                    self.skipped_busy += 1
+                    reason = None
+                else:
+                    self._active = True
+        if reason is None:
+            yield None
+            return
+
+        profile = RunProfile(
+            id=uuid.uuid4().hex, kind=kind, username=username, reason=reason,
+            interval_ms=self.interval_ms, started_at=time.time(),
+        )
+        sampler = StackSampler(self.interval_ms / 1000)
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        # Leave tracemalloc alone if something else (e.g. PYTHONTRACEMALLOC) started it
+        tracing = self.memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+        sampler.start()
+        try:
+            yield profile
+        except BaseException as e:
+            profile.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            sampler.stop()
+            profile.duration = time.perf_counter() - started
+            profile.cpu_seconds = time.process_time() - cpu_started
+            profile.samples = sampler.samples
+            profile.stacks = sampler.stacks
+            try:
+                if tracing:
+                    # Snapshotting walks every live trace, so keep it off the event loop
+                    await asyncio.to_thread(self._collect_memory, profile)
+            finally:
+                with self._lock:
+                    self._active = False
+                    self.profiles[profile.id] = profile
+                    while len(self.profiles) > self.max_stored:
+                        self.profiles.popitem(last=False)
+            logger.info(
+                "Profiled %s run of %s (%s): %.2fs, %d busy samples, peak %.1f MiB",
+                kind, username, profile.id, profile.duration, sum(profile.stacks.values()), profile.peak_bytes / 2**20,
+            )
+
+    def _collect_memory(self, profile: RunProfile):
+        try:
+            _, profile.peak_bytes = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        profile.top_allocations = top_allocations(snapshot, PROFILE_TOP_ALLOCATIONS)
+        profile.retained_bytes = sum(trace.size for trace in snapshot.traces)
+
+    def get(self, profile_id: str) -> Optional[RunProfile]:
+        with self._lock:
+            return self.profiles.get(profile_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sample_rate": self.sample_rate,
+                "interval_ms": self.interval_ms,
+                "memory": self.memory,
+                "active": self._active,
+                "skipped_busy": self.skipped_busy,
+                "profiles": [profile.summary() for profile in reversed(self.profiles.values())],
+            }
+
+
+run_profiler = RunProfiler()
+
+
+async def request_profiling(
+    x_profile: Optional[str] = Header(None), session_user: str = Depends(require_session)
+) -> bool:
+    """FastAPI dependency: whether an admin's `X-Profile` header asks for the run to be profiled."""
+    requested = x_profile is not None and x_profile.strip().lower() in ("1", "true", "yes", "on")
+    return requested and session_user in ADMIN_USERS
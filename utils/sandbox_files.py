@@ -0,0 +1,280 @@
+"""
+Ranged reads and regex search over sandbox files.
+
+Files are memory-mapped instead of read into strings, so a multi-megabyte
+log costs only the pages a read or search touches. For each file a line
+offset index (the byte position where every line starts) is built once and
+cached until the file's size or mtime changes; reading lines 5000-5100 is
+then two lookups and a slice of the map. All output carries line numbers and
+is capped, so a single tool call can't flood the model's context.
+
+Uploads are kept per user under uploads/{username}/ and only that user's
+runs can read, search or publish them; the rest of the sandbox is shared.
+"""
+import functools
+import mmap
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Iterator, List, Optional, Tuple
+
+from langchain_core.tools import StructuredTool
+
+from utils.deadline import check_deadline
+from utils.scheduler import current_user
+
+SANDBOX_DIR = "sandbox"
+UPLOADS_DIR = "uploads"
+FILE_TOOL_MAX_CHARS = int(os.getenv("FILE_TOOL_MAX_CHARS", "8000"))
+FILE_TOOL_MAX_LINES = int(os.getenv("FILE_TOOL_MAX_LINES", "200"))
+GREP_MAX_MATCHES = int(os.getenv("GREP_MAX_MATCHES", "50"))
+LINE_INDEX_CACHE_SIZE = int(os.getenv("LINE_INDEX_CACHE_SIZE", "64"))
+# Longest slice of a line shown in a grep result
+GREP_LINE_CHARS = 300
+
+
+def visible_to(relative_path: str, username: Optional[str]) -> bool:
+    """Whether a path relative to the sandbox is visible to `username`: uploads only to their owner."""
+    parts = os.path.normpath(relative_path).split(os.sep)
+    return parts[0] != UPLOADS_DIR or (username is not None and len(parts) > 2 and parts[1] == username)
+
+
+def resolve_sandbox_path(file_name: str, root: str = SANDBOX_DIR) -> str:
+    """
+    Absolute path of a file inside the sandbox; raises ValueError for paths that
+    escape it or belong to another user's uploads.
+    """
+    root = os.path.realpath(root)
+    name = file_name[len(SANDBOX_DIR) + 1:] if file_name.startswith(SANDBOX_DIR + "/") else file_name
+    path = os.path.realpath(os.path.join(root, name))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError(f"Access denied: {file_name} is outside the sandbox.")
+    if not visible_to(os.path.relpath(path, root), current_user()):
+        raise ValueError(f"Access denied: {file_name} is another user's upload.")
+    if not os.path.isfile(path):
+        raise ValueError(f"File not found: {file_name}")
+    return path
+
+
+class LineIndex:
+    """Byte offset of the start of every line of one file version."""
+
+    def __init__(self, path: str):
+        stat = os.stat(path)
+        self.version = (stat.st_size, stat.st_mtime)
+        self.size = stat.st_size
+        self.starts = array("Q")
+        position = 0
+        with open(path, "rb") as f:
+            for line in f:
+                self.starts.append(position)
+                position += len(line)
+
+    @property
+    def line_count(self) -> int:
+        return len(self.starts)
+
+    def span(self, first: int, last: int) -> Tuple[int, int]:
+        """Byte range of lines first..last (1-based, inclusive)."""
+        end = self.starts[last] if last < self.line_count else self.size
+        return self.starts[first - 1], end
+
+    def line_at(self, offset: int) -> int:
+        """1-based line number containing a byte offset."""
+        return max(1, bisect_right(self.starts, offset))
+
+
+class LineIndexCache:
+    def __init__(self, max_files: int = LINE_INDEX_CACHE_SIZE):
+        self.max_files = max_files
+        self.lock = threading.Lock()
+        self.indexes: "OrderedDict[str, LineIndex]" = OrderedDict()
+
+    def get(self, path: str) -> LineIndex:
+        stat = os.stat(path)
+        with self.lock:
+            index = self.indexes.get(path)
+            if index is not None and index.version == (stat.st_size, stat.st_mtime):
+                self.indexes.move_to_end(path)
+                return index
+        index = LineIndex(path)
+        with self.lock:
+            self.indexes[path] = index
+            self.indexes.move_to_end(path)
+            while len(self.indexes) > self.max_files:
+                self.indexes.popitem(last=False)
+        return index
+
+
+line_indexes = LineIndexCache()
+
+
+def _tool_errors(func):
+    """Return path and I/O errors to the model as text, keeping the signature for the tool schema."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except (ValueError, OSError) as e:
+            return f"Error: {e}"
+    return wrapper
+
+
+def _map(path: str) -> Optional[mmap.mmap]:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _numbered(lines: List[str], first: int) -> str:
+    width = len(str(first + len(lines) - 1))
+    return "\n".join(f"{number:>{width}}| {line}" for number, line in enumerate(lines, start=first))
+
+
+def _cap(text: str, note: str) -> str:
+    if len(text) <= FILE_TOOL_MAX_CHARS:
+        return text
+    cut = text.rfind("\n", 0, FILE_TOOL_MAX_CHARS)
+    return text[:cut if cut > 0 else FILE_TOOL_MAX_CHARS] + f"\n[... output truncated; {note}]"
+
+
+@_tool_errors
+def read_file_range(
+    file_path: str,
+    start_line: Optional[int] = None,
+    end_line: Optional[int] = None,
+    byte_offset: Optional[int] = None,
+    byte_length: Optional[int] = None,
+) -> str:
+    """
+    Read part of a file in the sandbox, with line numbers.
+
+    Give start_line/end_line (1-based, inclusive) to read a window of lines, or
+    byte_offset/byte_length to read from a byte position (expanded to whole lines).
+    Without a range the beginning of the file is returned. Output is capped at
+    a few hundred lines; read further windows for more, or use grep_files to find
+    the lines you need first.
+
+    Args:
+        file_path (str): File name in the sandbox (e.g. 'server.log').
+        start_line (int, optional): First line to read.
+        end_line (int, optional): Last line to read.
+        byte_offset (int, optional): Byte position to start reading from.
+        byte_length (int, optional): Number of bytes to read from byte_offset.
+
+    Returns:
+        str: The requested lines prefixed with their numbers, and the file's line count.
+    """
+    check_deadline()
+    if start_line is not None and start_line < 1 or end_line is not None and end_line < 1:
+        raise ValueError("start_line and end_line are 1-based and must be at least 1.")
+    if start_line is not None and end_line is not None and end_line < start_line:
+        raise ValueError(f"end_line ({end_line}) is before start_line ({start_line}).")
+    if byte_offset is not None and byte_offset < 0 or byte_length is not None and byte_length < 1:
+        raise ValueError("byte_offset must be at least 0 and byte_length at least 1.")
+    path = resolve_sandbox_path(file_path)
+    index = line_indexes.get(path)
+    if index.line_count == 0:
+        return f"{file_path} is empty."
+    if byte_offset is not None:
+        first = index.line_at(byte_offset)
+        last = index.line_at(byte_offset + (byte_length or 1) - 1)
+    else:
+        first = start_line or 1
+        last = end_line if end_line is not None else first + FILE_TOOL_MAX_LINES - 1
+    if first > index.line_count:
+        return f"{file_path} has only {index.line_count} lines."
+    last = min(last, index.line_count, first + FILE_TOOL_MAX_LINES - 1)
+
+    start, end = index.span(first, last)
+    mapped = _map(path)
+    try:
+        data = mapped[start:end]
+    finally:
+        mapped.close()
+    lines = data.decode("utf-8", errors="replace").splitlines()
+    header = f"{file_path}: lines {first}-{last} of {index.line_count} ({index.size} bytes)\n"
+    return _cap(header + _numbered(lines, first), "read a smaller window of lines")
+
+
+def _sandbox_files(root: str = SANDBOX_DIR) -> Iterator[str]:
+    """Files in the sandbox visible to the current user."""
+    username = current_user()
+    for directory, directories, files in os.walk(root):
+        if os.path.relpath(directory, root) == UPLOADS_DIR:
+            directories[:] = [name for name in directories if name == username]
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            if visible_to(os.path.relpath(path, root), username):
+                yield path
+
+
+@_tool_errors
+def grep_files(
+    pattern: str,
+    file_path: Optional[str] = None,
+    ignore_case: bool = False,
+    max_matches: int = GREP_MAX_MATCHES,
+) -> str:
+    """
+    Search sandbox files for a regular expression without loading them into memory.
+
+    Args:
+        pattern (str): Python regular expression to search for.
+        file_path (str, optional): Only search this file; all sandbox files you can read otherwise.
+        ignore_case (bool): Case-insensitive matching.
+        max_matches (int): Stop after this many matching lines (default 50).
+
+    Returns:
+        str: Matching lines as 'file:line| text', to be read in context with read_file.
+    """
+    check_deadline()
+    flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+    try:
+        regex = re.compile(pattern.encode("utf-8"), flags)
+    except re.error as e:
+        return f"Invalid pattern: {e}"
+    paths = [resolve_sandbox_path(file_path)] if file_path else list(_sandbox_files())
+    root = os.path.realpath(SANDBOX_DIR)
+    max_matches = max(1, min(max_matches, 500))
+    results: List[str] = []
+    for path in paths:
+        mapped = _map(path)
+        if mapped is None:
+            continue
+        try:
+            index = None
+            last_line = 0
+            for match in regex.finditer(mapped):
+                if index is None:
+                    index = line_indexes.get(path)
+                line = index.line_at(match.start())
+                if line == last_line:
+                    continue  # one result per line
+                last_line = line
+                start, end = index.span(line, line)
+                text = mapped[start:end].decode("utf-8", errors="replace").rstrip("\r\n")
+                results.append(f"{os.path.relpath(os.path.realpath(path), root)}:{line}| {text[:GREP_LINE_CHARS]}")
+                if len(results) >= max_matches:
+                    break
+        finally:
+            mapped.close()
+        if len(results) >= max_matches:
+            results.append(f"[stopped after {max_matches} matches]")
+            break
+        check_deadline()
+    if not results:
+        return "No matches found."
+    return _cap("\n".join(results), "narrow the pattern or search one file")
+
+
+def read_file_tool() -> StructuredTool:
+    return StructuredTool.from_function(func=read_file_range, name="read_file")
+
+
+def grep_files_tool() -> StructuredTool:
+    return StructuredTool.from_function(func=grep_files, name="grep_files")
@@ -0,0 +1,295 @@
+"""
+Weighted fair scheduling of agent runs across users.
+
+Runs are queued per user and started in weighted fair queuing order: each
+run gets a virtual finish tag when it arrives,
+
+    start = max(virtual time, the user's previous finish tag)
+    finish = start + 1 / weight
+
+and the queued run with the smallest finish tag among users allowed to run
+goes next. A user who submits fifty runs at once therefore gets one slot
+in turn with everyone else rather than the next fifty. The LLM tokens a run
+used are charged to its user on completion (one run per
+AGENT_SCHEDULER_RUN_TOKENS tokens), so heavy runs push that user's later
+runs back.
+
+On top of the ordering, each user may have at most AGENT_USER_CONCURRENCY
+runs in flight (a run may ask for a higher limit, as /agent/batch items do
+with AGENT_BATCH_CONCURRENCY) and AGENT_USER_MAX_QUEUED waiting, and with
+AGENT_USER_TOKENS_PER_MINUTE set, a user who has spent their token bucket
+waits until it refills. Tokens are attributed through the `current_user`
+context variable, which LangGraph copies into the threads that run nodes.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional, Tuple
+
+from utils.deadline import current_deadline
+from utils.llm_calls import percentile
+
+logger = logging.getLogger(__name__)
+
+# Runs in flight across all users
+AGENT_SCHEDULER_CONCURRENCY = int(os.getenv("AGENT_SCHEDULER_CONCURRENCY", "16"))
+AGENT_USER_CONCURRENCY = int(os.getenv("AGENT_USER_CONCURRENCY", "2"))
+AGENT_USER_MAX_QUEUED = int(os.getenv("AGENT_USER_MAX_QUEUED", "50"))
+# Token-rate quota per user; 0 disables it
+AGENT_USER_TOKENS_PER_MINUTE = int(os.getenv("AGENT_USER_TOKENS_PER_MINUTE", "0"))
+# Tokens charged as one extra run when ordering a user's later runs
+AGENT_SCHEDULER_RUN_TOKENS = int(os.getenv("AGENT_SCHEDULER_RUN_TOKENS", "10000"))
+# Per-user weights as "user=weight,..."; users not listed have weight 1
+AGENT_USER_WEIGHTS = os.getenv("AGENT_USER_WEIGHTS", "")
+WAIT_WINDOW = 500
+# How often a queued run checks its deadline
+QUEUE_POLL_INTERVAL = 0.5
+
+_current_user: ContextVar[Optional[str]] = ContextVar("current_user", default=None)
+
+
+class QueueFull(Exception):
+    """Raised when a user already has the maximum number of runs queued."""
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    weights = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        weights[name.strip()] = float(value)
+    return weights
+
+
+def current_user() -> Optional[str]:
+    return _current_user.get()
+
+
+@contextmanager
+def user_scope(username: str) -> Iterator[str]:
+    token = _current_user.set(username)
+    try:
+        yield username
+    finally:
+        _current_user.reset(token)
+
+
+def total_tokens(message: Any) -> int:
+    """Prompt plus completion tokens reported for an LLM response (0 if absent)."""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("total_tokens") or usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+    token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    return token_usage.get("total_tokens") or token_usage.get("prompt_tokens", 0) + token_usage.get("completion_tokens", 0)
+
+
+class UserQueue:
+    def __init__(self, weight: float, tokens_per_minute: int):
+        self.weight = weight
+        # (finish tag, sequence, future, queued at, the run's limit on the user's runs in flight)
+        self.waiting: Deque[Tuple[float, int, asyncio.Future, float, int]] = deque()
+        self.running = 0
+        self.last_finish = 0.0
+        self.capacity = float(tokens_per_minute)
+        self.bucket = float(tokens_per_minute)
+        self.refilled_at = time.monotonic()
+        self.tokens = 0
+        self.runs = 0
+        self.rejected = 0
+        self.waits: Deque[float] = deque(maxlen=WAIT_WINDOW)
+
+    def refill(self, now: float) -> None:
+        if self.capacity:
+            self.bucket = min(self.capacity, self.bucket + (now - self.refilled_at) * self.capacity / 60)
+        self.refilled_at = now
+
+    def throttled_for(self) -> float:
+        """Seconds until the token bucket is back above zero."""
+        if not self.capacity or self.bucket > 0:
+            return 0.0
+        return -self.bucket * 60 / self.capacity + 0.01
+
+
+class FairScheduler:
+    def __init__(
+        self,
+        concurrency: int = AGENT_SCHEDULER_CONCURRENCY,
+        user_concurrency: int = AGENT_USER_CONCURRENCY,
+        max_queued: int = AGENT_USER_MAX_QUEUED,
+        tokens_per_minute: int = AGENT_USER_TOKENS_PER_MINUTE,
+        run_tokens: int = AGENT_SCHEDULER_RUN_TOKENS,
+        weights: Optional[Dict[str, float]] = None,
+    ):
+        self.concurrency = concurrency
+        self.user_concurrency = user_concurrency
+        self.max_queued = max_queued
+        self.tokens_per_minute = tokens_per_minute
+        self.run_tokens = run_tokens
+        self.weights = parse_weights(AGENT_USER_WEIGHTS) if weights is None else weights
+        # Token usage is recorded from node threads, dispatching happens on the event loop
+        self.lock = threading.Lock()
+        self.users: Dict[str, UserQueue] = {}
+        self.running = 0
+        self.virtual_time = 0.0
+        self._sequence = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _user(self, username: str) -> UserQueue:
+        queue = self.users.get(username)
+        if queue is None:
+            queue = UserQueue(self.weights.get(username, 1.0), self.tokens_per_minute)
+            self.users[username] = queue
+        return queue
+
+    @asynccontextmanager
+    async def slot(
+        self, username: str, bounded: bool = True, concurrency: Optional[int] = None
+    ) -> AsyncIterator[None]:
+        """
+        Wait for a run slot in fair order, then hold it for the body.
+
+        The run starts only while the user has fewer than `concurrency` runs in
+        flight (default AGENT_USER_CONCURRENCY). Raises QueueFull if the user
+        has too many runs queued (unless not `bounded`, for persisted
+        background jobs), and stops waiting with DeadlineExceeded when the
+        current request deadline passes.
+        """
+        self._loop = asyncio.get_running_loop()
+        future = self._enqueue(username, bounded, concurrency)
+        try:
+            deadline = current_deadline()
+            while not future.done():
+                await asyncio.wait({future}, timeout=QUEUE_POLL_INTERVAL)
+                if deadline is not None and not future.done():
+                    deadline.check()
+        except BaseException:
+            with self.lock:
+                self._withdraw(username, future)
+            raise
+        try:
+            with user_scope(username):
+                yield
+        finally:
+            self._release(username)
+
+    def _enqueue(self, username: str, bounded: bool = True, concurrency: Optional[int] = None) -> asyncio.Future:
+        future = self._loop.create_future()
+        with self.lock:
+            user = self._user(username)
+            if bounded and len(user.waiting) >= self.max_queued:
+                user.rejected += 1
+                raise QueueFull(f"Too many queued runs for {username}; try again later.")
+            start = max(self.virtual_time, user.last_finish)
+            user.last_finish = start + 1 / user.weight
+            user.waiting.append((
+                user.last_finish, next(self._sequence), future, time.monotonic(), concurrency or self.user_concurrency
+            ))
+            self._dispatch()
+        return future
+
+    def _withdraw(self, username: str, future: asyncio.Future) -> None:
+        user = self.users[username]
+        if future.done() and not future.cancelled():
+            # Granted while we were giving up: hand the slot back
+            user.running -= 1
+            self.running -= 1
+        else:
+            future.cancel()
+            user.waiting = deque(item for item in user.waiting if item[2] is not future)
+        self._dispatch()
+
+    def _release(self, username: str) -> None:
+        with self.lock:
+            user = self.users[username]
+            user.running -= 1
+            self.running -= 1
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Grant free slots to the eligible queued runs with the smallest finish tags. Caller holds the lock."""
+        now = time.monotonic()
+        heads: List[Tuple[float, int, str]] = []
+        retry_after: Optional[float] = None
+        for username, user in self.users.items():
+            while user.waiting and user.waiting[0][2].done():
+                user.waiting.popleft()  # cancelled while queued
+            if not user.waiting or user.running >= user.waiting[0][4]:
+                continue
+            user.refill(now)
+            throttled = user.throttled_for()
+            if throttled:
+                retry_after = throttled if retry_after is None else min(retry_after, throttled)
+                continue
+            finish, sequence = user.waiting[0][:2]
+            heapq.heappush(heads, (finish, sequence, username))
+
+        while heads and self.running < self.concurrency:
+            _, _, username = heapq.heappop(heads)
+            user = self.users[username]
+            finish, _, future, queued_at, _ = user.waiting.popleft()
+            self.virtual_time = max(self.virtual_time, finish - 1 / user.weight)
+            user.running += 1
+            user.runs += 1
+            user.waits.append(now - queued_at)
+            self.running += 1
+            future.set_result(None)
+            if user.waiting and user.running < user.waiting[0][4]:
+                heapq.heappush(heads, (user.waiting[0][0], user.waiting[0][1], username))
+
+        if retry_after is not None and self._loop is not None:
+            # A throttled user has work queued: look again once their bucket refills
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = self._loop.call_later(retry_after, self._redispatch)
+
+    def _redispatch(self) -> None:
+        with self.lock:
+            self._timer = None
+            self._dispatch()
+
+    def record_usage(self, message: Any) -> None:
+        """Charge the tokens of an LLM response to the current user. Safe to call from any thread."""
+        username = current_user()
+        tokens = total_tokens(message)
+        if username is None or not tokens:
+            return
+        with self.lock:
+            user = self._user(username)
+            user.refill(time.monotonic())
+            user.tokens += tokens
+            user.bucket -= tokens
+            user.last_finish += tokens / self.run_tokens / user.weight
+
+    def stats(self, username: Optional[str] = None) -> Dict[str, Any]:
+        """Scheduler totals and per-user queues; only `username`'s when given."""
+        with self.lock:
+            return {
+                "running": self.running,
+                "concurrency": self.concurrency,
+                "users": {
+                    name: {
+                        "weight": user.weight,
+                        "queued": len(user.waiting),
+                        "running": user.running,
+                        "runs": user.runs,
+                        "rejected": user.rejected,
+                        "tokens": user.tokens,
+                        "token_bucket": round(user.bucket) if user.capacity else None,
+                        "queue_wait_ms": {
+                            q: 1000 * percentile(user.waits, p) for q, p in (("p50", 0.5), ("p95", 0.95), ("max", 1.0))
+                        },
+                    }
+                    for name, user in self.users.items()
+                    if username is None or name == username
+                },
+            }
+
+
+fair_scheduler = FairScheduler()
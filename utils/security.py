@@ -0,0 +1,201 @@
+"""
+Password hashing and signed session tokens.
+
+Hashing runs on a small bounded thread pool (hashlib.scrypt releases the GIL),
+so a burst of logins can't block the event loop. Session tokens are
+HMAC-signed and stateless; verified tokens are kept in an in-memory LRU so
+authenticated agent calls don't pay for decoding or a DB lookup.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import Depends, Header, HTTPException
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(12 * 60 * 60)))
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+# Comma-separated usernames allowed to use the admin endpoints
+ADMIN_USERS = {name.strip() for name in os.getenv("ADMIN_USERS", "").split(",") if name.strip()}
+# Joins username and chat ID into a thread ID. Chat IDs (and new usernames) can't contain it, so an ID
+# splits only one way, at its last separator, even for older usernames that do
+THREAD_ID_SEPARATOR = "_"
+
+SESSION_SECRET = os.getenv("SESSION_SECRET")
+if not SESSION_SECRET:
+    logger.warning("SESSION_SECRET is not set; using a random per-process secret (tokens won't survive restarts).")
+    SESSION_SECRET = secrets.token_urlsafe(32)
+_secret_key = SESSION_SECRET.encode()
+
+# scrypt cost parameters (~50ms per hash on a typical server core)
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+_HASH_PREFIX = "scrypt"
+
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
+
+# ===========================
+# Password hashing
+# ===========================
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+def hash_password(password: str) -> str:
+    """Hash a password with scrypt, returning a self-describing `scrypt$n$r$p$salt$hash` string."""
+    salt = secrets.token_bytes(16)
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P)
+    return f"{_HASH_PREFIX}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64encode(salt)}${_b64encode(digest)}"
+
+def verify_password(password: str, stored: str) -> bool:
+    """
+    Check a password against a stored hash.
+
+    Rows created before hashing was introduced hold the plaintext; those are
+    compared in constant time and should be rehashed by the caller.
+    """
+    if not is_password_hash(stored):
+        return hmac.compare_digest(password.encode(), stored.encode())
+    try:
+        _, n, r, p, salt, digest = stored.split("$")
+        expected = _b64decode(digest)
+        actual = hashlib.scrypt(
+            password.encode(), salt=_b64decode(salt), n=int(n), r=int(r), p=int(p), dklen=len(expected)
+        )
+    except ValueError:
+        return False
+    return hmac.compare_digest(actual, expected)
+
+def is_password_hash(stored: str) -> bool:
+    return stored.startswith(_HASH_PREFIX + "$")
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_hash_executor, hash_password, password)
+
+async def verify_password_async(password: str, stored: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(_hash_executor, verify_password, password, stored)
+
+
+# ===========================
+# Session tokens
+# ===========================
+
+_session_cache: "OrderedDict[str, Tuple[str, float, float]]" = OrderedDict()  # token -> (username, issued_at, expires_at)
+# username -> tokens issued before this time are invalid, oldest revocation first
+_revoked_before: "OrderedDict[str, float]" = OrderedDict()
+# Tokens of every user issued before this time are invalid; raised when revocations are evicted
+_revoked_all_before = 0.0
+_session_lock = threading.Lock()
+
+def issue_session_token(username: str) -> str:
+    """Issue a signed session token of the form `payload.signature`."""
+    now = time.time()
+    payload = _b64encode(json.dumps({"sub": username, "iat": now, "exp": now + SESSION_TTL_SECONDS}).encode())
+    signature = _b64encode(hmac.new(_secret_key, payload.encode(), hashlib.sha256).digest())
+    return f"{payload}.{signature}"
+
+def _decode_session_token(token: str) -> Optional[Tuple[str, float, float]]:
+    try:
+        payload, signature = token.split(".")
+        expected = _b64encode(hmac.new(_secret_key, payload.encode(), hashlib.sha256).digest())
+        if not hmac.compare_digest(signature, expected):
+            return None
+        claims = json.loads(_b64decode(payload))
+        return str(claims["sub"]), float(claims["iat"]), float(claims["exp"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+def verify_session_token(token: str) -> Optional[str]:
+    """
+    Return the username a token was issued to, or None if it is invalid, expired or revoked.
+    """
+    now = time.time()
+    with _session_lock:
+        entry = _session_cache.get(token)
+        if entry is not None:
+            _session_cache.move_to_end(token)
+    if entry is None:
+        entry = _decode_session_token(token)
+        if entry is None:
+            return None
+        with _session_lock:
+            _session_cache[token] = entry
+            if len(_session_cache) > SESSION_CACHE_SIZE:
+                _session_cache.popitem(last=False)
+
+    username, issued_at, expires_at = entry
+    if expires_at <= now or issued_at < max(_revoked_before.get(username, 0.0), _revoked_all_before):
+        with _session_lock:
+            _session_cache.pop(token, None)
+        return None
+    return username
+
+def revoke_user_sessions(username: str) -> None:
+    """
+    Invalidate every token issued to `username` so far (e.g. after a password change).
+
+    A revocation only matters until the tokens it covers expire, so older ones
+    are dropped. Past SESSION_CACHE_SIZE live revocations the oldest is
+    evicted and its cutoff applied to all users instead, which can log out
+    more users than needed but never revives a revoked token.
+    """
+    global _revoked_all_before
+    now = time.time()
+    with _session_lock:
+        _revoked_before[username] = now
+        _revoked_before.move_to_end(username)
+        while _revoked_before:
+            oldest, revoked_at = next(iter(_revoked_before.items()))
+            if revoked_at > now - SESSION_TTL_SECONDS and len(_revoked_before) <= SESSION_CACHE_SIZE:
+                break
+            del _revoked_before[oldest]
+            if revoked_at > now - SESSION_TTL_SECONDS:
+                _revoked_all_before = max(_revoked_all_before, revoked_at)
+        for token in [t for t, entry in _session_cache.items() if entry[0] == username]:
+            del _session_cache[token]
+
+async def require_session(authorization: Optional[str] = Header(None)) -> str:
+    """FastAPI dependency resolving the `Authorization: Bearer <token>` header to a username."""
+    if not authorization or not authorization.lower().startswith("bearer "):
+        raise HTTPException(status_code=401, detail="Missing bearer token.")
+    username = verify_session_token(authorization[7:].strip())
+    if username is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired session token.")
+    return username
+
+def ensure_session_user(session_user: str, username: str) -> None:
+    """Reject requests acting on behalf of a different user than the token holder."""
+    if session_user != username:
+        raise HTTPException(status_code=403, detail="Session token does not belong to this user.")
+
+def thread_id_for(username: str, chat_id: str) -> str:
+    """Checkpoint thread ID of a user's chat; rejects chat IDs that would make it ambiguous."""
+    if not chat_id or THREAD_ID_SEPARATOR in chat_id:
+        raise HTTPException(status_code=400, detail=f"chat_id must be non-empty and not contain '{THREAD_ID_SEPARATOR}'.")
+    return f"{username}{THREAD_ID_SEPARATOR}{chat_id}"
+
+async def require_admin(session_user: str = Depends(require_session)) -> str:
+    """FastAPI dependency admitting only session users listed in ADMIN_USERS."""
+    if session_user not in ADMIN_USERS:
+        raise HTTPException(status_code=403, detail="Admin access required.")
+    return session_user